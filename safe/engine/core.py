@@ -11,7 +11,8 @@ import logging
 from PyQt4.QtCore import QSettings
 
 from safe.common.exceptions import RadiiException
-from safe.gis.geodesy import Point
+from safe.gis.geodesy import generate_circles, distance
+from safe.gis.numerics import geotransform_to_axes
 from safe.storage.geometry import Polygon
 from safe.storage.projection import Projection
 from safe.storage.projection import DEFAULT_PROJECTION
@@ -294,23 +295,20 @@ def buffer_points(centers, radii, hazard_zone_attribute, data_table=None):
     :return: Vector polygon layer representing circle in WGS84
     :rtype: Vector
     """
-    if not isinstance(radii, list):
-        radii = [radii]
+    radii = _check_radii(radii)
 
-    # Check that radii are monotonically increasing
-    monotonically_increasing_flag = all(
-        x < y for x, y in zip(radii, radii[1:]))
-    if not monotonically_increasing_flag:
-        raise RadiiException(RadiiException.suggestion)
+    # Generate the circles for all centers and radii at once
+    centers = numpy.array(centers, dtype=numpy.float).reshape(-1, 2)
+    rings = generate_circles(
+        centers[:, 1], centers[:, 0], [radius * 1000 for radius in radii])
 
     circles = []
     new_data_table = []
-    for i, center in enumerate(centers):
-        p = Point(longitude=center[0], latitude=center[1])
+    for i in xrange(len(centers)):
         inner_rings = None
-        for radius in radii:
+        for j, radius in enumerate(radii):
             # Generate circle polygon
-            circle = p.generate_circle(radius * 1000)
+            circle = rings[i, j]
             circles.append(Polygon(outer_ring=circle, inner_rings=inner_rings))
 
             # Store current circle and inner ring for next poly
@@ -333,3 +331,147 @@ def buffer_points(centers, radii, hazard_zone_attribute, data_table=None):
         geometry_type='polygon')
 
     return circular_polygon
+
+
+def _check_radii(radii):
+    """Return radii as a list after checking they are increasing.
+
+    :param radii: Radii, either one number or list of numbers
+    :type radii: int, float, list
+
+    :returns: List of radii
+    :rtype: list
+
+    :raises: RadiiException
+    """
+    if not isinstance(radii, list):
+        radii = [radii]
+
+    # Check that radii are monotonically increasing
+    monotonically_increasing_flag = all(
+        x < y for x, y in zip(radii, radii[1:]))
+    if not monotonically_increasing_flag:
+        raise RadiiException(RadiiException.suggestion)
+    return radii
+
+
+def _nearest_distance_bands(centers, radii, latitudes, longitudes):
+    """Classify locations by distance to the nearest center.
+
+    :param centers: Array of centers (longitude, latitude)
+    :type centers: numpy.ndarray
+
+    :param radii: Radii in meters (monotonically ascending)
+    :type radii: numpy.ndarray
+
+    :param latitudes: Latitudes of the locations
+    :type latitudes: numpy.ndarray
+
+    :param longitudes: Longitudes of the locations, broadcastable with
+        latitudes
+    :type longitudes: numpy.ndarray
+
+    :returns: Tuple of arrays (nearest, band). See distance_bands.
+    :rtype: tuple
+    """
+    shape = numpy.broadcast(latitudes, longitudes).shape
+    nearest = numpy.zeros(shape, dtype=numpy.int)
+    nearest_distance = numpy.empty(shape, dtype=numpy.float)
+    nearest_distance.fill(numpy.inf)
+    for i, center in enumerate(centers):
+        d = distance(center[1], center[0], latitudes, longitudes)
+        closer = d < nearest_distance
+        nearest[closer] = i
+        nearest_distance[closer] = d[closer]
+
+    # Band i is the ring (radii[i - 1], radii[i]]
+    band = numpy.searchsorted(radii, nearest_distance, side='left')
+    outside = band == len(radii)
+    band[outside] = -1
+    nearest[outside] = -1
+    return nearest, band
+
+
+def distance_bands(centers, radii, points):
+    """Classify points into radius bands about the nearest center.
+
+    This gives the zones of buffer_points for a purely radial hazard
+    without making polygons or testing points against them. Distances
+    are great circle distances. Where buffers overlap, points belong to
+    the nearest center.
+
+    :param centers: All center of each point (longitude, latitude)
+    :type centers: list
+
+    :param radii: Desired radii in kilometers (must be monotonically
+        ascending). Can be either one number or list of numbers
+    :type radii: int, list
+
+    :param points: Points (longitude, latitude) to classify
+    :type points: numpy.ndarray
+
+    :returns: Tuple of integer arrays (nearest, band) with the index of the
+        nearest center of each point and the index of the smallest radius
+        the point is within. Both are -1 for points beyond the largest
+        radius from all centers.
+    :rtype: tuple
+
+    :raises: RadiiException
+    """
+    radii = _check_radii(radii)
+    radii = numpy.array(radii, dtype=numpy.float) * 1000
+    centers = numpy.array(centers, dtype=numpy.float).reshape(-1, 2)
+    points = numpy.array(points, dtype=numpy.float).reshape(-1, 2)
+
+    nearest = numpy.empty(len(points), dtype=numpy.int)
+    band = numpy.empty(len(points), dtype=numpy.int)
+    block = 2 ** 20
+    for start in xrange(0, len(points), block):
+        end = start + block
+        nearest[start:end], band[start:end] = _nearest_distance_bands(
+            centers, radii, points[start:end, 1], points[start:end, 0])
+    return nearest, band
+
+
+def grid_distance_bands(centers, radii, geotransform, nx, ny):
+    """Classify raster cells into radius bands about the nearest center.
+
+    Like distance_bands, for the centers of the cells of a grid.
+
+    :param centers: All center of each point (longitude, latitude)
+    :type centers: list
+
+    :param radii: Desired radii in kilometers (must be monotonically
+        ascending). Can be either one number or list of numbers
+    :type radii: int, list
+
+    :param geotransform: GDAL geotransform of the grid (6-tuple)
+    :type geotransform: tuple
+
+    :param nx: Number of cells in the w-e direction
+    :type nx: int
+
+    :param ny: Number of cells in the n-s direction
+    :type ny: int
+
+    :returns: Tuple of integer arrays (nearest, band) of size ny x nx
+        where the first row is north. See distance_bands.
+    :rtype: tuple
+
+    :raises: RadiiException
+    """
+    radii = _check_radii(radii)
+    radii = numpy.array(radii, dtype=numpy.float) * 1000
+    centers = numpy.array(centers, dtype=numpy.float).reshape(-1, 2)
+
+    longitudes, latitudes = geotransform_to_axes(geotransform, nx, ny)
+    latitudes = latitudes[::-1]  # First row is north
+
+    nearest = numpy.empty((ny, nx), dtype=numpy.int)
+    band = numpy.empty((ny, nx), dtype=numpy.int)
+    rows = max(1, 2 ** 20 // max(nx, 1))
+    for start in xrange(0, ny, rows):
+        end = start + rows
+        nearest[start:end], band[start:end] = _nearest_distance_bands(
+            centers, radii, latitudes[start:end, None], longitudes[None, :])
+    return nearest, band
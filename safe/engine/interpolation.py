@@ -7,16 +7,16 @@ to another irrespective of layer types.
 
 import numpy
 
-from safe.gis.interpolation2d import interpolate_raster
 from safe.common.utilities import verify
 from safe.utilities.i18n import tr
 from safe.common.utilities import get_non_conflicting_attribute_name
-from safe.gis.numerics import ensure_numeric
+from safe.common.utilities import OrderedDict
+from safe.gis.numerics import ensure_numeric, geotransform_to_axes
 from safe.common.exceptions import InaSAFEError, BoundsError
 from safe.gis.polygon import (
-    inside_polygon,
+    assign_points_to_polygons,
     clip_lines_by_polygons,
-    clip_grid_by_polygons)
+    rasterize_polygons)
 from safe.storage.vector import Vector, convert_polygons_to_centroids
 from safe.storage.raster import Raster
 from safe.storage.utilities import geometry_type_to_string
@@ -28,7 +28,8 @@ def assign_hazard_values_to_exposure_data(
         exposure,
         layer_name=None,
         attribute_name=None,
-        mode='linear'):
+        mode='linear',
+        check_level=None):
     """Assign hazard values to exposure data.
 
     This is the high level wrapper around interpolation functions for
@@ -61,8 +62,15 @@ def assign_hazard_values_to_exposure_data(
         Permissible values are 'linear' (default) which will employ billinear
         interpolation and 'constant' which will employ a piecewise constant
         interpolation. This parameter is passed all the way down to the
-        underlying interpolation function interpolate2d (module
-        common/interpolation2d.py)
+        underlying raster sampler (RasterSampler in module
+        gis/interpolation2d.py). Raster hazard layers keep their sampler
+        (see Raster.get_sampler), so assigning values from the same hazard
+        layer repeatedly does not validate or copy its grid again.
+
+    :param check_level: Level of internal checks of values interpolated
+        from a raster hazard layer, 'off', 'sampled' or 'full'. If None
+        (default), the default level of RasterSampler.sample is used.
+    :type check_level: str
 
     :returns: Layer representing the exposure data with hazard levels assigned.
 
@@ -140,7 +148,8 @@ def assign_hazard_values_to_exposure_data(
             exposure,
             layer_name=layer_name,
             attribute_name=attribute_name,
-            mode=mode
+            mode=mode,
+            check_level=check_level
         )
     # Raster-Raster
     elif hazard.is_raster and exposure.is_raster:
@@ -225,7 +234,7 @@ def check_inputs(hazard, exposure, layer_name, attribute_name):
 # -------------------------------------------------------------
 def interpolate_raster_vector(source, target,
                               layer_name=None, attribute_name=None,
-                              mode='linear'):
+                              mode='linear', check_level=None):
     """Interpolate from raster layer to vector data
 
     Args:
@@ -235,6 +244,9 @@ def interpolate_raster_vector(source, target,
               If None the name of V is used for the returned layer.
         * attribute_name: Name for new attribute.
               If None (default) the name of R is used
+        * mode: 'linear' or 'constant', see interpolate_raster_vector_points
+        * check_level: Level of internal checks of interpolated values,
+              see interpolate_raster_vector_points
 
     Returns:
         I: Vector data set; points located as target with values
@@ -254,7 +266,8 @@ def interpolate_raster_vector(source, target,
             source, target,
             layer_name=layer_name,
             attribute_name=attribute_name,
-            mode=mode)
+            mode=mode,
+            check_level=check_level)
     # elif target.is_line_data:
     # TBA - issue https://github.com/AIFDR/inasafe/issues/36
     #
@@ -264,7 +277,8 @@ def interpolate_raster_vector(source, target,
         R = interpolate_raster_vector_points(source, P,
                                              layer_name=layer_name,
                                              attribute_name=attribute_name,
-                                             mode=mode)
+                                             mode=mode,
+                                             check_level=check_level)
         # In case of polygon data, restore the polygon geometry
         # Do this setting the geometry of the returned set to
         # that of the original polygon
@@ -320,7 +334,7 @@ def interpolate_polygon_vector(source, target,
         # In case of polygon data, restore the polygon geometry
         # Do this setting the geometry of the returned set to
         # that of the original polygon
-        R = Vector(data=P.get_data(),
+        R = Vector(data=P.get_columns(),
                    projection=P.get_projection(),
                    geometry=target.get_geometry(as_geometry_objects=True),
                    name=P.get_name())
@@ -365,28 +379,45 @@ def interpolate_polygon_raster(
     verify(source.is_polygon_data)
     verify(target.is_raster)
 
-    # Run underlying clipping algorithm
     polygon_geometry = source.get_geometry(as_geometry_objects=True)
-
     polygon_attributes = source.get_data()
-    covered_source, covered_target = clip_grid_by_polygons(
-        target.get_data(scaling=False),
-        target.get_geotransform(),
-        polygon_geometry
-    )
+
+    grid_data = target.get_data(scaling=False)
+    geotransform = target.get_geotransform()
+    ny, nx = grid_data.shape
+
+    # Burn polygon ids into grid aligned with target raster
+    polygon_ids = rasterize_polygons(
+        polygon_geometry, geotransform, nx, ny).reshape(-1)
+
+    # Grid cells covered by polygons grouped by polygon in grid order
+    covered = numpy.where(polygon_ids >= 0)[0]
+    covered = covered[numpy.argsort(polygon_ids[covered], kind='mergesort')]
+
+    # Coordinates and values of covered grid cells (first row is north)
+    x, y = geotransform_to_axes(geotransform, nx, ny)
+    points = numpy.zeros((len(covered), 2))
+    points[:, 0] = x[covered % nx]
+    points[:, 1] = y[::-1][covered // nx]
+    values = grid_data.reshape(-1)[covered]
 
     # Create one new point layer with interpolated attributes
     new_geometry = []
     new_attributes = []
-    for i, (geometry, values) in enumerate(covered_source):
-        # For each polygon assign attributes to points that fall inside it
-        for j, geom in enumerate(geometry):
-            attr = polygon_attributes[i].copy()  # Attributes for this polygon
-            attr[attribute_name] = values[j]  # Attribute value from grid cell
-            attr['polygon_id'] = i  # Store id for associated polygon
-            attr['grid_point'] = geom  # Store grid point for associated grid
-            new_attributes.append(attr)
-            new_geometry.append(geom)
+    for k, cell in enumerate(covered):
+        # For each grid point assign attributes of polygon it falls in
+        i = int(polygon_ids[cell])
+        geom = points[k]
+        attr = polygon_attributes[i].copy()  # Attributes for this polygon
+        attr[attribute_name] = values[k]  # Attribute value from grid cell
+        attr['polygon_id'] = i  # Store id for associated polygon
+        attr['grid_point'] = geom  # Store grid point for associated grid
+        new_attributes.append(attr)
+        new_geometry.append(geom)
+
+    # Grid values covered, set to NaN if it's not covered by any polygons
+    covered_target = numpy.array(grid_data, dtype=numpy.float)
+    covered_target.flat[polygon_ids < 0] = numpy.NaN
 
     interpolated_layer = Vector(
         data=new_attributes,
@@ -406,7 +437,8 @@ def interpolate_polygon_raster(
 def interpolate_raster_vector_points(source, target,
                                      layer_name=None,
                                      attribute_name=None,
-                                     mode='linear'):
+                                     mode='linear',
+                                     check_level=None):
     """Interpolate from raster layer to point data
 
     Args:
@@ -418,6 +450,9 @@ def interpolate_raster_vector_points(source, target,
               If None (default) the name of layer source is used
         * mode: 'linear' or 'constant' - determines whether interpolation
               from grid to points should be bilinear or piecewise constant
+        * check_level: Level of internal checks of interpolated values,
+              'off', 'sampled' or 'full'. If None (default), the default
+              level of RasterSampler.sample is used.
 
     Output
         I: Vector data set; points located as target with values
@@ -434,23 +469,19 @@ def interpolate_raster_vector_points(source, target,
     verify(target.is_vector)
     verify(target.is_point_data)
 
-    # Get raster data and corresponding x and y axes
-    A = source.get_data(nan=True)
-    longitudes, latitudes = source.get_geometry()
-    verify(len(longitudes) == A.shape[1])
-    verify(len(latitudes) == A.shape[0])
-
     # Get vector point geometry as Nx2 array
     coordinates = numpy.array(target.get_geometry(),
                               dtype='d',
                               copy=False)
     # Get original attributes
-    attributes = target.get_data()
+    attributes = target.get_columns(copy=True)
 
-    # Create new attribute and interpolate
+    # Create new attribute and interpolate. The sampler for the raster
+    # data is kept by the layer and reused for later interpolations.
     try:
-        values = interpolate_raster(longitudes, latitudes, A,
-                                    coordinates, mode=mode)
+        sampler = source.get_sampler()
+        values = sampler.sample(
+            coordinates, mode=mode, check_level=check_level)
     except (BoundsError, InaSAFEError), e:
         msg = (
             tr(
@@ -463,9 +494,7 @@ def interpolate_raster_vector_points(source, target,
         raise InaSAFEError(msg)
 
     # Add interpolated attribute to existing attributes and return
-    N = len(target)
-    for i in range(N):
-        attributes[i][attribute_name] = values[i]
+    attributes[attribute_name] = values
 
     return Vector(data=attributes,
                   projection=target.get_projection(),
@@ -526,39 +555,30 @@ def interpolate_polygon_points(source, target,
 
     # Extract point features
     points = ensure_numeric(target.get_geometry())
-    attributes = target.get_data()
+    attributes = target.get_columns(copy=True)
     original_geometry = target.get_geometry()  # Geometry for returned data
 
     # Extract polygon features
-    geom = source.get_geometry(as_geometry_objects=True)
-    data = source.get_data()
-    verify(len(geom) == len(data))
-
-    # Augment point features with empty attributes from polygon
-    for a in attributes:
-        # Create all attributes that exist in source
-        for key in attribute_names:
-            safe_key = safe_attribute_name[key]
-            a[safe_key] = None
-
-    # Traverse polygons and assign attributes to points that fall inside
-    for i, polygon in enumerate(geom):
-        # Carry all attributes across from source
-        poly_attr = data[i]
-
-        # Assign default attribute to indicate points inside
-        poly_attr[DEFAULT_ATTRIBUTE] = True
-
-        # Clip data points by polygons and add polygon attributes
-        indices = inside_polygon(points, polygon.outer_ring,
-                                 holes=polygon.inner_rings)
-
-        for k in indices:
-            for key in poly_attr:
-                # Assign attributes from polygon to points
-                safe_key = safe_attribute_name[key]
-                attributes[k][safe_key] = poly_attr[key]
-            attributes[k]['polygon_id'] = i  # Store id for associated polygon
+    geom = source.get_packed_geometry()
+    data = source.get_columns()
+
+    # Assign default attribute to indicate points inside
+    data[DEFAULT_ATTRIBUTE] = numpy.ones(len(source), dtype=numpy.bool)
+
+    # Store id for associated polygon
+    data['polygon_id'] = numpy.arange(len(source), dtype=numpy.int)
+
+    # Find the polygon each point falls in. Where polygons overlap the
+    # attributes of the last one are used.
+    polygon_ids = assign_points_to_polygons(
+        points,
+        geom,
+        first_polygon_wins=False)
+
+    # Carry all attributes across from source to points that fall inside
+    joined = join_columns(data, polygon_ids)
+    for key in attribute_names:
+        attributes[safe_attribute_name[key]] = joined[key]
 
     # Create new Vector instance and return
     V = Vector(data=attributes,
@@ -568,6 +588,41 @@ def interpolate_polygon_points(source, target,
     return V
 
 
+def join_columns(columns, indices):
+    """Look up attribute values of many features by index
+
+    Args:
+        * columns: Dictionary of attribute arrays, e.g. as returned by
+              Vector.get_columns
+        * indices: Array with the row of columns to use for each feature
+              or -1 where there is none (e.g. polygon ids as returned by
+              assign_points_to_polygons)
+
+    Returns:
+        Ordered dictionary with an array for each attribute. Features
+        where indices is -1 get the value None.
+
+    Note:
+        This takes one array indexing operation per attribute rather than
+        copying attributes feature by feature.
+    """
+
+    indices = numpy.asarray(indices)
+    found = indices >= 0
+    all_found = numpy.all(found)
+
+    joined = OrderedDict()
+    for name in columns:
+        values = columns[name]
+        if all_found:
+            joined[name] = values[indices]
+        else:
+            column = numpy.empty(len(indices), dtype=object)
+            column[found] = values[indices[found]]
+            joined[name] = column
+    return joined
+
+
 def interpolate_polygon_lines(source, target,
                               layer_name=None):
     """Interpolate from polygon vector layer to line vector data
@@ -583,7 +638,8 @@ def interpolate_polygon_lines(source, target,
            Attributes are combined from polygon they fall into and
            line that was clipped.
 
-           Lines not in any polygon are ignored.
+           Lines not in any polygon are ignored. Where polygons overlap,
+           line parts get the attributes of the first polygon.
     """
 
     # Extract line features
@@ -603,7 +659,8 @@ def interpolate_polygon_lines(source, target,
     # clipped_attributes = []
 
     # Clip line lines to polygons
-    lines_covered = clip_lines_by_polygons(lines, polygons)
+    lines_covered = clip_lines_by_polygons(lines, polygons,
+                                           first_polygon_wins=True)
 
     # Create one new line data layer with joined attributes
     # from polygons and lines
@@ -673,28 +730,25 @@ def tag_polygons_by_grid(polygons, grid, threshold=0, tag='affected'):
     polygon_attributes = polygons.get_data()
     polygon_geometry = polygons.get_geometry(as_geometry_objects=True)
 
-    # Separate grid points by polygon
-    res, _ = clip_grid_by_polygons(
-        grid.get_data(),
-        grid.get_geotransform(),
-        polygon_geometry)
+    # Burn polygon ids into grid
+    grid_data = grid.get_data()
+    ny, nx = grid_data.shape
+    labels = rasterize_polygons(
+        polygon_geometry, grid.get_geotransform(), nx, ny)
+
+    # Polygons containing any grid value that exceeds the threshold
+    exceeding = labels[(grid_data > threshold) * (labels >= 0)]
+    affected = numpy.bincount(exceeding, minlength=len(polygon_geometry)) > 0
 
     # Create new polygon layer with tag set according to grid values
     # and threshold
     new_attributes = []
-    for i, (_, values) in enumerate(res):
-        # For each polygon check if any grid value in it exceeds the threshold
-        affected = False
-        for val in values:
-            # Check each grid value in this polygon
-            if val > threshold:
-                affected = True
-
+    for i in range(len(polygon_geometry)):
         # Existing attributes for this polygon
         attr = polygon_attributes[i].copy()
 
         # Create tagged polygon feature
-        if affected:
+        if affected[i]:
             attr[tag] = True
         else:
             attr[tag] = False
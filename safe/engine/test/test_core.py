@@ -9,6 +9,7 @@ __copyright__ = 'imajimatika@gmail.com'
 
 
 import unittest
+import numpy
 
 from safe.impact_functions.earthquake.earthquake_building.\
     impact_function import EarthquakeBuildingFunction
@@ -16,7 +17,12 @@ from safe.test.utilities import test_data_path
 from safe.storage.core import read_layer
 from safe.storage.safe_layer import SafeLayer
 
-from safe.engine.core import calculate_impact
+from safe.common.exceptions import RadiiException
+from safe.gis.geodesy import distance
+from safe.engine.core import (
+    calculate_impact,
+    distance_bands,
+    grid_distance_bands)
 
 
 class TestCore(unittest.TestCase):
@@ -35,5 +41,54 @@ class TestCore(unittest.TestCase):
 
         self.assertIsNotNone(impact_layer)
 
+    def test_distance_bands(self):
+        """Test classifying points by distance to the nearest center."""
+        centers = [[110.44, -7.54], [110.60, -7.54]]
+        radii = [3, 5, 10]
+
+        # Points east of the first center at known distances [km]
+        distances = numpy.array([0.0, 2.9, 3.1, 4.9, 9.9, 10.1, 20.0])
+        points = numpy.zeros((len(distances), 2))
+        points[:, 0] = 110.44 - distances / (6372 * numpy.pi / 180)
+        points[:, 1] = -7.54
+        nearest, band = distance_bands(centers, radii, points)
+        self.assertEqual(band.tolist(), [0, 0, 1, 1, 2, -1, -1])
+        self.assertEqual(nearest.tolist(), [0, 0, 0, 0, 0, -1, -1])
+
+        # Points in overlapping zones belong to the nearest center
+        points = [[110.50, -7.54], [110.53, -7.54], [110.59, -7.55]]
+        nearest, band = distance_bands(centers, radii, points)
+        self.assertEqual(nearest.tolist(), [0, 1, 1])
+        d = distance(-7.54, 110.44, -7.54, 110.50) / 1000
+        self.assertEqual(band[0], numpy.searchsorted(radii, d))
+        self.assertEqual(band[2], 0)
+
+        self.assertRaises(
+            RadiiException, distance_bands, centers, [5, 3], points)
+
+    def test_grid_distance_bands(self):
+        """Test classifying grid cells by distance to the nearest center."""
+        centers = [[110.44, -7.54], [110.60, -7.50]]
+        radii = [3, 5, 10]
+        geotransform = (110.30, 0.005, 0, -7.40, 0, -0.004)
+        nx, ny = 90, 70
+        nearest, band = grid_distance_bands(
+            centers, radii, geotransform, nx, ny)
+        self.assertEqual(nearest.shape, (ny, nx))
+
+        # Same as classifying the cell centers as points
+        x = geotransform[0] + (numpy.arange(nx) + 0.5) * geotransform[1]
+        y = geotransform[3] + (numpy.arange(ny) + 0.5) * geotransform[5]
+        points = numpy.zeros((ny * nx, 2))
+        points[:, 0] = numpy.tile(x, ny)
+        points[:, 1] = numpy.repeat(y, nx)
+        expected_nearest, expected_band = distance_bands(
+            centers, radii, points)
+        self.assertEqual(nearest.ravel().tolist(), expected_nearest.tolist())
+        self.assertEqual(band.ravel().tolist(), expected_band.tolist())
+        for i in range(len(radii)):
+            self.assertTrue(numpy.any(band == i))
+        self.assertTrue(numpy.any(band == -1))
+
 if __name__ == '__main__':
     unittest.main()
@@ -12,6 +12,7 @@ from safe.engine.interpolation import (
     interpolate_polygon_raster,
     interpolate_raster_vector_points,
     interpolate_polygon_points,
+    join_columns,
     assign_hazard_values_to_exposure_data,
     tag_polygons_by_grid)
 from safe.impact_functions import register_impact_functions
@@ -959,6 +960,41 @@ class TestEngine(unittest.TestCase):
 
     test_interpolation_from_polygons_one_poly.slow = True
 
+    def test_interpolation_from_polygons_by_column(self):
+        """Polygon attributes are joined to points by polygon id
+        """
+
+        polygons = [numpy.array([[0, 0], [2, 0], [2, 2], [0, 2]]),
+                    numpy.array([[3, 0], [5, 0], [5, 2], [3, 2]])]
+        H = Vector(data={'Category': ['High', 'Low'],
+                         'depth': numpy.array([2.5, 0.5])},
+                   geometry=polygons)
+        points = [[1, 1], [4, 1], [10, 10], [4.5, 0.5]]
+        E = Vector(data={'ID': numpy.arange(4)}, geometry=points)
+
+        I = interpolate_polygon_points(H, E)
+        self.assertEqual(I.get_data('Category').tolist(),
+                         ['High', 'Low', None, 'Low'])
+        self.assertEqual(I.get_data('depth').tolist(),
+                         [2.5, 0.5, None, 0.5])
+        self.assertEqual(I.get_data('polygon_id').tolist(), [0, 1, None, 1])
+        self.assertEqual(I.get_data(DEFAULT_ATTRIBUTE).tolist(),
+                         [True, True, None, True])
+        self.assertEqual(I.get_data('ID').tolist(), range(4))
+
+        # Input layers are left unchanged
+        self.assertEqual(E.get_attribute_names(), ['ID'])
+        self.assertEqual(sorted(H.get_attribute_names()),
+                         ['Category', 'depth'])
+
+        # Columns are looked up by index with None where it is -1
+        joined = join_columns({'x': numpy.array([1.0, 2.0, 3.0])},
+                              numpy.array([2, -1, 0]))
+        self.assertEqual(joined['x'].tolist(), [3.0, None, 1.0])
+        joined = join_columns({'x': numpy.array([1.0, 2.0, 3.0])},
+                              numpy.array([2, 2]))
+        self.assertEqual(joined['x'].dtype, numpy.float)
+
     def test_interpolation_from_polygons_multiple(self):
         """Point interpolation using multiple polygons from Maumere works
 
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Tests for engine.tiling."""
+
+import operator
+import unittest
+import numpy
+
+from safe.common.exceptions import VerificationError
+from safe.common.utilities import unique_filename
+from safe.definitions import inasafe_keyword_version
+from safe.engine.tiling import run_tiled, tile_windows
+from safe.impact_functions.core import population_per_depth
+from safe.storage.core import read_layer
+from safe.storage.projection import DEFAULT_PROJECTION
+from safe.storage.raster import Raster
+
+REDUCTIONS = {
+    'affected': operator.add,
+    'total': operator.add,
+    'no_data': operator.or_}
+
+
+class TestTiling(unittest.TestCase):
+
+    def setUp(self):
+        """Create aligned depth and population grids."""
+        random_state = numpy.random.RandomState(3)
+        self.depths = random_state.uniform(-0.5, 3, (120, 70))
+        self.depths[0, 0] = numpy.nan
+        self.population = random_state.uniform(0, 50, (120, 70))
+        self.population[5, 5] = numpy.nan
+        self.thresholds = [0.3, 0.7, 1.5]
+        geotransform = (106.0, 0.01, 0.0, -6.0, 0.0, -0.01)
+        self.hazard = Raster(
+            self.depths,
+            projection=DEFAULT_PROJECTION,
+            geotransform=geotransform,
+            keywords={
+                'keyword_version': inasafe_keyword_version,
+                'layer_purpose': 'hazard'})
+        self.exposure = Raster(
+            self.population,
+            projection=DEFAULT_PROJECTION,
+            geotransform=geotransform,
+            keywords={
+                'keyword_version': inasafe_keyword_version,
+                'layer_purpose': 'exposure'})
+        self.expected_impact, self.expected_results = population_per_depth(
+            self.depths, self.population, self.thresholds)
+
+    def check_results(self, impact, results):
+        """Check the tiled impact and results against a single tile."""
+        self.assertTrue(numpy.allclose(
+            impact, self.expected_impact, equal_nan=True))
+        self.assertTrue(numpy.allclose(
+            results['affected'], self.expected_results['affected']))
+        self.assertAlmostEqual(
+            results['total'], self.expected_results['total'])
+        self.assertTrue(results['no_data'])
+
+    def test_tile_windows(self):
+        """Grids are split in tiles covering them."""
+        windows = tile_windows(5, 3, (2, 2))
+        self.assertEqual(windows, [
+            (0, 0, 2, 2), (2, 0, 1, 2),
+            (0, 2, 2, 2), (2, 2, 1, 2),
+            (0, 4, 2, 1), (2, 4, 1, 1)])
+        self.assertEqual(tile_windows(5, 3), [(0, 0, 3, 5)])
+
+    def test_run_tiled(self):
+        """Tiles computed one by one give the result of the whole grid."""
+        for tile_size in [None, (70, 7), (30, 50)]:
+            impact, results = run_tiled(
+                population_per_depth,
+                self.hazard,
+                self.exposure,
+                REDUCTIONS,
+                args=(self.thresholds,),
+                tile_size=tile_size,
+                processes=1)
+            self.check_results(impact, results)
+
+    def test_run_tiled_processes(self):
+        """Tiles can be computed in worker processes and written to file."""
+        hazard_file = unique_filename(suffix='.tif')
+        exposure_file = unique_filename(suffix='.tif')
+        self.hazard.write_to_file(hazard_file)
+        self.exposure.write_to_file(exposure_file)
+        hazard = read_layer(hazard_file)
+        exposure = read_layer(exposure_file)
+
+        impact, results = run_tiled(
+            population_per_depth,
+            hazard,
+            exposure,
+            REDUCTIONS,
+            args=(self.thresholds,),
+            tile_size=(70, 13),
+            processes=3)
+        self.check_results(impact, results)
+
+        impact_file = unique_filename(suffix='.tif')
+        impact, results = run_tiled(
+            population_per_depth,
+            hazard,
+            exposure,
+            REDUCTIONS,
+            args=(self.thresholds,),
+            filename=impact_file,
+            tile_size=(70, 13),
+            processes=3)
+        self.check_results(impact.get_data(), results)
+        self.assertEqual(impact.filename, impact_file)
+
+    def test_run_tiled_not_aligned(self):
+        """Grids must be aligned."""
+        exposure = Raster(
+            self.population[:100],
+            projection=DEFAULT_PROJECTION,
+            geotransform=self.exposure.get_geotransform())
+        with self.assertRaises(VerificationError):
+            run_tiled(
+                population_per_depth,
+                self.hazard,
+                exposure,
+                REDUCTIONS,
+                args=(self.thresholds,))
+
+
+if __name__ == '__main__':
+    unittest.main()
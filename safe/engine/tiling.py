@@ -0,0 +1,263 @@
+# coding=utf-8
+"""Tiled execution of per cell computations on aligned raster layers.
+
+Provides the function run_tiled()
+"""
+
+import os
+import logging
+import multiprocessing
+
+import numpy
+from osgeo import gdal
+
+from safe.common.exceptions import WriteLayerError
+from safe.common.utilities import verify
+from safe.storage.core import read_layer
+from safe.storage.raster import Raster
+from safe.utilities.unicode import get_string
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# Number of pixels in one tile
+TILE_PIXELS = 2 ** 22
+
+# Hazard and exposure layers opened by each worker process
+_WORKER_STATE = {}
+
+
+def tile_windows(rows, columns, tile_size=None):
+    """Split a grid into tiles.
+
+    :param rows: Number of rows of the grid.
+    :type rows: int
+
+    :param columns: Number of columns of the grid.
+    :type columns: int
+
+    :param tile_size: Optional (columns, rows) of each tile. Default is
+        strips of full rows holding around TILE_PIXELS pixels.
+    :type tile_size: tuple
+
+    :returns: Windows (xoff, yoff, xsize, ysize) in pixels following the
+        GDAL convention.
+    :rtype: list
+    """
+    if tile_size is None:
+        tile_size = (columns, max(1, TILE_PIXELS // max(1, columns)))
+    tile_columns, tile_rows = tile_size
+
+    windows = []
+    for yoff in xrange(0, rows, tile_rows):
+        ysize = min(tile_rows, rows - yoff)
+        for xoff in xrange(0, columns, tile_columns):
+            xsize = min(tile_columns, columns - xoff)
+            windows.append((xoff, yoff, xsize, ysize))
+    return windows
+
+
+def _run_tile(kernel, hazard, exposure, window, args, scaling):
+    """Run a kernel on one tile of the hazard and exposure layers.
+
+    :returns: The window, the impact tile and the results of the kernel.
+    :rtype: tuple
+    """
+    hazard_scaling, exposure_scaling = scaling
+    hazard_data = hazard.get_data(
+        nan=True, scaling=hazard_scaling, window=window)
+    exposure_data = exposure.get_data(
+        nan=True, scaling=exposure_scaling, window=window)
+    impact, results = kernel(hazard_data, exposure_data, *args)
+    return window, impact, results
+
+
+def _init_worker(kernel, hazard, exposure, args, scaling):
+    """Open the hazard and exposure layers once in each worker process.
+
+    The layers are given as (filename, dtype) pairs.
+    """
+    _WORKER_STATE['kernel'] = kernel
+    _WORKER_STATE['hazard'] = read_layer(
+        hazard[0], lazy=True, dtype=hazard[1])
+    _WORKER_STATE['exposure'] = read_layer(
+        exposure[0], lazy=True, dtype=exposure[1])
+    _WORKER_STATE['args'] = args
+    _WORKER_STATE['scaling'] = scaling
+
+
+def _run_worker_tile(window):
+    """Run the kernel of the worker process on one tile."""
+    return _run_tile(
+        _WORKER_STATE['kernel'],
+        _WORKER_STATE['hazard'],
+        _WORKER_STATE['exposure'],
+        window,
+        _WORKER_STATE['args'],
+        _WORKER_STATE['scaling'])
+
+
+def cpu_processes():
+    """Get the number of worker processes using all the CPUs.
+
+    :returns: The number of CPUs, or 1 on Windows where worker processes
+        would start a new QGIS rather than a Python interpreter.
+    :rtype: int
+    """
+    if os.name == 'nt':
+        return 1
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def run_tiled(
+        kernel,
+        hazard,
+        exposure,
+        reductions,
+        args=(),
+        hazard_scaling=None,
+        exposure_scaling=True,
+        filename=None,
+        tile_size=None,
+        processes=1):
+    """Run a per cell computation tile by tile on aligned raster layers.
+
+    The kernel is called as kernel(hazard_data, exposure_data, *args) for
+    each tile and must return the impact tile, an array with the shape of
+    the tile, and a dictionary of results for the tile e.g. counts. The
+    results of all tiles are combined with the reductions.
+
+    By default the tiles are computed one after the other in the calling
+    process. Forking worker processes from within QGIS is not safe, so a
+    pool is only used when more processes are asked for, e.g. by headless
+    or command line runs, both layers are read from files and there is
+    more than one tile. Each worker reads its windows straight from the
+    files, so the kernel must be a module level function and its arguments
+    must be picklable.
+
+    :param kernel: The per cell computation.
+    :type kernel: function
+
+    :param hazard: The hazard layer.
+    :type hazard: Raster
+
+    :param exposure: The exposure layer, aligned with the hazard layer.
+    :type exposure: Raster
+
+    :param reductions: Function combining two results of tiles for each key
+        of the results e.g. {'count': operator.add}.
+    :type reductions: dict
+
+    :param args: Extra arguments of the kernel.
+    :type args: tuple
+
+    :param hazard_scaling: Scaling of the hazard data, see Raster.get_data.
+    :type hazard_scaling: bool, None, float
+
+    :param exposure_scaling: Scaling of the exposure data, see
+        Raster.get_data.
+    :type exposure_scaling: bool, None, float
+
+    :param filename: Optional name of a GeoTIFF the impact tiles are
+        written to. If None the impact grid is created with
+        exposure.create_array so it follows the memory mapping of the
+        exposure layer. The impact functions do not use this, see
+        ContinuousRHContinuousRE.run_tiled, it is meant for scripts
+        writing the impact straight to disk.
+    :type filename: str
+
+    :param tile_size: Optional (columns, rows) of each tile, see
+        tile_windows.
+    :type tile_size: tuple
+
+    :param processes: Number of worker processes. Default is 1 which
+        computes the tiles in the calling process, 0 uses all the CPUs,
+        see cpu_processes.
+    :type processes: int
+
+    :returns: The impact, either as an array or as a lazy Raster read from
+        filename, and the reduced results.
+    :rtype: (numpy.ndarray, dict), (Raster, dict)
+
+    :raises: VerificationError if the layers are not aligned,
+        WriteLayerError if the GeoTIFF can not be created.
+    """
+    verify(
+        hazard.rows == exposure.rows and hazard.columns == exposure.columns,
+        'Hazard [%i x %i] and exposure [%i x %i] grids must be aligned' % (
+            hazard.rows, hazard.columns, exposure.rows, exposure.columns))
+    verify(
+        numpy.allclose(
+            hazard.get_geotransform(), exposure.get_geotransform()),
+        'Hazard and exposure grids must have the same geotransform')
+
+    if processes == 0:
+        processes = cpu_processes()
+    windows = tile_windows(hazard.rows, hazard.columns, tile_size)
+    scaling = (hazard_scaling, exposure_scaling)
+
+    if filename is None:
+        impact = exposure.create_array()
+        band = None
+    else:
+        driver = gdal.GetDriverByName('GTiff')
+        dataset = driver.Create(
+            get_string(filename), hazard.columns, hazard.rows, 1,
+            gdal.GDT_Float64)
+        if dataset is None:
+            message = 'Gdal could not create filename %s' % filename
+            raise WriteLayerError(message)
+        dataset.SetProjection(str(hazard.get_projection()))
+        dataset.SetGeoTransform(hazard.get_geotransform())
+        band = dataset.GetRasterBand(1)
+        band.SetNoDataValue(hazard.get_nodata_value())
+
+    pool = None
+    if (processes > 1 and len(windows) > 1 and
+            hazard.filename is not None and exposure.filename is not None):
+        pool = multiprocessing.Pool(
+            min(processes, len(windows)),
+            _init_worker,
+            (kernel,
+             (hazard.filename, hazard.dtype),
+             (exposure.filename, exposure.dtype),
+             args,
+             scaling))
+        tiles = pool.imap_unordered(_run_worker_tile, windows)
+    else:
+        tiles = (
+            _run_tile(kernel, hazard, exposure, window, args, scaling)
+            for window in windows)
+
+    reduced_results = {}
+    try:
+        for window, impact_tile, results in tiles:
+            xoff, yoff, xsize, ysize = window
+            if band is None:
+                impact[yoff:yoff + ysize, xoff:xoff + xsize] = impact_tile
+            else:
+                band.WriteArray(impact_tile, xoff, yoff)
+
+            for key, value in results.items():
+                if key in reduced_results:
+                    value = reductions[key](reduced_results[key], value)
+                reduced_results[key] = value
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if band is not None:
+        band = None
+        dataset = None  # Close
+        impact = Raster(filename, lazy=True)
+
+    LOGGER.debug(
+        'Ran %s on %i tiles with %i processes' % (
+            kernel.__name__, len(windows), processes if pool else 1))
+    return impact, reduced_results
@@ -145,3 +145,59 @@ def polygonize_thresholds(
         inside_layer_name,
         outside_shape_file,
         outside_layer_name)
+
+
+def warp_raster(
+        raster_file_name,
+        extent,
+        cell_size=None,
+        output_file_name='',
+        output_format='MEM'):
+    """Clip, resample and reproject a raster to EPSG:4326 in process.
+
+    The raster is clipped to the output bounds with nearest neighbour
+    resampling and keeps its data type. No cutline is applied: for a
+    rectangular extent in EPSG:4326 the output bounds select the same
+    pixels as gdalwarp -cutline -crop_to_cutline with that rectangle.
+
+    Only the MEM format stays in memory. Other formats are written to
+    output_file_name; a VRT output is a small file describing the warp
+    which refers to the source raster, and its pixels are warped from the
+    source each time they are read.
+
+    :param raster_file_name: Raster file name
+    :type raster_file_name: str
+
+    :param extent: Output extent in EPSG:4326 in the form
+        [xmin, ymin, xmax, ymax].
+    :type extent: list
+
+    :param cell_size: Output cell size in degrees. If None, GDAL chooses the
+        cell size closest to the native resolution.
+    :type cell_size: float
+
+    :param output_file_name: Output file name. Not needed for MEM.
+    :type output_file_name: str
+
+    :param output_format: GDAL driver of the output, e.g. 'MEM', 'VRT' or
+        'GTiff'.
+    :type output_format: str
+
+    :returns: Output dataset or None if the GDAL bindings do not provide
+        gdal.Warp (GDAL < 2.1).
+    :rtype: gdal.Dataset
+    """
+    if not hasattr(gdal, 'Warp'):
+        return None
+
+    options = {
+        'format': output_format,
+        'dstSRS': 'EPSG:4326',
+        'outputBounds': list(extent),
+        'resampleAlg': 'near'}
+    if cell_size is not None:
+        options['xRes'] = cell_size
+        options['yRes'] = cell_size
+
+    LOGGER.debug('Warping %s to %s' % (raster_file_name, options))
+    return gdal.Warp(output_file_name, raster_file_name, **options)
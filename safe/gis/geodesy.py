@@ -209,54 +209,138 @@ class Point(object):
             the distance in meters will be greater than the specified radius
             in the north south direction.
         """
+        return generate_circles(
+            [self.latitude], [self.longitude], [radius], resolution)[0, 0]
 
-        # Find first point in circle to the east of the center by bisecting
-        # until desired radius is achieved
 
-        # Go north until distance is greater than desired
-        step = 0.001
-        d = 0
-        while d < radius:
-            stepmin = step
-            step *= 2
-            p = Point(self.latitude + step, self.longitude)
-            d = self.distance_to(p)
+def distance(latitude1, longitude1, latitude2, longitude2):
+    """Great circle distance between arrays of points.
 
-        # Then bisect until the correct distance is found in degrees
-        stepmax = step
-        while not numpy.allclose(d, radius, rtol=1.0e-6):
-            step = (stepmax + stepmin) / 2
-            p = Point(self.latitude + step, self.longitude)
-            d = self.distance_to(p)
+    :param latitude1: Latitudes of the first points in decimal degrees.
+    :type latitude1: numpy.ndarray, float
 
-            if d > radius:
-                stepmax = step
-            else:
-                stepmin = step
+    :param longitude1: Longitudes of the first points in decimal degrees.
+    :type longitude1: numpy.ndarray, float
 
-        # print
-        # print ('Found geographical distance %f degrees yielding radius %f m'
-        #       % (step, d))
-        r = step
+    :param latitude2: Latitudes of the second points in decimal degrees.
+    :type latitude2: numpy.ndarray, float
 
-        # Generate circle with geographic radius = step (degrees)
-        P = [[p.longitude, p.latitude]]
+    :param longitude2: Longitudes of the second points in decimal degrees.
+    :type longitude2: numpy.ndarray, float
 
-        angle = 0
-        while angle < 360:
-            theta = angle * self.degrees2radians
-            # print angle, theta, self.bearing_to(p), self.distance_to(p)
+    :returns: Distances [m] broadcast over the input arrays.
+    :rtype: numpy.ndarray
+    """
+    lat1 = numpy.radians(latitude1)
+    lat2 = numpy.radians(latitude2)
+    dlat = lat2 - lat1
+    dlon = numpy.radians(numpy.subtract(longitude2, longitude1))
+
+    # Haversine formula, which is well conditioned for short distances
+    h = (numpy.sin(dlat / 2) ** 2 +
+         numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin(dlon / 2) ** 2)
+    return 2 * Point.R * numpy.arcsin(numpy.sqrt(numpy.clip(h, 0, 1)))
+
+
+def bearing(latitude1, longitude1, latitude2, longitude2):
+    """Initial bearing from arrays of points to other points.
+
+    :param latitude1: Latitudes of the first points in decimal degrees.
+    :type latitude1: numpy.ndarray, float
+
+    :param longitude1: Longitudes of the first points in decimal degrees.
+    :type longitude1: numpy.ndarray, float
+
+    :param latitude2: Latitudes of the second points in decimal degrees.
+    :type latitude2: numpy.ndarray, float
+
+    :param longitude2: Longitudes of the second points in decimal degrees.
+    :type longitude2: numpy.ndarray, float
+
+    :returns: Bearings in degrees clockwise from north in [0, 360).
+    :rtype: numpy.ndarray
+    """
+    lat1 = numpy.radians(latitude1)
+    lat2 = numpy.radians(latitude2)
+    dlon = numpy.radians(numpy.subtract(longitude2, longitude1))
+
+    y = numpy.sin(dlon) * numpy.cos(lat2)
+    x = (numpy.cos(lat1) * numpy.sin(lat2) -
+         numpy.sin(lat1) * numpy.cos(lat2) * numpy.cos(dlon))
+    return numpy.mod(numpy.degrees(numpy.arctan2(y, x)), 360)
+
+
+def destination(latitude, longitude, bearing_, distance_):
+    """Points reached from arrays of points along great circles.
 
-            # Generate new point on circle
-            lat = self.latitude + r * cos(theta)
-            lon = self.longitude + r * sin(theta)
+    :param latitude: Latitudes of the start points in decimal degrees.
+    :type latitude: numpy.ndarray, float
 
-            p = Point(latitude=lat, longitude=lon)
-            angle += resolution
+    :param longitude: Longitudes of the start points in decimal degrees.
+    :type longitude: numpy.ndarray, float
 
-            P.append([p.longitude, p.latitude])
+    :param bearing_: Initial bearings in degrees clockwise from north.
+    :type bearing_: numpy.ndarray, float
 
-        # Close polygon
-        P.append(P[0])
+    :param distance_: Distances [m] to travel.
+    :type distance_: numpy.ndarray, float
 
-        return numpy.array(P)
+    :returns: Latitudes and longitudes of the destinations in decimal
+        degrees, broadcast over the input arrays. Longitudes are in
+        [-180, 180).
+    :rtype: tuple
+    """
+    lat1 = numpy.radians(latitude)
+    lon1 = numpy.radians(longitude)
+    theta = numpy.radians(bearing_)
+    delta = numpy.divide(distance_, float(Point.R))
+
+    sinlat = (numpy.sin(lat1) * numpy.cos(delta) +
+              numpy.cos(lat1) * numpy.sin(delta) * numpy.cos(theta))
+    lat2 = numpy.arcsin(numpy.clip(sinlat, -1, 1))
+    lon2 = lon1 + numpy.arctan2(
+        numpy.sin(theta) * numpy.sin(delta) * numpy.cos(lat1),
+        numpy.cos(delta) - numpy.sin(lat1) * sinlat)
+
+    longitude2 = numpy.mod(numpy.degrees(lon2) + 180, 360) - 180
+    return numpy.degrees(lat2), longitude2
+
+
+def generate_circles(latitudes, longitudes, radii, resolution=1):
+    """Make circles with all radii about all centres in one call.
+
+    Like Point.generate_circle the circles are defined in geographic
+    coordinates: the radius in degrees is the great circle angle of the
+    radius along a meridian.
+
+    :param latitudes: Latitudes of the centres in decimal degrees.
+    :type latitudes: list, numpy.ndarray
+
+    :param longitudes: Longitudes of the centres in decimal degrees.
+    :type longitudes: list, numpy.ndarray
+
+    :param radii: The desired circle radii [m].
+    :type radii: list, numpy.ndarray
+
+    :param resolution: Radial distance (degrees) between points on the
+        circles. Default is 1 making each circle consist of 360 points.
+    :type resolution: int, float
+
+    :returns: Closed rings of lon, lat coordinates with shape
+        (number of centres, number of radii, number of points, 2).
+    :rtype: numpy.ndarray
+    """
+    latitudes = numpy.asarray(latitudes, dtype=numpy.float)
+    longitudes = numpy.asarray(longitudes, dtype=numpy.float)
+    r = numpy.degrees(numpy.asarray(radii, dtype=numpy.float) / Point.R)
+
+    theta = numpy.radians(numpy.arange(0, 360, resolution, dtype=numpy.float))
+    theta = numpy.append(theta, 0)  # Close polygon
+
+    circles = numpy.empty(
+        (len(latitudes), len(r), len(theta), 2), dtype=numpy.float)
+    circles[..., 0] = (longitudes[:, None, None] +
+                       r[None, :, None] * numpy.sin(theta))
+    circles[..., 1] = (latitudes[:, None, None] +
+                       r[None, :, None] * numpy.cos(theta))
+    return circles
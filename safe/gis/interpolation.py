@@ -10,6 +10,18 @@ import numpy
 
 from safe.common.exceptions import BoundsError, InaSAFEError
 
+# Levels of internal checks of interpolated values:
+#   'off':     No checks
+#   'sampled': Values must lie between the grid values they were
+#              interpolated from. This costs O(points).
+#   'full':    As 'sampled' and values must not exceed the maximum of the
+#              entire grid. This scans the entire grid on every call.
+CHECK_LEVELS = ['off', 'sampled', 'full']
+
+# Check level used by interpolate1d, interpolate2d and RasterSampler when
+# none is given
+DEFAULT_CHECK_LEVEL = 'sampled'
+
 
 def validate_mode(mode):
     """Validate that the mode is an allowable value.
@@ -31,6 +43,103 @@ def validate_mode(mode):
         raise InaSAFEError(msg)
 
 
+def validate_check_level(check_level):
+    """Validate check level and substitute the default if it is None.
+
+    :param check_level: Level of internal checks of interpolated values.
+        One of CHECK_LEVELS or None to use DEFAULT_CHECK_LEVEL.
+    :type check_level: str
+
+    :returns: The check level to use
+    :rtype: str
+
+    :raises: InaSAFEError
+    """
+
+    if check_level is None:
+        check_level = DEFAULT_CHECK_LEVEL
+
+    if check_level not in CHECK_LEVELS:
+        msg = ('Check level must be one of %s. I got "%s"'
+               % (', '.join(CHECK_LEVELS), check_level))
+        raise InaSAFEError(msg)
+
+    return check_level
+
+
+def check_interpolated_values(values, neighbours, exception=InaSAFEError):
+    """Check that interpolated values lie between the grid values used.
+
+    This is the check done at level 'sampled' (see CHECK_LEVELS).
+
+    :param values: Interpolated values
+    :type values: numpy.ndarray
+
+    :param neighbours: Arrays with the grid values each value was
+        interpolated from, e.g. the four nearest neighbours
+    :type neighbours: list
+
+    :param exception: Class of the exception raised if the check fails.
+    :type exception: type
+
+    :raises: InaSAFEError or exception
+
+    ..note::
+        NaN values are ignored. Values may exceed their neighbours by
+        rounding errors relative to the magnitude of the neighbours.
+    """
+
+    if len(values) == 0:
+        return
+
+    upper = neighbours[0]
+    lower = neighbours[0]
+    for neighbour in neighbours[1:]:
+        upper = numpy.fmax(upper, neighbour)
+        lower = numpy.fmin(lower, neighbour)
+    tolerance = 1.0e-12 * numpy.fmax(numpy.abs(upper), numpy.abs(lower))
+
+    old_set = numpy.seterr(invalid='ignore')  # Suppress warnings for NaN
+    outside = (values > upper + tolerance) + (values < lower - tolerance)
+    numpy.seterr(**old_set)  # Restore
+
+    if numpy.any(outside):
+        i = numpy.flatnonzero(outside)[0]
+        msg = ('Internal check failed. Interpolated value %.15f is not '
+               'between the grid values %.15f and %.15f it was interpolated '
+               'from' % (values[i], lower[i], upper[i]))
+        raise exception(msg)
+
+
+def check_grid_maximum(values, z, exception=InaSAFEError):
+    """Check that interpolated values do not exceed the maximum grid value.
+
+    This is the additional check done at level 'full' (see CHECK_LEVELS).
+    It scans the entire grid.
+
+    :param values: Interpolated values
+    :type values: numpy.ndarray
+
+    :param z: Grid values
+    :type z: numpy.ndarray
+
+    :param exception: Class of the exception raised if the check fails.
+    :type exception: type
+
+    :raises: InaSAFEError or exception
+    """
+
+    if len(values) > 0:
+        mz_interpolate = numpy.nanmax(values)
+        mz = numpy.nanmax(z)
+        # noinspection PyStringFormat
+        msg = ('Internal check failed. Max interpolated value %.15f '
+               'exceeds max grid value %.15f ' % (mz_interpolate, mz))
+        if not(numpy.isnan(mz_interpolate) or numpy.isnan(mz)):
+            if not mz_interpolate <= mz:
+                raise exception(msg)
+
+
 def validate_coordinate_vector(coordinates, coordinate_name):
     """Validate that the coordinates vector are valid
 
@@ -66,6 +175,42 @@ def validate_coordinate_vector(coordinates, coordinate_name):
     return coordinates
 
 
+def validate_bounds(coordinates, points, point_name, coordinate_name):
+    """Validate that interpolation points are inside the domain
+
+    :param coordinates: Increasing coordinates vector of the domain
+    :type coordinates: numpy.ndarray
+
+    :param points: Coordinates of interpolation points along the same axis
+    :type points: numpy.ndarray
+
+    :param point_name: The user recognizable name of the point coordinates.
+    :type point_name: str
+
+    :param coordinate_name: The user recognizable name of the coordinates.
+    :type coordinate_name: str
+
+    :raises: BoundsError
+    """
+
+    point_min = min(points)
+    point_max = max(points)
+
+    if point_min < coordinates[0]:
+        msg = (
+            'Interpolation point %s=%f was less than the smallest '
+            'value in domain (%s=%f) and bounds_error was requested.'
+            % (point_name, point_min, coordinate_name, coordinates[0]))
+        raise BoundsError(msg)
+
+    if point_max > coordinates[-1]:
+        msg = (
+            'Interpolation point %s=%f was greater than the largest '
+            'value in domain (%s=%f) and bounds_error was requested.'
+            % (point_name, point_max, coordinate_name, coordinates[-1]))
+        raise BoundsError(msg)
+
+
 def validate_inputs(
         x=None, y=None, z=None, points=None, bounds_error=None):
     """Check inputs for interpolate1d and interpolate2d functions
@@ -145,41 +290,10 @@ def validate_inputs(
         eta = points[:, 1]
 
     if bounds_error:
-        xi0 = min(xi)
-        xi1 = max(xi)
-
-        if xi0 < x[0]:
-            msg = (
-                'Interpolation point xi=%f was less than the smallest '
-                'value in domain (x=%f) and bounds_error was requested.'
-                % (xi0, x[0]))
-            raise BoundsError(msg)
-
-        if xi1 > x[-1]:
-            msg = (
-                'Interpolation point xi=%f was greater than the largest '
-                'value in domain (x=%f) and bounds_error was requested.'
-                % (xi1, x[-1]))
-            raise BoundsError(msg)
-
+        validate_bounds(x, xi, 'xi', 'x')
         if dimensions == 2:
             # noinspection PyUnboundLocalVariable
-            eta0 = min(eta)
-            eta1 = max(eta)
-
-            if eta0 < y[0]:
-                msg = (
-                    'Interpolation point eta=%f was less than the smallest '
-                    'value in domain (y=%f) and bounds_error was requested.'
-                    % (eta0, y[0]))
-                raise BoundsError(msg)
-
-            if eta1 > y[-1]:
-                msg = (
-                    'Interpolation point eta=%f was greater than the largest '
-                    'value in domain (y=%f) and bounds_error was requested.'
-                    % (eta1, y[-1]))
-                raise BoundsError(msg)
+            validate_bounds(y, eta, 'eta', 'y')
 
     # TODO this is problematic as pylint can't see how many args to expect back
     if dimensions == 1:
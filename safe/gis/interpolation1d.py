@@ -15,12 +15,18 @@ See interpolation2d.py for documentation of the mathematical derivation used.
 
 import numpy
 
-from safe.gis.interpolation import validate_inputs, validate_mode
+from safe.gis.interpolation import (
+    validate_inputs,
+    validate_mode,
+    validate_check_level,
+    check_interpolated_values,
+    check_grid_maximum)
 # pylint: disable=W0105
 
 
 # noinspection PyArgumentEqualDefault,PyTypeChecker
-def interpolate1d(x, z, points, mode='linear', bounds_error=False):
+def interpolate1d(x, z, points, mode='linear', bounds_error=False,
+                  check_level=None):
     """Fundamental 1D interpolation routine.
 
     :param x: 1D array of x-coordinates on which to interpolate
@@ -46,10 +52,15 @@ def interpolate1d(x, z, points, mode='linear', bounds_error=False):
         input data. If False, nan is returned for those values.
     :type bounds_error: bool
 
+    :param check_level: Level of internal checks of interpolated values,
+        'off', 'sampled' or 'full'. If None (default), the level
+        DEFAULT_CHECK_LEVEL of module interpolation.py is used.
+    :type check_level: str
+
     :returns: 1D array with same length as points with interpolated values
     :rtype: numpy.ndarry
 
-    :raises: RuntimeError
+    :raises: RuntimeError, InaSAFEError
 
     ..note::
         Input coordinates x are assumed to be monotonically increasing,
@@ -60,6 +71,7 @@ def interpolate1d(x, z, points, mode='linear', bounds_error=False):
 
     # Input checks
     validate_mode(mode)
+    check_level = validate_check_level(check_level)
     # pylint: disable=unbalanced-tuple-unpacking
     x, z, xi = validate_inputs(
         x=x, z=z, points=points, bounds_error=bounds_error)
@@ -77,8 +89,8 @@ def interpolate1d(x, z, points, mode='linear', bounds_error=False):
     # Internal check (index == 0 is OK)
     msg = ('Interpolation point outside domain. This should never happen. '
            'Please email Ole.Moller.Nielsen@gmail.com')
-    if len(idx) > 0:
-        if not max(idx) < len(x):
+    if check_level != 'off' and len(idx) > 0:
+        if not numpy.max(idx) < len(x):
             raise RuntimeError(msg)
 
     # Get the two neighbours for each interpolation point
@@ -102,21 +114,16 @@ def interpolate1d(x, z, points, mode='linear', bounds_error=False):
         left = alpha < 0.5
 
         # Initialise result array with all elements set to right neighbour
-        zeta = z1
+        zeta = z1.copy()
 
         # Then set the left neigbours
         zeta[left] = z0[left]
 
     # Self test
-    if len(zeta) > 0:
-        mzeta = numpy.nanmax(zeta)
-        mz = numpy.nanmax(z)
-        # noinspection PyStringFormat
-        msg = ('Internal check failed. Max interpolated value %.15f '
-               'exceeds max grid value %.15f ' % (mzeta, mz))
-        if not(numpy.isnan(mzeta) or numpy.isnan(mz)):
-            if not mzeta <= mz:
-                raise RuntimeError(msg)
+    if check_level != 'off':
+        check_interpolated_values(zeta, [z0, z1], exception=RuntimeError)
+    if check_level == 'full':
+        check_grid_maximum(zeta, z, exception=RuntimeError)
 
     # Populate result with interpolated values for points inside domain
     # and NaN for values outside
@@ -24,15 +24,26 @@ import logging
 import numpy
 
 from safe.common.exceptions import InaSAFEError
-from safe.gis.interpolation import validate_inputs, validate_mode
+from safe.gis.interpolation import (
+    validate_inputs,
+    validate_mode,
+    validate_coordinate_vector,
+    validate_bounds,
+    validate_check_level,
+    check_interpolated_values,
+    check_grid_maximum)
 
 
 LOGGER = logging.getLogger('InaSAFE')
+
+# Number of points interpolated at a time by RasterSampler
+SAMPLE_CHUNK_SIZE = 2 ** 16
 # pylint: disable=W0105
 
 
 # noinspection PyArgumentEqualDefault,PyTypeChecker
-def interpolate2d(x, y, z, points, mode='linear', bounds_error=False):
+def interpolate2d(x, y, z, points, mode='linear', bounds_error=False,
+                  check_level=None):
     """Fundamental 2D interpolation routine
 
     :param x: 1D array of x-coordinates of the mesh on which to interpolate
@@ -63,6 +74,11 @@ def interpolate2d(x, y, z, points, mode='linear', bounds_error=False):
           is returned for those values
     :type bounds_error: bool
 
+    :param check_level: Level of internal checks of interpolated values,
+        'off', 'sampled' or 'full'. If None (default), the level
+        DEFAULT_CHECK_LEVEL of module interpolation.py is used.
+    :type check_level: str
+
     :returns: 1D array with same length as points with interpolated values
 
     :raises: Exception, BoundsError (see note about bounds_error)
@@ -85,6 +101,7 @@ def interpolate2d(x, y, z, points, mode='linear', bounds_error=False):
 
     # Input checks
     validate_mode(mode)
+    check_level = validate_check_level(check_level)
     # pylint: disable=unbalanced-tuple-unpacking
     x, y, z, xi, eta = validate_inputs(
         x=x, y=y, z=z, points=points, bounds_error=bounds_error)
@@ -102,8 +119,8 @@ def interpolate2d(x, y, z, points, mode='linear', bounds_error=False):
     idy = numpy.searchsorted(y, eta, side='left')
 
     # Internal check (index == 0 is OK)
-    if len(idx) > 0 or len(idy) > 0:
-        if (max(idx) >= len(x)) or (max(idy) >= len(y)):
+    if check_level != 'off' and len(idx) > 0:
+        if (numpy.max(idx) >= len(x)) or (numpy.max(idy) >= len(y)):
             msg = (
                 'Interpolation point outside domain. '
                 'This should never happen. '
@@ -147,7 +164,7 @@ def interpolate2d(x, y, z, points, mode='linear', bounds_error=False):
         upper_left = upper * left
 
         # Initialise result array with all elements set to upper right
-        z_interpolate = z11
+        z_interpolate = z11.copy()
 
         # Then set the other quadrants
         z_interpolate[lower_left] = z00[lower_left]
@@ -155,15 +172,10 @@ def interpolate2d(x, y, z, points, mode='linear', bounds_error=False):
         z_interpolate[upper_left] = z01[upper_left]
 
     # Self test
-    if len(z_interpolate) > 0:
-        mz_interpolate = numpy.nanmax(z_interpolate)
-        mz = numpy.nanmax(z)
-        # noinspection PyStringFormat
-        msg = ('Internal check failed. Max interpolated value %.15f '
-               'exceeds max grid value %.15f ' % (mz_interpolate, mz))
-        if not(numpy.isnan(mz_interpolate) or numpy.isnan(mz)):
-            if not mz_interpolate <= mz:
-                raise InaSAFEError(msg)
+    if check_level != 'off':
+        check_interpolated_values(z_interpolate, [z00, z01, z10, z11])
+    if check_level == 'full':
+        check_grid_maximum(z_interpolate, z)
 
     # Populate result with interpolated values for points inside domain
     # and NaN for values outside
@@ -174,7 +186,8 @@ def interpolate2d(x, y, z, points, mode='linear', bounds_error=False):
     return r
 
 
-def interpolate_raster(x, y, z, points, mode='linear', bounds_error=False):
+def interpolate_raster(x, y, z, points, mode='linear', bounds_error=False,
+                       check_level=None):
     """2D interpolation of raster data
 
     It is assumed that data is organised in matrix z as latitudes from
@@ -214,6 +227,11 @@ def interpolate_raster(x, y, z, points, mode='linear', bounds_error=False):
           is returned for those values
     :type bounds_error: bool
 
+    :param check_level: Level of internal checks of interpolated values,
+        'off', 'sampled' or 'full'. If None (default), the level
+        DEFAULT_CHECK_LEVEL of module interpolation.py is used.
+    :type check_level: str
+
     :returns: 1D array with same length as points with interpolated values
 
     :raises: Exception, BoundsError (see note about bounds_error)
@@ -228,10 +246,222 @@ def interpolate_raster(x, y, z, points, mode='linear', bounds_error=False):
     z = z.transpose()
 
     # Call underlying interpolation routine and return
-    res = interpolate2d(x, y, z, points, mode=mode, bounds_error=bounds_error)
+    res = interpolate2d(x, y, z, points, mode=mode, bounds_error=bounds_error,
+                        check_level=check_level)
     return res
 
 
+class RasterSampler(object):
+    """Repeated interpolation of points from one raster grid
+
+    This gives the same results as interpolate_raster, but the grid is
+    validated and its axes analysed once when the sampler is created
+    rather than on every call. The grid is not copied.
+
+    Neighbours of points are located by direct index arithmetic when the
+    axes are equidistant (as for all grids defined by a geotransform) and
+    by binary search otherwise. Points are interpolated in chunks of
+    SAMPLE_CHUNK_SIZE to keep temporary arrays small.
+
+    Example:
+        sampler = RasterSampler(longitudes, latitudes, A)
+        values = sampler.sample(points, mode='constant')
+    """
+
+    def __init__(self, x, y, z, chunk_size=SAMPLE_CHUNK_SIZE):
+        """Validate grid and precompute its spacing
+
+        :param x: 1D array of x-coordinates (longitudes) of the grid
+        :type x: numpy.ndarray
+
+        :param y: 1D array of y-coordinates (latitudes) of the grid
+        :type y: numpy.ndarray
+
+        :param z: 2D array of values organised as a raster, i.e. with
+            latitudes from north to south along the first dimension and
+            longitudes from west to east along the second dimension.
+        :type z: numpy.ndarray
+
+        :param chunk_size: Number of points to interpolate at a time
+        :type chunk_size: int
+
+        :raises: InaSAFEError
+        """
+
+        self.x = numpy.array(validate_coordinate_vector(x, 'x'),
+                             dtype=numpy.float, copy=False)
+        self.y = numpy.array(validate_coordinate_vector(y, 'y'),
+                             dtype=numpy.float, copy=False)
+        self.z = numpy.asarray(z)
+
+        if self.z.shape != (len(self.y), len(self.x)):
+            msg = (
+                'Input array Z must have dimensions %i x %i corresponding to '
+                'the lengths of the input coordinates y and x. However, '
+                'Z has dimensions %s.' % (len(self.y), len(self.x),
+                                         ' x '.join([str(n) for n in
+                                                     self.z.shape])))
+            raise InaSAFEError(msg)
+
+        self.dx = self._get_spacing(self.x)
+        self.dy = self._get_spacing(self.y)
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _get_spacing(axis):
+        """Spacing of an equidistant axis or None if it is irregular
+        """
+
+        if len(axis) < 2:
+            return None
+
+        spacing = (axis[-1] - axis[0]) / (len(axis) - 1)
+        if spacing > 0 and numpy.allclose(numpy.diff(axis), spacing,
+                                          rtol=1.0e-6, atol=0):
+            return spacing
+        return None
+
+    @staticmethod
+    def _get_upper_neighbours(axis, spacing, values):
+        """Find index i for each value such that axis[i - 1] < value <= axis[i]
+
+        Values must be within the axis. Index 1 is used for values equal to
+        axis[0], so that i - 1 is always a valid index for axes with more
+        than one element.
+        """
+
+        n = len(axis)
+        if spacing is None:
+            index = numpy.searchsorted(axis, values, side='left')
+        else:
+            index = numpy.ceil((values - axis[0]) / spacing).astype(numpy.int)
+            numpy.clip(index, 0, n - 1, out=index)
+
+            # Correct for rounding in the division
+            index += axis[index] < values
+            numpy.clip(index, 0, n - 1, out=index)
+            index -= (index > 0) * (axis[index - 1] >= values)
+
+        numpy.clip(index, min(1, n - 1), n - 1, out=index)
+        return index
+
+    def sample(self, points, mode='linear', bounds_error=False,
+               check_level=None):
+        """Interpolate grid values at points
+
+        :param points: Nx2 array of coordinates (x, y) where interpolated
+            values are sought
+        :type points: numpy.ndarray
+
+        :param mode: Determines the interpolation order.
+            Options are:
+
+                * 'constant' - piecewise constant nearest neighbour
+                  interpolation
+                * 'linear' - bilinear interpolation using the four
+                  nearest neighbours (default)
+
+        :type mode: str
+
+        :param bounds_error: If True a BoundsError exception will be raised
+              when interpolated values are requested outside the domain of
+              the grid. If False (default), nan is returned for those
+              values.
+        :type bounds_error: bool
+
+        :param check_level: Level of internal checks of interpolated
+            values as for interpolate2d. Values interpolated with
+            mode 'constant' are grid values and only checked at level
+            'full'.
+        :type check_level: str
+
+        :returns: 1D array with same length as points with interpolated
+            values
+
+        :raises: InaSAFEError, BoundsError
+        """
+
+        validate_mode(mode)
+        check_level = validate_check_level(check_level)
+
+        points = numpy.array(points, dtype=numpy.float, copy=False)
+        if len(points) == 0:
+            return numpy.zeros(0)
+        if not len(points.shape) == 2:
+            msg = 'Interpolation points must be a 2d array'
+            raise RuntimeError(msg)
+
+        xi = points[:, 0]
+        eta = points[:, 1]
+        if bounds_error:
+            validate_bounds(self.x, xi, 'xi', 'x')
+            validate_bounds(self.y, eta, 'eta', 'y')
+
+        result = numpy.empty(len(points))
+        result[:] = numpy.nan
+        for start in xrange(0, len(points), self.chunk_size):
+            end = start + self.chunk_size
+            self._sample_chunk(xi[start:end], eta[start:end], mode,
+                               check_level, result[start:end])
+
+        if check_level == 'full':
+            check_grid_maximum(result, self.z)
+
+        return result
+
+    def _sample_chunk(self, xi, eta, mode, check_level, result):
+        """Interpolate values at points (xi, eta) into result
+        """
+
+        x = self.x
+        y = self.y
+        ny = len(y)
+
+        # Points inside interpolation domain (NaN coordinates are not)
+        inside = numpy.flatnonzero((xi >= x[0]) * (xi <= x[-1]) *
+                                   (eta >= y[0]) * (eta <= y[-1]))
+        if len(inside) == 0:
+            return
+        xi = xi[inside]
+        eta = eta[inside]
+
+        # Upper neighbours along each axis and their rows in the raster
+        idx = self._get_upper_neighbours(x, self.dx, xi)
+        idy = self._get_upper_neighbours(y, self.dy, eta)
+        lower_row = ny - idy
+        upper_row = lower_row - 1
+
+        # Coefficients for weighting between lower and upper bounds
+        old_set = numpy.seterr(invalid='ignore')  # Suppress warnings
+        alpha = (xi - x[idx - 1]) / (x[idx] - x[idx - 1])
+        beta = (eta - y[idy - 1]) / (y[idy] - y[idy - 1])
+        numpy.seterr(**old_set)  # Restore
+
+        z = self.z
+        if mode == 'linear':
+            # Bilinear interpolation formula
+            z00 = z[lower_row, idx - 1]
+            z01 = z[upper_row, idx - 1]
+            z10 = z[lower_row, idx]
+            z11 = z[upper_row, idx]
+            dx = z10 - z00
+            dy = z01 - z00
+            z_interpolate = z00 + alpha * dx + beta * dy + alpha * beta * (
+                z11 - dx - dy - z00)
+
+            # Self test
+            if check_level != 'off':
+                check_interpolated_values(z_interpolate,
+                                          [z00, z01, z10, z11])
+        else:
+            # Piecewise constant: pick nearest neighbour directly
+            idx -= alpha < 0.5
+            upper_row += beta < 0.5
+            z_interpolate = z[upper_row, idx]
+
+        result[inside] = z_interpolate
+
+
 # Mathematical derivation of the interpolation formula used
 # noinspection PyStatementEffect
 """
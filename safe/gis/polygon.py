@@ -3,6 +3,8 @@
 .. tip::
    The main public functions are:
      separate_points_by_polygon: Fundamental clipper
+     assign_points_to_polygons: Indexed clipping of points by many polygons
+     rasterize_polygons: Burn polygon ids into a raster aligned grid
      intersection: Determine intersections of lines
 
    Some more specific or helper functions include:
@@ -39,7 +41,9 @@ def separate_points_by_polygon(
         polygon_bbox=None,
         closed=True,
         check_input=True,
-        use_numpy=True):
+        use_numpy=True,
+        use_slabs=False,
+        chunk_size=None):
     """Determine whether points are inside or outside a polygon.
 
     Args:
@@ -54,6 +58,11 @@ def separate_points_by_polygon(
               the code faster.
         * check_input: Allows faster execution if set to False
         * use_numpy: Use the fast numpy implementation
+        * use_slabs: Bucket polygon edges by horizontal bands so each point
+              is only tested against nearby edges. This is much faster for
+              polygons with many vertices. Requires use_numpy.
+        * chunk_size: (optional) maximal number of point-edge pairs the
+              band algorithm evaluates at once. Use this to bound memory.
 
     Returns:
         * indices_inside_polygon: array of indices of points
@@ -165,13 +174,19 @@ def separate_points_by_polygon(
     inside_box = -outside_box
     candidate_points = points[inside_box]
 
-    if use_numpy:
-        func = _separate_points_by_polygon
+    if use_numpy and use_slabs:
+        local_indices_inside, local_indices_outside = \
+            _separate_points_by_polygon_slabs(
+                candidate_points, polygon, closed=closed,
+                chunk_size=chunk_size)
     else:
-        func = _separate_points_by_polygon_python
+        if use_numpy:
+            func = _separate_points_by_polygon
+        else:
+            func = _separate_points_by_polygon_python
 
-    local_indices_inside, local_indices_outside = func(
-        candidate_points, polygon, closed=closed)
+        local_indices_inside, local_indices_outside = func(
+            candidate_points, polygon, closed=closed)
 
     # Map local indices from candidate points to global indices of all points
     indices_outside_box = numpy.where(outside_box)[0]
@@ -230,38 +245,56 @@ def _separate_points_by_polygon(points, polygon,
     x = points[:, 0]
     y = points[:, 1]
 
-    # Algorithm for finding points inside polygon
+    # Vector keeping track of which points are on the polygon boundary
+    if closed is not None:
+        on_boundary = numpy.zeros(M, dtype=numpy.bool)
+
+    # Algorithm for finding points inside polygon and on its boundary.
+    # Both are computed in the same sweep over the polygon edges.
     for i in range(N):
         # Loop through polygon edges
         j = (i + 1) % N
         px_i, py_i = polygon[i, :]
         px_j, py_j = polygon[j, :]
 
+        # Only points within the vertical extent of the edge can cross it.
+        # Points on the edge (up to tolerance) are within that extent
+        # padded by the distance tolerance implied by point_on_line.
+        padding = 0.0
+        if closed is not None:
+            edge_length = numpy.sqrt((px_j - px_i) ** 2 + (py_j - py_i) ** 2)
+            if edge_length > 0:
+                padding = atol / edge_length + rtol * edge_length
+        candidates = numpy.where(
+            (y >= min(py_i, py_j) - padding) *
+            (y <= max(py_i, py_j) + padding))[0]
+        if len(candidates) == 0:
+            continue
+        xc = x[candidates]
+        yc = y[candidates]
+
         # Edge crossing formula
-        sigma = (y - py_i) / (py_j - py_i) * (px_j - px_i)
-        seg_i = (py_i < y) * (py_j >= y)
-        seg_j = (py_j < y) * (py_i >= y)
-        mask = (px_i + sigma < x) * (seg_i + seg_j)
+        sigma = (yc - py_i) / (py_j - py_i) * (px_j - px_i)
+        seg_i = (py_i < yc) * (py_j >= yc)
+        seg_j = (py_j < yc) * (py_i >= yc)
+        mask = candidates[(px_i + sigma < xc) * (seg_i + seg_j)]
 
         inside[mask] = 1 - inside[mask]
 
+        if closed is not None:
+            # Select those that are on the boundary
+            on_edge = _point_on_edge(xc, yc, px_i, py_i, px_j, py_j,
+                                     rtol, atol)
+            on_boundary[candidates[on_edge]] = True
+
     # Restore numpy warnings
     numpy.seterr(**original_numpy_settings)
 
     if closed is not None:
-        # Find points on polygon boundary
-        for i in range(N):
-            # Loop through polygon edges
-            j = (i + 1) % N
-            edge = [polygon[i, :], polygon[j, :]]
-
-            # Select those that are on the boundary
-            boundary_points = point_on_line(points, edge, rtol, atol)
-
-            if closed:
-                inside[boundary_points] = 1
-            else:
-                inside[boundary_points] = 0
+        if closed:
+            inside[on_boundary] = 1
+        else:
+            inside[on_boundary] = 0
 
     # Record point as either inside or outside
     inside_index = numpy.sum(inside)  # How many points are inside
@@ -275,6 +308,178 @@ def _separate_points_by_polygon(points, polygon,
     return indices[:inside_index], indices[inside_index:]
 
 
+def _separate_points_by_polygon_slabs(points, polygon,
+                                      closed, rtol=0.0, atol=0.0,
+                                      chunk_size=None):
+    """Partition points according to polygon using edges bucketed by y-band
+
+    This gives the same result as _separate_points_by_polygon but is much
+    faster for polygons with many vertices: The polygon extent is divided
+    into horizontal bands and each point is only tested against the edges
+    whose y-range overlaps its band instead of against all edges.
+
+    Input:
+       points - Mx2 array of point coordinates
+       polygon - Nx2 array of polygon vertices
+       closed - (optional) determine whether points on boundary should be
+       regarded as belonging to the polygon (closed = True)
+       or not (closed = False). Close can also be None.
+       rtol, atol: Tolerances for when a point is considered to coincide with
+       a line. Default 0.0.
+       chunk_size - (optional) maximal number of point-edge pairs evaluated
+       at once. Use this to bound peak memory for large inputs.
+       Default None means all pairs are evaluated in one go.
+
+    Output:
+       Indices of points inside polygon and indices of points outside
+       polygon (as returned by _separate_points_by_polygon).
+    """
+
+    M = points.shape[0]
+    N = polygon.shape[0]
+
+    if M == 0:
+        # If no points return two 0-vectors
+        return numpy.arange(0), numpy.arange(0)
+
+    # Polygon edges (x0, y0) -> (x1, y1)
+    x0 = polygon[:, 0]
+    y0 = polygon[:, 1]
+    x1 = numpy.roll(x0, -1)
+    y1 = numpy.roll(y0, -1)
+
+    # Vertical extent of each edge padded by boundary tolerance
+    edge_length = numpy.sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2)
+    padding = numpy.zeros(N)
+    nonzero = edge_length > 0
+    padding[nonzero] = (atol / edge_length[nonzero] +
+                        rtol * edge_length[nonzero])
+    edge_miny = numpy.minimum(y0, y1) - padding
+    edge_maxy = numpy.maximum(y0, y1) + padding
+
+    # Divide polygon extent into bands. The number of bands is chosen so
+    # that the total number of (band, edge) entries stays of order N.
+    miny = numpy.min(edge_miny)
+    maxy = numpy.max(edge_maxy)
+    height = maxy - miny
+    total_span = numpy.sum(edge_maxy - edge_miny)
+    if height > 0 and total_span > 0:
+        number_of_bands = int(min(N, max(1, N * height / total_span)))
+        band_height = height / number_of_bands
+    else:
+        number_of_bands = 1
+        band_height = 1.0
+
+    def band_index(y):
+        """Band containing given y values
+        """
+        return numpy.clip(((y - miny) / band_height).astype(numpy.int),
+                          0, number_of_bands - 1)
+
+    # Register each edge with all bands its vertical extent overlaps
+    first_band = band_index(edge_miny)
+    span = band_index(edge_maxy) - first_band + 1
+    edge_ids, bands = _expand_ranges(first_band, span)
+
+    order = numpy.argsort(bands, kind='mergesort')
+    band_edges = edge_ids[order]
+    band_offsets = numpy.searchsorted(bands[order],
+                                      numpy.arange(number_of_bands + 1))
+
+    # Only points within vertical extent of polygon can be inside
+    x = points[:, 0]
+    y = points[:, 1]
+    candidates = numpy.where((y >= miny) * (y <= maxy))[0]
+    point_bands = band_index(y[candidates])
+    starts = band_offsets[point_bands]
+    counts = band_offsets[point_bands + 1] - starts
+
+    # Split candidate points into chunks of at most chunk_size pairs
+    cumulative = numpy.cumsum(counts)
+    if chunk_size is None:
+        chunk_size = max(1, cumulative[-1]) if len(cumulative) else 1
+
+    inside = numpy.zeros(M, dtype=numpy.bool)
+
+    # Suppress numpy warnings (as we'll be dividing by zero)
+    original_numpy_settings = numpy.seterr(invalid='ignore', divide='ignore')
+
+    start = 0
+    while start < len(candidates):
+        offset = cumulative[start] - counts[start]
+        end = numpy.searchsorted(cumulative, offset + chunk_size,
+                                 side='right')
+        end = max(end, start + 1)
+
+        # Expand into one entry per point-edge pair
+        pair_points, pair_entries = _expand_ranges(starts[start:end],
+                                                   counts[start:end])
+        pair_edges = band_edges[pair_entries]
+
+        px = x[candidates[start:end]][pair_points]
+        py = y[candidates[start:end]][pair_points]
+        px_i = x0[pair_edges]
+        py_i = y0[pair_edges]
+        px_j = x1[pair_edges]
+        py_j = y1[pair_edges]
+
+        # Edge crossing formula (as in _separate_points_by_polygon)
+        sigma = (py - py_i) / (py_j - py_i) * (px_j - px_i)
+        seg_i = (py_i < py) * (py_j >= py)
+        seg_j = (py_j < py) * (py_i >= py)
+        mask = (px_i + sigma < px) * (seg_i + seg_j)
+
+        crossings = numpy.bincount(pair_points[mask],
+                                   minlength=end - start)
+        chunk_inside = crossings % 2 == 1
+
+        if closed is not None:
+            # Find points on polygon boundary
+            on_edge = _point_on_edge(px, py, px_i, py_i, px_j, py_j,
+                                     rtol, atol)
+            boundary = numpy.bincount(pair_points[on_edge],
+                                      minlength=end - start) > 0
+            chunk_inside[boundary] = closed
+
+        inside[candidates[start:end]] = chunk_inside
+        start = end
+
+    # Restore numpy warnings
+    numpy.seterr(**original_numpy_settings)
+
+    return numpy.where(inside)[0], numpy.where(~inside)[0]
+
+
+def _point_on_edge(x, y, x0, y0, x1, y1, rtol, atol):
+    """Elementwise test for points (x, y) being on edges (x0, y0)-(x1, y1)
+
+    All arguments are arrays of the same length (or scalars). The criterion
+    is the same as in point_on_line.
+
+    Returns boolean array which is True where point is on its edge
+    """
+
+    # Vector from beginning of line to point
+    a0 = x - x0
+    a1 = y - y0
+
+    # Vector parallel to line
+    b0 = x1 - x0
+    b1 = y1 - y0
+
+    # Determine if point vector is parallel to line up to a tolerance
+    nominator = abs(a1 * b0 - a0 * b1)
+    denominator = b0 * b0 + b1 * b1
+    is_parallel = nominator <= atol + rtol * denominator
+
+    # and within end points
+    len_a = numpy.sqrt(a0 * a0 + a1 * a1)
+    len_b = numpy.sqrt(denominator)
+    cross = a0 * b0 + a1 * b1
+
+    return is_parallel * (cross >= 0) * (len_a <= len_b)
+
+
 def _separate_points_by_polygon_python(points, polygon,
                                        closed, rtol=0.0, atol=0.0):
     """Underlying algorithm to partition point according to polygon
@@ -601,6 +806,131 @@ def outside_polygon(points, polygon, closed=True,
     return indices
 
 
+def assign_points_to_polygons(
+        points,
+        polygons,
+        closed=True,
+        first_polygon_wins=True,
+        check_input=True):
+    """Determine which polygon (if any) each point falls inside.
+
+    This is the batch version of in_and_outside_polygon for many polygons.
+    Points are binned into a uniform grid covering their extent so that
+    each polygon is only tested against the points inside the grid cells
+    overlapped by its bounding box rather than against all points.
+
+    :param points: Nx2 array (or list) of point coordinates (x, y).
+
+    :param polygons: List of polygon geometry objects (with attributes
+        outer_ring and inner_rings), list of polygon vertex arrays or
+        packed geometry (e.g. from Vector.get_packed_geometry).
+
+    :param closed: Set to True if points on boundary are considered
+        to be 'inside' polygon.
+    :type closed: bool
+
+    :param first_polygon_wins: If polygons overlap, points are assigned to
+        the first polygon they fall in (True) or the last (False).
+    :type first_polygon_wins: bool
+
+    :param check_input: Allows faster execution if set to False.
+    :type check_input: bool
+
+    :returns: Array of length N with the index of the polygon each point
+        falls in, or -1 for points that are not inside any polygon.
+    :rtype: numpy.ndarray
+
+    :raises: PolygonInputError
+    """
+
+    if check_input:
+        try:
+            points = ensure_numeric(points, numpy.float)
+        except Exception, e:
+            msg = ('Points could not be converted to numeric array: %s'
+                   % str(e))
+            raise PolygonInputError(msg)
+
+        if len(points.shape) == 1 and points.shape[0] == 2:
+            points = numpy.reshape(points, (1, 2))
+
+        msg = ('Points array must be an Nx2 array of coordinates. '
+               'I got shape %s' % str(points.shape))
+        if len(points.shape) != 2 or points.shape[1] != 2:
+            raise PolygonInputError(msg)
+
+    N = points.shape[0]
+    polygon_ids = -numpy.ones(N, dtype=numpy.int)
+    if N == 0 or len(polygons) == 0:
+        return polygon_ids
+
+    x = points[:, 0]
+    y = points[:, 1]
+
+    # Build uniform grid index with about one point per cell
+    minx = numpy.min(x)
+    maxx = numpy.max(x)
+    miny = numpy.min(y)
+    maxy = numpy.max(y)
+    nx = ny = max(1, int(numpy.sqrt(N)))
+    dx = (maxx - minx) / nx
+    dy = (maxy - miny) / ny
+    if dx <= 0:
+        dx = 1.0
+    if dy <= 0:
+        dy = 1.0
+
+    cell_x = numpy.clip(((x - minx) / dx).astype(numpy.int), 0, nx - 1)
+    cell_y = numpy.clip(((y - miny) / dy).astype(numpy.int), 0, ny - 1)
+    cells = cell_y * nx + cell_x
+
+    # Points sorted by cell and the offset of each cell into that order
+    order = numpy.argsort(cells, kind='mergesort')
+    offsets = numpy.searchsorted(cells[order], numpy.arange(nx * ny + 1))
+
+    # Only polygons within the extent of all points are considered
+    for i, outer_ring, inner_rings, bbox in _polygons_in_bbox(
+            polygons, [minx, miny, maxx, maxy]):
+        minpx, minpy, maxpx, maxpy = bbox
+
+        # Range of grid cells overlapped by polygon bounding box
+        i0 = max(int((minpx - minx) / dx), 0)
+        i1 = min(int((maxpx - minx) / dx), nx - 1)
+        j0 = max(int((minpy - miny) / dy), 0)
+        j1 = min(int((maxpy - miny) / dy), ny - 1)
+
+        # Each grid row of the window is a contiguous slice of the order
+        rows = numpy.arange(j0, j1 + 1)
+        starts = offsets[rows * nx + i0]
+        ends = offsets[rows * nx + i1 + 1]
+
+        # Concatenate slices without a Python loop over rows
+        _, slices = _expand_ranges(starts, ends - starts)
+        if len(slices) == 0:
+            continue
+        candidates = order[slices]
+
+        # Only keep candidates within bounding box (and not yet assigned)
+        cx = x[candidates]
+        cy = y[candidates]
+        mask = (cx >= minpx) * (cx <= maxpx) * (cy >= minpy) * (cy <= maxpy)
+        if first_polygon_wins:
+            mask *= polygon_ids[candidates] < 0
+        candidates = candidates[mask]
+        if len(candidates) == 0:
+            continue
+
+        inside, _ = in_and_outside_polygon(
+            points[candidates],
+            outer_ring,
+            holes=inner_rings,
+            closed=closed,
+            check_input=False)
+        polygon_ids[candidates[inside]] = i
+
+    return polygon_ids
+
+
 def clip_lines_by_polygon(lines, polygon,
                           closed=True,
                           check_input=True):
@@ -708,35 +1038,290 @@ def _clip_lines_by_polygon(lines,
 
     inside_line_segments = {}
     outside_line_segments = {}
+    for k in range(len(lines)):
+        inside_line_segments[k] = []
+        outside_line_segments[k] = []
+
+    vertices, first, count, line_bboxes = _pack_lines(lines)
+
+    # Exclude lines that are fully outside polygon bounding box
+    outside_bbox = ((line_bboxes[:, 2] < minpx) |  # Everything to the west
+                    (line_bboxes[:, 0] > maxpx) |  # Everything to the east
+                    (line_bboxes[:, 3] < minpy) |  # Everything to the south
+                    (line_bboxes[:, 1] > maxpy))   # Everything to the north
+    for k in numpy.flatnonzero(outside_bbox):
+        outside_line_segments[k] = [lines[k]]
+
+    # Clip all remaining lines at once
+    inside, outside = _clip_packed_lines_by_polygon(
+        vertices, first, count, numpy.flatnonzero(~outside_bbox),
+        polygon, polygon_segments, polygon_bbox, closed=closed)
+    inside_line_segments.update(inside)
+    outside_line_segments.update(outside)
 
-    # Loop through lines
-    M = len(lines)
-    for k in range(M):
-        line = lines[k]
+    return inside_line_segments, outside_line_segments
 
-        # Exclude lines that are fully outside polygon bounding box
-        if (
-                max(line[:, 0]) < minpx or  # Everything is to the west
-                min(line[:, 0]) > maxpx or  # Everything is to the east
-                max(line[:, 1]) < minpy or  # Everything is to the south
-                min(line[:, 1]) > maxpy):   # Everything is to the north
 
-            inside_line_segments[k] = []
-            outside_line_segments[k] = [line]
-            continue
+def _pack_lines(lines):
+    """Store lines in one array of vertices
 
-        # Call underlying function for one line and one polygon
-        inside, outside = _clip_line_by_polygon(line,
-                                                polygon,
-                                                polygon_segments,
-                                                polygon_bbox,
-                                                closed=closed)
+    Input:
+       lines: Sequence of polylines: [[p0, p1, ...], [q0, q1, ...], ...]
 
-        # Record clipped line segments from line k
-        inside_line_segments[k] = inside
-        outside_line_segments[k] = outside
+    Output:
+       vertices: Nx2 array with the vertices of all lines
+       first: Index of the first vertex of each line in vertices
+       count: Number of vertices in each line
+       bounding_boxes: Mx4 array with the bounding box
+           [west, south, east, north] of each line (nan if it is empty)
+    """
+
+    lines = [numpy.reshape(ensure_numeric(line, numpy.float), (-1, 2))
+             for line in lines]
+    count = numpy.array([len(line) for line in lines], dtype=numpy.int)
+    first = numpy.cumsum(count) - count
+    bounding_boxes = numpy.zeros((len(lines), 4)) * numpy.nan
+    if numpy.sum(count) == 0:
+        return numpy.zeros((0, 2)), first, count, bounding_boxes
+
+    vertices = numpy.concatenate(lines)
+    nonempty = count > 0
+    bounding_boxes[nonempty, :2] = numpy.minimum.reduceat(
+        vertices, first[nonempty])
+    bounding_boxes[nonempty, 2:] = numpy.maximum.reduceat(
+        vertices, first[nonempty])
+    return vertices, first, count, bounding_boxes
 
-    return inside_line_segments, outside_line_segments
+
+def _intersect_segments(p0, p1, segments):
+    """Intersect many line segments with a collection of line segments
+
+    Input:
+       p0, p1: Nx2 arrays with the end points of each line segment
+       segments: Collection of line segments vectorised as line1 in
+           intersection()
+
+    Output:
+       indices: Index of the line segment of each intersection point
+       points: Kx2 array of intersection points
+
+    This is intersection() vectorised over the first argument. Parallel
+    segments are considered not to intersect.
+    """
+
+    x0 = p0[:, 0:1]
+    y0 = p0[:, 1:2]
+    x1 = p1[:, 0:1]
+    y1 = p1[:, 1:2]
+    x2 = segments[0, 0, :]
+    y2 = segments[0, 1, :]
+    x3 = segments[1, 0, :]
+    y3 = segments[1, 1, :]
+
+    # Same arithmetic as intersection() broadcast to shape NxE
+    y3y2 = y3 - y2
+    x3x2 = x3 - x2
+    x1x0 = x1 - x0
+    y1y0 = y1 - y0
+    x2x0 = x2 - x0
+    y2y0 = y2 - y0
+    denominator = y3y2 * x1x0 - x3x2 * y1y0
+
+    original_numpy_settings = numpy.seterr(invalid='ignore', divide='ignore')
+    u0 = (y3y2 * x2x0 - x3x2 * y2y0) / denominator
+    u1 = (x2x0 * y1y0 - y2y0 * x1x0) / denominator
+    numpy.seterr(**original_numpy_settings)
+
+    mask = (0.0 <= u0) * (u0 <= 1.0) * (0.0 <= u1) * (u1 <= 1.0)
+    indices, _ = numpy.nonzero(mask)
+    u0 = u0[mask]
+
+    points = numpy.zeros((len(indices), 2))
+    points[:, 0] = x0[indices, 0] + u0 * x1x0[indices, 0]
+    points[:, 1] = y0[indices, 0] + u0 * y1y0[indices, 0]
+    return indices, points
+
+
+def _clip_packed_lines_by_polygon(vertices, first, count, line_ids,
+                                  polygon,
+                                  polygon_segments,
+                                  polygon_bbox,
+                                  closed=True,
+                                  holes=None):
+    """Clip lines stored by _pack_lines by polygon
+
+    Input:
+       vertices, first, count: Lines as returned by _pack_lines
+       line_ids: Indices of the lines to clip
+       polygon: Nx2 array of polygon vertices
+       polygon_segments: Edges of polygon and holes from polygon2segments
+       polygon_bbox: Bounding box [minpx, maxpx, minpy, maxpy]
+       closed: See clip_lines_by_polygon
+       holes: Optional list of inner rings of polygon
+
+    Output:
+       inside_lines: Dictionary of lines that are inside polygon
+       outside_lines: Dictionary of lines that are outside polygon
+
+       Only indices in line_ids that have lines inside or outside
+       respectively are keys.
+
+    Algorithm:
+       1: Cut all segments of all lines at their intersections with
+          polygon edges. Segments outside polygon bounding box are
+          not cut.
+       2: Decide for the midpoint of each sub-segment whether it
+          is inside or outside polygon.
+       3: Join adjacent sub-segments from the same line into polylines
+          that are either fully inside or fully outside polygon.
+
+    Step 1 and 2 are done for all segments of all lines at once.
+    """
+
+    minpx, maxpx, minpy, maxpy = polygon_bbox
+
+    # Segments of all lines in order (line, segment) and their line index
+    segment_lines, starts = _expand_ranges(first[line_ids],
+                                           count[line_ids] - 1)
+    segment_lines = numpy.asarray(line_ids)[segment_lines]
+    p0 = vertices[starts]
+    p1 = vertices[starts + 1]
+
+    # Skip segments that are outside polygon bounding box
+    segment_is_outside_bbox = (
+        ((p0[:, 0] < minpx) & (p1[:, 0] < minpx)) |  # Segment to the west
+        ((p0[:, 0] > maxpx) & (p1[:, 0] > maxpx)) |  # Segment to the east
+        ((p0[:, 1] < minpy) & (p1[:, 1] < minpy)) |  # Segment to the south
+        ((p0[:, 1] > maxpy) & (p1[:, 1] > maxpy)))   # Segment to the north
+
+    # Sub-segments given by segment index, end points and whether inside
+    sub_segments = [numpy.flatnonzero(segment_is_outside_bbox)]
+    sub_starts = [p0[segment_is_outside_bbox]]
+    sub_ends = [p1[segment_is_outside_bbox]]
+    sub_inside = [numpy.zeros(len(sub_segments[0]), dtype=bool)]
+
+    # Cut remaining segments in blocks limiting memory to about
+    # 2**20 segment-edge pairs
+    candidates = numpy.flatnonzero(~segment_is_outside_bbox)
+    block = max(1, 2 ** 20 // polygon_segments.shape[2])
+    for i in xrange(0, len(candidates), block):
+        segments = candidates[i:i + block]
+        q0 = p0[segments]
+        q1 = p1[segments]
+        indices, points = _intersect_segments(q0, q1, polygon_segments)
+
+        # Include end points and sort points along each segment
+        N = len(segments)
+        indices = numpy.concatenate((numpy.arange(N),
+                                     numpy.arange(N),
+                                     indices))
+        points = numpy.concatenate((q0, q1, points))
+        V = points - q0[indices]
+        distances = (V * V).sum(axis=1)
+        order = numpy.lexsort((distances, indices))
+        indices = indices[order]
+        points = points[order]
+        distances = distances[order]
+
+        # Remove duplicate points
+        duplicates = numpy.zeros(len(distances), dtype=bool)
+        duplicates[1:] = ((indices[1:] == indices[:-1]) &
+                          (distances[1:] == distances[:-1]))
+        indices = indices[~duplicates]
+        points = points[~duplicates]
+
+        # Cut segments at the remaining points
+        mask = indices[1:] == indices[:-1]
+        starts = points[:-1][mask]
+        ends = points[1:][mask]
+
+        # Separate sub-segment midpoints according to polygon
+        # Deliberately ignore boundary as midpoints by definition
+        # are fully inside or fully outside.
+        midpoints = (starts + ends) / 2
+        if holes:
+            inside, _ = in_and_outside_polygon(midpoints, polygon,
+                                               closed=closed,
+                                               holes=holes,
+                                               check_input=False)
+        else:
+            inside, _ = separate_points_by_polygon(midpoints,
+                                                   polygon,
+                                                   polygon_bbox,
+                                                   check_input=False,
+                                                   closed=closed)
+        is_inside = numpy.zeros(len(midpoints), dtype=bool)
+        is_inside[inside] = True
+
+        sub_segments.append(segments[indices[:-1][mask]])
+        sub_starts.append(starts)
+        sub_ends.append(ends)
+        sub_inside.append(is_inside)
+
+    # Restore order of sub-segments along lines
+    sub_segments = numpy.concatenate(sub_segments)
+    order = numpy.argsort(sub_segments, kind='mergesort')
+    sub_lines = segment_lines[sub_segments[order]]
+    sub_starts = numpy.concatenate(sub_starts)[order]
+    sub_ends = numpy.concatenate(sub_ends)[order]
+    sub_inside = numpy.concatenate(sub_inside)[order]
+
+    # Rejoin adjacent segments and add to result lines
+    inside_lines = _join_packed_segments(sub_lines[sub_inside],
+                                         sub_starts[sub_inside],
+                                         sub_ends[sub_inside])
+    outside_lines = _join_packed_segments(sub_lines[~sub_inside],
+                                          sub_starts[~sub_inside],
+                                          sub_ends[~sub_inside])
+
+    return inside_lines, outside_lines
+
+
+def _join_packed_segments(line_ids, starts, ends, rtol=1.0e-12, atol=1.0e-12,
+                          groups=None):
+    """Join adjacent line segments of many lines
+
+    Input
+        line_ids: Index of the line each segment belongs to
+        starts, ends: Nx2 arrays with the end points of each segment
+        rtol, atol: Optional tolerances passed on to numpy.isclose
+        groups: Optional array. Segments are only joined if they are
+            in the same group. Default is to group segments by line.
+
+    Output
+        Dictionary of lists of Nx2 numpy arrays keyed by line index.
+        Consecutive segments from the same line are joined as in
+        join_line_segments.
+    """
+
+    lines = {}
+
+    N = len(line_ids)
+    if N == 0:
+        return lines
+
+    if groups is None:
+        groups = line_ids
+
+    # Mark segments that are not adjacent to the previous one
+    first = numpy.ones(N, dtype=bool)
+    adjacent = numpy.all(numpy.isclose(ends[:-1], starts[1:],
+                                       rtol=rtol, atol=atol), axis=1)
+    first[1:] = (groups[1:] != groups[:-1]) | ~adjacent
+
+    # Vertices of all joined lines: the start point of their first segment
+    # followed by the end points of all their segments
+    positions = numpy.arange(N) + numpy.cumsum(first)
+    vertices = numpy.zeros((N + numpy.sum(first), 2))
+    vertices[positions] = ends
+    breaks = positions[first] - 1
+    vertices[breaks] = starts[first]
+
+    for k, line in zip(line_ids[first].tolist(),
+                       numpy.split(vertices, breaks[1:])):
+        lines.setdefault(k, []).append(line)
+
+    return lines
 
 
 def clip_line_by_polygon(line, polygon,
@@ -843,183 +1428,12 @@ def clip_line_by_polygon(line, polygon,
     # Convert polygon to segments
     polygon_segments = polygon2segments(polygon)
 
-    return _clip_line_by_polygon(line,
-                                 polygon,
-                                 polygon_segments,
-                                 polygon_bbox,
-                                 closed=closed)
-
-
-# FIXME (Ole, 14 sep 2012): Will clean this up soon, promise
-# pylint: disable=W0613
-def _clip_line_by_polygon(line,
-                          polygon,
-                          polygon_segments,
-                          polygon_bbox,
-                          closed=True):
-    """Clip line segments by polygon
-
-    This is the underlying function
-    - see public clip_line_by_polygon() for details
-    """
-
-    # Algorithm
-    #
-    # 1: Find all intersection points between line segments and polygon edges
-    # 2: For each line segment
-    #    * Calculate distance from first end point to each intersection point
-    #    * Sort intersection points by distance
-    #    * Cut segment into multiple segments
-    # 3: For each new line segment
-    #    * Calculate its midpoint
-    #    * Determine if it is inside or outside clipping polygon
-    # 4: Join adjacent segments into polylines that are either
-    #     fully inside or outside polygon
-    # 5
-
-    # Get bounding box
-    minpx = polygon_bbox[0]
-    maxpx = polygon_bbox[1]
-    minpy = polygon_bbox[2]
-    maxpy = polygon_bbox[3]
-
-    # Lists collecting clipped line segments
-    inside_line_segments = []
-    outside_line_segments = []
-
-    # Loop through line segments
-    M = line.shape[0]
-    for k in range(M - 1):
-        p0 = line[k, :]
-        p1 = line[k + 1, :]
-        segment = [p0, p1]
-
-        # -------------
-        # Optimisation
-        # -------------
-        # Skip segments that are outside polygon bounding box
-
-        # In test_engine.py
-        # test_polygon_to_roads_interpolation_flood_example with
-        # (E_attributes[:-1:100]) took
-        # * Without this: 92s
-        # * With original optimisation: 61s
-        # * With new version: 54s
-        if p0[0] < minpx and p1[0] < minpx:  # Entire segment to the west
-            segment_is_outside_bbox = True
-        elif p0[0] > maxpx and p1[0] > maxpx:  # Entire segment to the east
-            segment_is_outside_bbox = True
-        elif p0[1] < minpy and p1[1] < minpy:  # Entire segment to the south
-            segment_is_outside_bbox = True
-        elif p0[1] > maxpy and p1[1] > maxpy:  # Entire segment to the north
-            segment_is_outside_bbox = True
-        else:
-            # Skip segments where both end points are outside polygon
-            # bounding box and which don't intersect the bounding box
-            segment_is_outside_bbox = True
-            if minpx < p0[0] < maxpx or minpy < p0[1] < maxpy:
-                # First endpoint is inside bounding box
-                segment_is_outside_bbox = False
-            elif minpx < p1[0] < maxpx or minpy < p1[1] < maxpy:
-                # Second endpoint is inside bounding box
-                segment_is_outside_bbox = False
-            else:
-                # Both end points are outside bounding box, but could be on
-                # either side so need to check if segment intersects polygon
-                # bounding box.
-                corners = numpy.array([[minpx, minpy], [maxpx, minpy],
-                                       [maxpx, maxpy], [minpx, maxpy],
-                                       [minpx, minpy]])
-                for i in range(4):
-                    edge = [corners[i, :], corners[i + 1, :]]
-                    value = intersection(segment, edge)
-                    if value is not None:
-                        # Segment intersects polygon bounding box
-                        segment_is_outside_bbox = False
-                        break
-        # -----------------
-        # End optimisation
-        # -----------------
-
-        # Separate segments that are inside from those outside
-        if segment_is_outside_bbox:
-            outside_line_segments.append(segment)
-        else:
-            # Intersect segment with all polygon edges
-            # and decide for each sub-segment whether in or out
-            values = intersection(segment, polygon_segments)
-            mask = -numpy.isnan(values[:, 0])
-            V = values[mask]
-
-            # Array for intersections
-            intersections = numpy.zeros((len(V) + 2, 2))
-
-            # Include end points
-            intersections[0, :] = p0
-            intersections[1, :] = p1
-
-            # Add internal intersections
-            intersections[2:, :] = V
-
-            # For each intersection, computer distance from first end point
-            V = intersections - p0
-            distances = (V * V).sum(axis=1)
-
-            # Sort intersections by distance
-            idx = numpy.argsort(distances)
-            distances = distances[idx]
-            intersections = intersections[idx]
-
-            # Remove duplicate points
-            duplicates = numpy.zeros(len(distances), dtype=bool)
-            duplicates[1:] = distances[1:] - distances[:-1] == 0
-            intersections = intersections[-duplicates, :]
-
-            # FIXME (Ole): Next candidate for vectorisation (11/9/2012) below
-            # Loop through intersections for this line segment
-            # distances = {}
-            # for i in range(len(intersections)):
-            #    v = p0 - intersections[i]
-            #    d = numpy.dot(v, v)
-            #    if d in distances:
-            #        print i, d, distances[d], intersections[i]
-            #        import sys; sys.exit()
-            #    distances[d] = intersections[i]  # Don't record duplicates
-
-            # Sort intersections by distance using Schwarzian transform
-            # A = zip(distances.keys(), distances.values())
-            # A.sort()
-            # _, intersections = zip(*A)
-
-            # Separate segment midpoints according to polygon
-            # Deliberately ignore boundary as midpoints by definition
-            # are fully inside or fully outside.
-            intersections = numpy.array(intersections)
-            midpoints = (intersections[:-1] + intersections[1:]) / 2
-            inside, outside = separate_points_by_polygon(midpoints,
+    inside_lines, outside_lines = _clip_lines_by_polygon([line],
                                                          polygon,
+                                                         polygon_segments,
                                                          polygon_bbox,
-                                                         check_input=False,
                                                          closed=closed)
-
-            # Form segments and add to the right lists
-            for i, idx in enumerate([inside, outside]):
-                if len(idx) > 0:
-                    segments = numpy.concatenate((intersections[idx, :],
-                                                  intersections[idx + 1, :]),
-                                                 axis=1)
-                    m, n = segments.shape
-                    segments = numpy.reshape(segments, (m, n / 2, 2))
-                    if i == 0:
-                        inside_line_segments.extend(segments.tolist())
-                    else:
-                        outside_line_segments.extend(segments.tolist())
-
-    # Rejoin adjacent segments and add to result lines
-    inside_lines = join_line_segments(inside_line_segments)
-    outside_lines = join_line_segments(outside_line_segments)
-
-    return inside_lines, outside_lines
+    return inside_lines[0], outside_lines[0]
 
 
 def join_line_segments(segments, rtol=1.0e-12, atol=1.0e-12):
@@ -1271,6 +1685,238 @@ def intersection(line0, line1):
     return result
 
 
+def rasterize_polygons(polygons, geotransform, nx, ny, closed=True):
+    """Burn polygon ids into a grid aligned with a raster.
+
+    Each grid cell is assigned the id of the polygon its center falls in,
+    exactly as if the grid points were clipped with clip_grid_by_polygons.
+    Rather than testing every grid point against every polygon, each grid
+    row is filled between the polygon edge crossings (scanline algorithm)
+    within the bounding box of the polygon.
+
+    :param polygons: list of polygon geometry objects, list of polygon arrays
+        or packed geometry
+
+    :param geotransform: 6-tuple used to locate the grid geographically
+        (top left x, w-e pixel resolution, rotation, top left y, rotation,
+        n-s pixel resolution)
+
+    :param nx: Number of grid columns
+    :type nx: int
+
+    :param ny: Number of grid rows
+    :type ny: int
+
+    :param closed: Set to True if grid points on the polygon boundary are
+        considered to be 'inside' polygon
+    :type closed: bool
+
+    :returns: ny x nx int32 array of polygon ids laid out like the raster
+        data. If multiple polygons overlap, the one first encountered will
+        be used. Cells not covered by any polygon are set to -1.
+    :rtype: numpy.ndarray
+    """
+
+    # Grid point coordinates (latitudes increasing with row index)
+    x, y = geotransform_to_axes(geotransform, nx, ny)
+    labels = -numpy.ones((ny, nx), dtype=numpy.int32)
+
+    for i, outer_ring, inner_rings, bbox in _polygons_in_bbox(
+            polygons, [x[0], y[0], x[-1], y[-1]]):
+
+        # Window of grid points within polygon bounding box
+        c0 = numpy.searchsorted(x, bbox[0], side='left')
+        c1 = numpy.searchsorted(x, bbox[2], side='right')
+        r0 = numpy.searchsorted(y, bbox[1], side='left')
+        r1 = numpy.searchsorted(y, bbox[3], side='right')
+        if c0 >= c1 or r0 >= r1:
+            continue
+
+        mask = _rasterize_ring(outer_ring, x[c0:c1], y[r0:r1], closed)
+        for hole in inner_rings:
+            hole = ensure_numeric(hole, numpy.float)
+            mask *= ~_rasterize_ring(hole, x[c0:c1], y[r0:r1], not closed)
+
+        # Only assign grid points not already covered by another polygon
+        window = labels[r0:r1, c0:c1]
+        window[mask * (window < 0)] = i
+
+    # Flip rows so that first row is the northernmost as in the raster
+    return numpy.flipud(labels)
+
+
+def _rasterize_ring(ring, x, y, closed):
+    """Determine which points of a regular grid fall inside a polygon ring
+
+    Input:
+       ring - Nx2 array of polygon vertices
+       x - increasing array of grid point x coordinates (columns)
+       y - increasing array of grid point y coordinates (rows)
+       closed - determine whether points on boundary should be
+       regarded as belonging to the polygon (closed = True)
+       or not (closed = False). Close can also be None.
+
+    Output:
+       len(y) x len(x) boolean array which is True for grid points
+       inside ring. Results are identical to _separate_points_by_polygon
+       applied to the same points.
+    """
+
+    nx = len(x)
+    ny = len(y)
+    inside = numpy.zeros((ny, nx), dtype=numpy.bool)
+
+    # Ring edges (x0, y0) -> (x1, y1)
+    x0 = ring[:, 0]
+    y0 = ring[:, 1]
+    x1 = numpy.roll(x0, -1)
+    y1 = numpy.roll(y0, -1)
+    edge_miny = numpy.minimum(y0, y1)
+    edge_maxy = numpy.maximum(y0, y1)
+
+    # Suppress numpy warnings (as we'll be dividing by zero)
+    original_numpy_settings = numpy.seterr(invalid='ignore', divide='ignore')
+
+    # Grid rows crossing each edge: edge_miny < y <= edge_maxy
+    first = numpy.searchsorted(y, edge_miny, side='right')
+    count = numpy.searchsorted(y, edge_maxy, side='right') - first
+    edges, rows = _expand_ranges(first, count)
+
+    # Edge crossing formula (as in _separate_points_by_polygon).
+    # Grid points to the right of a crossing toggle between in and out.
+    sigma = ((y[rows] - y0[edges]) / (y1[edges] - y0[edges]) *
+             (x1[edges] - x0[edges]))
+    columns = numpy.searchsorted(x, x0[edges] + sigma, side='right')
+
+    # Sum toggles along rows a block of rows at a time to limit memory use
+    order = numpy.argsort(rows, kind='mergesort')
+    rows = rows[order]
+    columns = columns[order]
+    width = nx + 1
+    block = max(1, 2 ** 22 // width)
+    for r in range(0, ny, block):
+        n = min(block, ny - r)
+        start, end = numpy.searchsorted(rows, [r, r + n])
+        keys = (rows[start:end] - r) * width + columns[start:end]
+        toggles = numpy.bincount(keys, minlength=n * width) % 2
+        toggles = toggles.astype(numpy.uint8).reshape((n, width))
+        parity = numpy.cumsum(toggles, axis=1, dtype=numpy.uint8) % 2
+        inside[r:r + n, :] = parity[:, :nx] == 1
+
+    if closed is not None:
+        # Find grid points on ring boundary. For sloping edges these are
+        # next to the crossing in each row spanned by the edge and for
+        # horizontal edges in the row it coincides with.
+        sloping = numpy.where(edge_miny < edge_maxy)[0]
+        first = numpy.searchsorted(y, edge_miny[sloping], side='left')
+        count = numpy.searchsorted(y, edge_maxy[sloping],
+                                   side='right') - first
+        edges, rows = _expand_ranges(first, count)
+        edges = sloping[edges]
+        sigma = ((y[rows] - y0[edges]) / (y1[edges] - y0[edges]) *
+                 (x1[edges] - x0[edges]))
+        crossing = numpy.searchsorted(x, x0[edges] + sigma, side='left')
+        edges = numpy.repeat(edges, 3)
+        rows = numpy.repeat(rows, 3)
+        columns = numpy.repeat(crossing, 3) + numpy.tile([-1, 0, 1],
+                                                         len(crossing))
+
+        horizontal = numpy.where(edge_miny == edge_maxy)[0]
+        first = numpy.searchsorted(y, edge_miny[horizontal], side='left')
+        count = numpy.searchsorted(y, edge_maxy[horizontal],
+                                   side='right') - first
+        h_edges, h_rows = _expand_ranges(first, count)
+        h_edges = horizontal[h_edges]
+        first = numpy.searchsorted(x, numpy.minimum(x0, x1)[h_edges],
+                                   side='left')
+        count = numpy.searchsorted(x, numpy.maximum(x0, x1)[h_edges],
+                                   side='right') - first
+        pairs, h_columns = _expand_ranges(first, count)
+
+        edges = numpy.concatenate((edges, h_edges[pairs]))
+        rows = numpy.concatenate((rows, h_rows[pairs]))
+        columns = numpy.concatenate((columns, h_columns))
+
+        valid = (columns >= 0) * (columns < nx)
+        edges = edges[valid]
+        rows = rows[valid]
+        columns = columns[valid]
+        on_edge = _point_on_edge(x[columns], y[rows],
+                                 x0[edges], y0[edges], x1[edges], y1[edges],
+                                 0.0, 0.0)
+        inside[rows[on_edge], columns[on_edge]] = closed
+
+    # Restore numpy warnings
+    numpy.seterr(**original_numpy_settings)
+
+    return inside
+
+
+def _polygons_in_bbox(polygons, bbox):
+    """Generate the polygons whose bounding box intersects bbox
+
+    Input:
+       polygons - list of polygon geometry objects, list of polygon arrays
+       or packed geometry (see PackedGeometry in safe/storage/geometry.py)
+       bbox - bounding box [west, south, east, north]
+
+    Output:
+       Tuples (i, outer_ring, inner_rings, polygon_bbox) for each polygon
+       i intersecting bbox in the order they appear in polygons.
+
+    Packed geometry keeps the bounding boxes of all polygons, so these
+    are tested at once and rings are taken as views of its coordinates.
+    """
+
+    west, south, east, north = bbox
+    if hasattr(polygons, 'bounding_boxes'):
+        for i in numpy.flatnonzero(polygons.intersects_bbox(bbox)):
+            yield (i,
+                   polygons.get_outer_ring(i),
+                   polygons.get_inner_rings(i),
+                   polygons.bounding_boxes[i])
+        return
+
+    for i, polygon in enumerate(polygons):
+        if hasattr(polygon, 'outer_ring'):
+            outer_ring = polygon.outer_ring
+            inner_rings = polygon.inner_rings
+        else:
+            # Assume it is an array
+            outer_ring = polygon
+            inner_rings = []
+        outer_ring = ensure_numeric(outer_ring, numpy.float)
+
+        polygon_bbox = [numpy.min(outer_ring[:, 0]),
+                        numpy.min(outer_ring[:, 1]),
+                        numpy.max(outer_ring[:, 0]),
+                        numpy.max(outer_ring[:, 1])]
+        if (polygon_bbox[2] < west or polygon_bbox[0] > east or
+                polygon_bbox[3] < south or polygon_bbox[1] > north):
+            continue
+
+        yield i, outer_ring, inner_rings, polygon_bbox
+
+
+def _expand_ranges(first, count):
+    """Expand ranges first[i], ..., first[i] + count[i] - 1
+
+    Input:
+       first - array of first element in each range
+       count - array of number of elements in each range
+
+    Output:
+       ids - array with the index i of the range each element belongs to
+       values - array with all elements of all ranges
+    """
+
+    count = numpy.maximum(count, 0)
+    ids = numpy.repeat(numpy.arange(len(count)), count)
+    values = (numpy.repeat(first - numpy.cumsum(count) + count, count) +
+              numpy.arange(numpy.sum(count)))
+    return ids, values
+
+
 # Main functions for polygon clipping
 # FIXME (Ole): Both can be rigged to return points or lines
 # outside any polygon by adding that as the entry in the list returned
@@ -1293,7 +1939,8 @@ def clip_grid_by_polygons(grid_data, geotransform, polygons):
         (top left x, w-e pixel resolution, rotation, top left y, rotation,
         n-s pixel resolution)
 
-    :param polygons: list of polygon geometry objects or list of polygon arrays
+    :param polygons: list of polygon geometry objects, list of polygon arrays
+        or packed geometry
 
     :returns: Tuple of (points_covered, grid_covered).
         points_covered = List of tuple (points, values) - points covered and
@@ -1305,46 +1952,26 @@ def clip_grid_by_polygons(grid_data, geotransform, polygons):
     x, y = geotransform_to_axes(geotransform, nx, ny)
     points, values = grid_to_points(grid_data, x, y)
 
-    # Generate list of points and values that fall inside each polygon
-    points_covered = []
+    # Find the (first) polygon each grid point falls in
+    polygon_ids = rasterize_polygons(
+        polygons, geotransform, nx, ny, closed=True).reshape(-1)
 
-    # List of indices that are inside the polygons
-    values_indices = set([])
-
-    for polygon in polygons:
-        if hasattr(polygon, 'outer_ring'):
-            outer_ring = polygon.outer_ring
-            inner_rings = polygon.inner_rings
-        else:
-            # Assume it is an array
-            outer_ring = polygon
-            inner_rings = None
+    # Group point indices by polygon, keeping each group in grid order
+    order = numpy.argsort(polygon_ids, kind='mergesort')
+    counts = numpy.bincount(polygon_ids + 1, minlength=len(polygons) + 1)
+    offsets = numpy.cumsum(counts)
 
-        inside, _ = in_and_outside_polygon(
-            points,
-            outer_ring,
-            holes=inner_rings,
-            closed=True,
-            check_input=False
-        )
-
-        # Get non intersected inside
-        inside_set = set(inside)
-        intersected_inside = inside_set & values_indices
-        inside = list(inside_set - intersected_inside)
+    # Generate list of points and values that fall inside each polygon
+    points_covered = []
+    for i in range(len(polygons)):
+        inside = order[offsets[i]:offsets[i + 1]]
 
         # Add features inside this polygon
         points_covered.append((points[inside], values[inside]))
 
-        # Union inside to values indices
-        values_indices |= inside_set
-
     # Values covered, set to NaN if it's not covered by any polygons
     values_covered = values.astype(numpy.float, copy=False)
-    values_indices = list(values_indices)
-    mask = numpy.ones(values.shape, dtype=bool)
-    mask[values_indices] = False
-    values_covered[mask] = numpy.NaN
+    values_covered[polygon_ids < 0] = numpy.NaN
 
     # Reshape to the grid_data shape
     grid_covered = numpy.reshape(values_covered, grid_data.shape)
@@ -1352,13 +1979,16 @@ def clip_grid_by_polygons(grid_data, geotransform, polygons):
     return points_covered, grid_covered
 
 
-def clip_lines_by_polygons(lines, polygons, check_input=True, closed=True):
+def clip_lines_by_polygons(lines, polygons, check_input=True, closed=True,
+                           first_polygon_wins=False):
     """Clip multiple lines by multiple polygons
 
     Args:
         * lines: Sequence of polylines: [[p0, p1, ...], [q0, q1, ...], ...]
             where pi and qi are point coordinates (x, y).
-        * polygons: list of polygons, each an array of vertices
+        * polygons: list of polygon geometry objects, list of polygon
+            arrays or packed geometry (see PackedGeometry in
+            safe/storage/geometry.py). Lines inside holes are outside.
         * closed: optional parameter to determine whether lines that fall on
             an polygon boundary should be considered to be inside
             (closed=True), outside (closed=False) or
@@ -1366,14 +1996,21 @@ def clip_lines_by_polygons(lines, polygons, check_input=True, closed=True):
             algorithm up but lines on boundaries may or may not be
             deemed to fall inside the polygon and so will be
             indeterministic.
+        * first_polygon_wins: optional parameter to determine what happens
+            where polygons overlap. If True, only the parts of lines
+            outside all previous polygons are clipped by the next polygon
+            so each part of a line belongs to the first polygon it falls
+            in and lines fully inside polygons are not considered further.
+            If False, every polygon gets all parts of lines inside it.
 
     Returns:
-        lines_covered: List of polylines inside a polygon -o ne per input
-        polygon.
+        lines_covered: List of polylines inside a polygon - one per input
+        polygon. Each entry is a dictionary of lists of clipped lines keyed
+        by the index of the line they were clipped from. Lines without
+        parts inside the polygon have an empty list.
 
-
-    .. note:: If multiple polygons overlap, the one first encountered will be
-        used.
+    Lines are only clipped by polygons whose bounding box they intersect,
+    and all segments of these lines are clipped by a polygon at once.
     """
 
     if check_input:
@@ -1389,40 +2026,187 @@ def clip_lines_by_polygons(lines, polygons, check_input=True, closed=True):
             if not len(lines[i].shape) == 2:
                 raise RuntimeError(msg)
 
-        for i in range(len(polygons)):
-            try:
-                polygons[i] = ensure_numeric(polygons[i], numpy.float)
-            except Exception, e:
-                msg = ('Polygon could not be converted to numeric array: %s'
-                       % str(e))
-                raise Exception(msg)
+        if not hasattr(polygons, 'bounding_boxes'):
+            for i in range(len(polygons)):
+                if hasattr(polygons[i], 'outer_ring'):
+                    continue
+                try:
+                    polygons[i] = ensure_numeric(polygons[i], numpy.float)
+                except Exception, e:
+                    msg = ('Polygon could not be converted to numeric '
+                           'array: %s' % str(e))
+                    raise Exception(msg)
 
     # Initialise structures
-    lines_covered = []
-    remaining_lines = lines
+    lines_covered = [dict((k, []) for k in range(len(lines)))
+                     for _ in range(len(polygons))]
+    vertices, first, count, line_bboxes = _pack_lines(lines)
+    if len(vertices) == 0:
+        return lines_covered
+
+    # Remaining lines are stored with the index of the line they are
+    # part of. Lines that have been clipped are marked as not active.
+    parents = numpy.arange(len(lines))
+    active = count > 1
 
     # Clip lines to polygons
-    for polygon in polygons:
-        # for i, polygon in enumerate(polygons):
-        # print ('Doing polygon %i (%i vertices) of %i with '
-        #       '%i lines' % (i, len(polygon),
-        #                     len(polygons),
-        #                     len(remaining_lines)))
-        inside_lines, _ = clip_lines_by_polygon(remaining_lines,
-                                                polygon,
-                                                check_input=False)
-        # print ('- %i segments were inside'
-        #       % len(line_dictionary_to_geometry(inside_lines)))
+    extent = [numpy.nanmin(line_bboxes[:, 0]),
+              numpy.nanmin(line_bboxes[:, 1]),
+              numpy.nanmax(line_bboxes[:, 2]),
+              numpy.nanmax(line_bboxes[:, 3])]
+    for i, outer_ring, inner_rings, bbox in _polygons_in_bbox(polygons,
+                                                              extent):
+        west, south, east, north = bbox
+
+        # Only clip lines intersecting polygon bounding box
+        line_ids = numpy.flatnonzero(active &
+                                     (line_bboxes[:, 2] >= west) &
+                                     (line_bboxes[:, 0] <= east) &
+                                     (line_bboxes[:, 3] >= south) &
+                                     (line_bboxes[:, 1] <= north))
+        if len(line_ids) == 0:
+            continue
+
+        polygon_segments = numpy.concatenate(
+            [polygon2segments(ring) for ring in [outer_ring] + inner_rings],
+            axis=2)
+        inside_lines, outside_lines = _clip_packed_lines_by_polygon(
+            vertices, first, count, line_ids,
+            outer_ring, polygon_segments,
+            [west, east, south, north],
+            closed=closed,
+            holes=inner_rings)
 
         # Record lines inside this polygon
-        lines_covered.append(inside_lines)
-
-        # Use lines outside as remaining lines
-        # FIXME (Ole): This optimisation needs some thought
-        # as lines are often partially clipped. We also need to keep
-        # track of the parent line to get its attributes if we want
-        # to go down this road
-        # remaining_lines = outside_lines
+        for k in inside_lines:
+            lines_covered[i][int(parents[k])].extend(inside_lines[k])
+
+        if first_polygon_wins:
+            # Use lines outside as remaining lines
+            active[line_ids] = False
+            keys = sorted(outside_lines)
+            remaining = [line for k in keys for line in outside_lines[k]]
+            if len(remaining) == 0:
+                continue
+
+            new_vertices, new_first, new_count, new_bboxes = \
+                _pack_lines(remaining)
+            new_parents = numpy.repeat(
+                parents[keys], [len(outside_lines[k]) for k in keys])
+
+            first = numpy.concatenate((first, new_first + len(vertices)))
+            vertices = numpy.concatenate((vertices, new_vertices))
+            count = numpy.concatenate((count, new_count))
+            line_bboxes = numpy.concatenate((line_bboxes, new_bboxes))
+            parents = numpy.concatenate((parents, new_parents))
+            active = numpy.concatenate((active, new_count > 1))
+
+    return lines_covered
+
+
+def clip_lines_by_grid(lines, labels, geotransform, split_cells=False):
+    """Clip lines by the cells of a labelled grid
+
+    Input:
+       lines: Sequence of polylines: [[p0, p1, ...], [q0, q1, ...], ...]
+              where pi and qi are point coordinates (x, y).
+       labels: MxN integer array with a label for each grid cell, first
+           row is the northernmost (as returned by Raster.get_data).
+           Negative labels mark cells that are not classified.
+       geotransform: GDAL geotransform of the grid (without rotation)
+       split_cells: If True, lines in cells with non-negative labels are
+           clipped at every cell boundary. Otherwise they are only clipped
+           where the label changes.
+
+    Output:
+       lines_covered: Dictionary with one entry per label. Each entry is a
+       dictionary of lists of clipped lines keyed by the index of the line
+       they were clipped from, as in clip_lines_by_polygons.
+       Line parts outside the grid get label -1.
+
+    Each line segment is walked through the grid cells it crosses: it is
+    cut where it crosses grid lines and every part gets the label of the
+    cell containing its midpoint. This is done for all segments at once.
+    """
+
+    labels = numpy.asarray(labels)
+    rows, cols = labels.shape
+    origin = numpy.array([geotransform[0], geotransform[3]])
+    resolution = numpy.array([geotransform[1], geotransform[5]])
+
+    lines_covered = {}
+    vertices, first, count, _ = _pack_lines(lines)
+    if len(vertices) == 0:
+        return lines_covered
+
+    # Segments of all lines in order (line, segment) and their line index
+    segment_lines, starts = _expand_ranges(first, count - 1)
+    p0 = vertices[starts]
+    p1 = vertices[starts + 1]
+
+    # Segment end points in grid coordinates (column, row)
+    c0 = (p0 - origin) / resolution
+    c1 = (p1 - origin) / resolution
+
+    # Parameters t along segments where they cross grid lines within
+    # the grid. End points are t = 0 and t = 1.
+    indices = [numpy.arange(len(p0)), numpy.arange(len(p0))]
+    parameters = [numpy.zeros(len(p0)), numpy.ones(len(p0))]
+    for axis, size in [(0, cols), (1, rows)]:
+        lower = numpy.floor(numpy.minimum(c0[:, axis], c1[:, axis])) + 1
+        upper = numpy.floor(numpy.maximum(c0[:, axis], c1[:, axis]))
+        lower = numpy.maximum(lower, 0)
+        upper = numpy.minimum(upper, size)
+        segments, grid_lines = _expand_ranges(
+            lower.astype(numpy.int), (upper - lower + 1).astype(numpy.int))
+        indices.append(segments)
+        parameters.append((grid_lines - c0[segments, axis]) /
+                          (c1[segments, axis] - c0[segments, axis]))
+    indices = numpy.concatenate(indices)
+    parameters = numpy.concatenate(parameters)
+
+    # Sort crossings along each segment and remove duplicates
+    order = numpy.lexsort((parameters, indices))
+    indices = indices[order]
+    parameters = parameters[order]
+    duplicates = numpy.zeros(len(indices), dtype=bool)
+    duplicates[1:] = ((indices[1:] == indices[:-1]) &
+                      (parameters[1:] == parameters[:-1]))
+    indices = indices[~duplicates]
+    parameters = parameters[~duplicates]
+
+    # Cut segments at the crossings and find the cell of each part
+    mask = indices[1:] == indices[:-1]
+    part_segments = indices[:-1][mask]
+    t0 = parameters[:-1][mask]
+    t1 = parameters[1:][mask]
+    direction = c1[part_segments] - c0[part_segments]
+    midpoints = c0[part_segments] + direction * ((t0 + t1) / 2)[:, None]
+    col = numpy.floor(midpoints[:, 0]).astype(numpy.int)
+    row = numpy.floor(midpoints[:, 1]).astype(numpy.int)
+    inside = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+    part_labels = -numpy.ones(len(part_segments), dtype=numpy.int)
+    part_labels[inside] = labels[row[inside], col[inside]]
+
+    # Part end points in the coordinates of the lines keeping vertices
+    direction = p1[part_segments] - p0[part_segments]
+    part_starts = p0[part_segments] + direction * t0[:, None]
+    part_ends = p0[part_segments] + direction * t1[:, None]
+    part_ends[t1 == 1] = p1[part_segments[t1 == 1]]
+
+    # Break lines at cell boundaries by joining parts of one cell only
+    groups = segment_lines[part_segments]
+    if split_cells:
+        cells = numpy.where(part_labels >= 0, row * cols + col, -1)
+        groups = groups * (rows * cols + 1) + cells + 1
+
+    for label in numpy.unique(part_labels):
+        mask = part_labels == label
+        lines_covered[int(label)] = _join_packed_segments(
+            segment_lines[part_segments[mask]],
+            part_starts[mask],
+            part_ends[mask],
+            groups=groups[mask])
 
     return lines_covered
 
@@ -18,9 +18,10 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
 import unittest
-from osgeo import ogr
+import numpy
+from osgeo import gdal, ogr
 
-from safe.gis.gdal_ogr_tools import polygonize_thresholds
+from safe.gis.gdal_ogr_tools import polygonize_thresholds, warp_raster
 from safe.test.utilities import test_data_path
 
 
@@ -53,6 +54,28 @@ class TestGDALOGRTools(unittest.TestCase):
         # print 'outside %s' % (outside_file_name)
         self.assertEquals(feature_count2, 1)
 
+    @unittest.skipIf(not hasattr(gdal, 'Warp'), 'gdal.Warp is not available')
+    def test_warp_raster(self):
+        """Test clipping raster in process keeps cells and data type
+        """
+        raster_path = test_data_path('hazard', 'jakarta_flood_design.tif')
+        source = gdal.Open(raster_path)
+        x0, dx, _, y0, _, dy = source.GetGeoTransform()
+        extent = [x0 + 10 * dx, y0 + 30 * dy, x0 + 40 * dx, y0 + 10 * dy]
+
+        dataset = warp_raster(raster_path, extent)
+        self.assertEqual(dataset.RasterXSize, 30)
+        self.assertEqual(dataset.RasterYSize, 20)
+        numpy.testing.assert_allclose(
+            dataset.GetGeoTransform(),
+            [extent[0], dx, 0, extent[3], 0, dy])
+
+        source_band = source.GetRasterBand(1)
+        band = dataset.GetRasterBand(1)
+        self.assertEqual(band.DataType, source_band.DataType)
+        numpy.testing.assert_array_equal(
+            band.ReadAsArray(), source_band.ReadAsArray(10, 10, 30, 20))
+
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(TestGDALOGRTools, 'test')
@@ -1,7 +1,12 @@
 import unittest
 import numpy
 
-from safe.gis.geodesy import Point
+from safe.gis.geodesy import (
+    Point,
+    distance,
+    bearing,
+    destination,
+    generate_circles)
 
 
 class TestCase(unittest.TestCase):
@@ -191,6 +196,70 @@ class TestCase(unittest.TestCase):
         #       geometry_type='point',
         #       data=None).write_to_file('center.shp')
 
+    def test_vectorised_distance_and_bearing(self):
+        """Array distances and bearings agree with Point
+        """
+        points = [self.Home, self.Syd, self.Nadi, self.Kobenhavn, self.Muncar]
+        latitudes = numpy.array([p.latitude for p in points])
+        longitudes = numpy.array([p.longitude for p in points])
+
+        d = distance(
+            self.RSISE.latitude, self.RSISE.longitude, latitudes, longitudes)
+        expected = [self.RSISE.distance_to(p) for p in points]
+        msg = 'Distances %s. Expected %s' % (d, expected)
+        assert numpy.allclose(d, expected, rtol=1.0e-6), msg
+
+        b = bearing(
+            self.RSISE.latitude, self.RSISE.longitude, latitudes, longitudes)
+        expected = [self.RSISE.bearing_to(p) for p in points]
+        msg = 'Bearings %s. Expected %s' % (b, expected)
+        assert numpy.all(numpy.round(b) == expected), msg
+
+        # Due west is 270 degrees, not -90
+        b = bearing(0.0, 1.0, 0.0, 0.0)
+        assert numpy.allclose(b, 270), b
+
+    def test_destination(self):
+        """Destination points are at the given distance and bearing
+        """
+        bearings = numpy.arange(0, 360, 15)
+        for D in [10.0, 2068.855, 239407.67, 3406100]:
+            lat, lon = destination(
+                self.RSISE.latitude, self.RSISE.longitude, bearings, D)
+            d = distance(self.RSISE.latitude, self.RSISE.longitude, lat, lon)
+            msg = 'Distances %s. Expected %f' % (d, D)
+            assert numpy.allclose(d, D, rtol=1.0e-6), msg
+
+            b = bearing(lat * 0 + self.RSISE.latitude,
+                        self.RSISE.longitude, lat, lon)
+            assert numpy.allclose(b, bearings, atol=1.0e-6), b
+
+        # Longitudes wrap across the date line
+        lat, lon = destination(0.0, 179.5, 90, 111000)
+        assert -180 <= lon < -179, lon
+
+    def test_generate_circles(self):
+        """Circles for many centres and radii are generated in one call
+        """
+        points = [self.Syd, self.Nadi, self.Muncar]
+        radii = [3000, 5000, 10000]
+        C = generate_circles(
+            [p.latitude for p in points], [p.longitude for p in points],
+            radii)
+        assert C.shape == (3, 3, 361, 2), C.shape
+
+        for i, p in enumerate(points):
+            for j, radius in enumerate(radii):
+                circle = C[i, j]
+                assert numpy.allclose(circle[0], circle[-1])
+                assert numpy.allclose(circle, p.generate_circle(radius))
+
+                # North most point is at the exact radius
+                d = distance(p.latitude, p.longitude,
+                             circle[:, 1], circle[:, 0])
+                assert numpy.allclose(d[0], radius, rtol=1.0e-6), d[0]
+                assert numpy.allclose(d, radius, rtol=2.0e-1), d
+
 if __name__ == '__main__':
     mysuite = unittest.makeSuite(TestCase, 'test')
     runner = unittest.TextTestRunner(verbosity=2)
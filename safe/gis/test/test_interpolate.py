@@ -3,8 +3,14 @@ import numpy
 import unittest
 
 # Import InaSAFE modules
-from safe.gis.interpolation2d import interpolate2d, interpolate_raster
-from safe.gis.interpolation import BoundsError
+from safe.gis.interpolation2d import (
+    interpolate2d, interpolate_raster, RasterSampler)
+from safe.gis.interpolation import (
+    BoundsError,
+    InaSAFEError,
+    validate_check_level,
+    check_interpolated_values,
+    check_grid_maximum)
 from safe.gis.interpolation1d import interpolate1d
 from safe.test.utilities import combine_coordinates
 from safe.gis.numerics import nan_allclose
@@ -449,6 +455,107 @@ class TestInterpolate(unittest.TestCase):
 
         assert numpy.allclose(vals, refs, rtol=1e-12, atol=1e-12)
 
+    def test_raster_sampler(self):
+        """Raster sampler gives the same values as interpolate_raster
+        """
+
+        # Regular grid with missing values and random points, some of
+        # them outside the grid
+        numpy.random.seed(17)
+        longitudes = numpy.linspace(100.05, 103.95, 40)
+        latitudes = numpy.linspace(-7.95, -5.05, 30)
+        A = numpy.random.uniform(0, 10, (30, 40))
+        A[numpy.random.uniform(size=A.shape) < 0.1] = numpy.nan
+        points = numpy.random.uniform([99.8, -8.2], [104.2, -4.8],
+                                      size=(5000, 2))
+        points[7] = numpy.nan
+
+        sampler = RasterSampler(longitudes, latitudes, A, chunk_size=1000)
+        assert sampler.dx is not None
+        assert sampler.dy is not None
+        for mode in ['linear', 'constant']:
+            vals = sampler.sample(points, mode=mode)
+            refs = interpolate_raster(longitudes, latitudes, A, points,
+                                      mode=mode)
+            assert nan_allclose(vals, refs, rtol=1e-12, atol=1e-12)
+
+        # Irregular grid uses binary search
+        longitudes[1:-1] += numpy.random.uniform(-0.02, 0.02, 38)
+        sampler = RasterSampler(longitudes, latitudes, A)
+        assert sampler.dx is None
+        vals = sampler.sample(points)
+        refs = interpolate_raster(longitudes, latitudes, A, points)
+        assert nan_allclose(vals, refs, rtol=1e-12, atol=1e-12)
+
+        # Grid points are reproduced
+        points = combine_coordinates(longitudes[::3], latitudes[::3])
+        vals = sampler.sample(points, mode='constant')
+        refs = interpolate_raster(longitudes, latitudes, A, points,
+                                  mode='constant')
+        assert nan_allclose(vals, refs, rtol=0, atol=0)
+
+        # Bounds
+        self.assertRaises(BoundsError, sampler.sample,
+                          [[0, 0]], bounds_error=True)
+        assert numpy.isnan(sampler.sample([[0, 0]])[0])
+
+    def test_interpolation_check_levels(self):
+        """Internal checks of interpolated values can be configured
+        """
+
+        numpy.random.seed(23)
+        x = numpy.linspace(0, 10, 11)
+        y = numpy.linspace(0, 5, 6)
+        A = numpy.random.uniform(-5, 5, (11, 6))
+        A[3, 2] = numpy.nan
+        points = numpy.random.uniform([0, 0], [10, 5], size=(1000, 2))
+        raster_points = points[:, ::-1]
+
+        sampler = RasterSampler(y, x, numpy.flipud(A))
+        for mode in ['linear', 'constant']:
+            refs = interpolate2d(x, y, A, points, mode=mode,
+                                 check_level='off')
+            refs1d = interpolate1d(x, A[:, 0], points[:, 0], mode=mode,
+                                   check_level='off')
+            for level in ['sampled', 'full', None]:
+                vals = interpolate2d(x, y, A, points, mode=mode,
+                                     check_level=level)
+                assert nan_allclose(vals, refs, rtol=0, atol=0)
+                vals = interpolate1d(x, A[:, 0], points[:, 0], mode=mode,
+                                     check_level=level)
+                assert nan_allclose(vals, refs1d, rtol=0, atol=0)
+                vals = sampler.sample(raster_points, mode=mode,
+                                      check_level=level)
+                assert nan_allclose(vals, refs, rtol=1e-12, atol=1e-12)
+
+        self.assertEqual(validate_check_level('full'), 'full')
+        self.assertEqual(validate_check_level(None), 'sampled')
+        self.assertRaises(InaSAFEError, validate_check_level, 'some')
+        self.assertRaises(InaSAFEError, interpolate2d, x, y, A, points,
+                          check_level='all')
+
+        # Values outside their neighbours are caught
+        lower = numpy.array([0.0, 1.0, numpy.nan])
+        upper = numpy.array([1.0, 1.0, 2.0])
+        check_interpolated_values(numpy.array([0.5, 1.0, 2.0]),
+                                  [lower, upper])
+        check_interpolated_values(numpy.array([0.5, numpy.nan, 2.0]),
+                                  [lower, upper])
+        self.assertRaises(InaSAFEError, check_interpolated_values,
+                          numpy.array([0.5, 1.1, 2.0]), [lower, upper])
+        self.assertRaises(InaSAFEError, check_interpolated_values,
+                          numpy.array([-0.1, 1.0, 2.0]), [lower, upper])
+        check_grid_maximum(numpy.array([0.5, 1.0]), A)
+        self.assertRaises(InaSAFEError, check_grid_maximum,
+                          numpy.array([0.5, 10.0]), A)
+
+        # Callers choose the exception, e.g. RuntimeError in interpolate1d
+        self.assertRaises(ValueError, check_interpolated_values,
+                          numpy.array([0.5, 1.1, 2.0]), [lower, upper],
+                          exception=ValueError)
+        self.assertRaises(ValueError, check_grid_maximum,
+                          numpy.array([0.5, 10.0]), A, exception=ValueError)
+
     # -----------------------
     # 1D interpolation tests
     # -----------------------
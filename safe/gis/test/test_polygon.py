@@ -4,7 +4,7 @@ import numpy
 
 from safe.storage.vector import Vector
 from safe.storage.raster import Raster
-from safe.storage.geometry import Polygon
+from safe.storage.geometry import Polygon, pack_geometry
 from safe.gis.polygon import (
     separate_points_by_polygon,
     is_inside_polygon,
@@ -14,16 +14,20 @@ from safe.gis.polygon import (
     inside_polygon,
     clip_lines_by_polygon,
     clip_lines_by_polygons,
+    clip_lines_by_grid,
     in_and_outside_polygon,
     intersection,
     join_line_segments,
     clip_line_by_polygon,
     clip_grid_by_polygons,
+    rasterize_polygons,
+    assign_points_to_polygons,
     populate_polygon,
     generate_random_points_in_bbox,
     PolygonInputError,
     line_dictionary_to_geometry)
-from safe.gis.numerics import ensure_numeric
+from safe.gis.numerics import (
+    ensure_numeric, grid_to_points, geotransform_to_axes)
 
 # For polygon testing
 TEST_LINES = [numpy.array([[122.231021, -8.626557],
@@ -614,6 +618,13 @@ TEST_POLYGON = numpy.array([[122.229086, -8.624406],
                             [122.229086, -8.624406]])
 
 
+def line_length(line):
+    """Length of polyline given as Nx2 array
+    """
+    return numpy.sum(numpy.sqrt(numpy.sum(numpy.diff(line, axis=0) ** 2,
+                                          axis=1)))
+
+
 class TestPolygon(unittest.TestCase):
     def setUp(self):
         pass
@@ -1120,6 +1131,103 @@ class TestPolygon(unittest.TestCase):
         assert numpy.allclose(ins_p, [1, 2, 3])
         assert numpy.allclose(out_p, [0, 4, 5])
 
+    def test_separate_points_by_polygon_slabs(self):
+        """Band based polygon clipping agrees with numpy version
+        """
+
+        # Polygon with a notch and points on its boundary
+        polygon = [[0, 0], [1, 0], [0.5, -1], [2, -1], [2, 1], [0, 1]]
+        points = [[0.5, 1.4], [0.5, 0.5], [1, -0.5], [1.5, 0],
+                  [0.5, 1.5], [0.5, -0.5], [0, 0.5], [2, 1], [0.75, -0.5]]
+
+        for closed in [True, False, None]:
+            ins_r, out_r = separate_points_by_polygon(points, polygon,
+                                                      closed=closed)
+            ins_s, out_s = separate_points_by_polygon(points, polygon,
+                                                      closed=closed,
+                                                      use_slabs=True)
+            assert numpy.alltrue(ins_r == ins_s)
+            assert numpy.alltrue(out_r == out_s)
+
+        # Convoluted polygon with many vertices and random points
+        N = 2000
+        angles = numpy.linspace(0, 2 * numpy.pi, N, endpoint=False)
+        radii = 1 + 0.3 * numpy.sin(37 * angles)
+        polygon = numpy.zeros((N, 2))
+        polygon[:, 0] = radii * numpy.cos(angles)
+        polygon[:, 1] = radii * numpy.sin(angles)
+        points = generate_random_points_in_bbox(polygon, 2000, seed=17)
+        points = numpy.concatenate((points, polygon[:100]))
+
+        ins_r, out_r = separate_points_by_polygon(points, polygon)
+        ins_s, out_s = separate_points_by_polygon(points, polygon,
+                                                  use_slabs=True)
+        assert numpy.alltrue(ins_r == ins_s)
+        assert numpy.alltrue(out_r == out_s)
+
+        # Chunked version gives the same result
+        ins_c, out_c = separate_points_by_polygon(points, polygon,
+                                                  use_slabs=True,
+                                                  chunk_size=500)
+        assert numpy.alltrue(ins_r == ins_c)
+        assert numpy.alltrue(out_r == out_c)
+
+    def check_separate_points_by_polygon_boundary(self, N):
+        """Compare the fused boundary detection with a separate pass
+
+        :param N: Number of points along each side of the grid.
+        :type N: int
+        """
+
+        # Grid of points
+        axis = numpy.linspace(0, 1, N)
+        points, _ = grid_to_points(numpy.zeros((N, N)), axis, axis)
+
+        # Polygon with 200 vertices and a vertical edge through grid points
+        angles = numpy.linspace(0, 2 * numpy.pi, 198, endpoint=False)
+        polygon = numpy.zeros((200, 2))
+        polygon[:198, 0] = 0.5 + 0.4 * numpy.cos(angles)
+        polygon[:198, 1] = 0.5 + 0.4 * numpy.sin(angles)
+        polygon[198] = [axis[N // 20], axis[N // 20]]
+        polygon[199] = [axis[N // 20], axis[4 * N // 5]]
+
+        for closed in [True, False]:
+            # Reference: Undefined boundary followed by separate pass
+            inside, _ = separate_points_by_polygon(
+                points, polygon, closed=None, check_input=False)
+            reference = numpy.zeros(len(points), dtype=bool)
+            reference[inside] = True
+            for i in range(len(polygon)):
+                edge = [polygon[i], polygon[(i + 1) % len(polygon)]]
+                on_edge = point_on_line(points, edge, rtol=0.0, atol=0.0)
+                reference[on_edge] = closed
+
+            # Fused algorithm
+            inside, _ = separate_points_by_polygon(
+                points, polygon, closed=closed, check_input=False)
+
+            assert numpy.alltrue(inside == numpy.where(reference)[0])
+
+    def test_separate_points_by_polygon_boundary_grid(self):
+        """Boundary detection is fused with the point in polygon sweep
+
+        Compares the fused algorithm against detecting boundary points with
+        a separate pass of point_on_line over all edges on a grid.
+        """
+
+        self.check_separate_points_by_polygon_boundary(200)
+
+    def test_separate_points_by_polygon_boundary_benchmark(self):
+        """Boundary detection on a large grid of points
+
+        Same comparison as test_separate_points_by_polygon_boundary_grid on
+        a grid of 250000 points, to be timed with the slow tests.
+        """
+
+        self.check_separate_points_by_polygon_boundary(500)
+
+    test_separate_points_by_polygon_boundary_benchmark.slow = True
+
     def test_polygon_clipping_error_handling(self):
         """Polygon clipping checks input as expected"""
 
@@ -1210,12 +1318,14 @@ class TestPolygon(unittest.TestCase):
         values = [{'val': float(x)} for x in values]
 
         # Check correctness (from QGIS inspection)
-        assert numpy.allclose(points[0], [106.7775, -6.2205])
-        assert numpy.allclose(points[3], [106.7865, -6.2295])
-        assert numpy.allclose(points[9], [106.7925, -6.2355])
-        assert values[0]['val'] == 32
-        assert values[3]['val'] == 65
-        assert values[9]['val'] == 87
+        # Points are listed in grid order
+        assert len(points) == 12
+        assert numpy.allclose(points[1], [106.7775, -6.2205])
+        assert numpy.allclose(points[8], [106.7865, -6.2295])
+        assert numpy.allclose(points[11], [106.7925, -6.2355])
+        assert values[1]['val'] == 32
+        assert values[8]['val'] == 65
+        assert values[11]['val'] == 87
 
         # Optionally store output for inspection with QGIS (this one is nice)
         if False:
@@ -1227,6 +1337,46 @@ class TestPolygon(unittest.TestCase):
             Vector(geometry=points,
                    data=values).write_to_file('test_points.shp')
 
+    def test_rasterize_polygons(self):
+        """Polygon ids can be burned into grid aligned with raster
+        """
+
+        # Grid of 20 x 10 cells with cell centers at 0.25, 0.75, ...
+        nx = 20
+        ny = 10
+        geotransform = (0.0, 0.5, 0, 5.0, 0, -0.5)
+
+        # Overlapping polygons with edges and vertices on cell centers
+        polygons = [numpy.array([[0.25, 0.25], [4.75, 0.25], [4.75, 2.25],
+                                 [0.25, 2.25]]),
+                    Polygon(outer_ring=numpy.array([[3.0, 1.0], [9.0, 1.0],
+                                                    [6.25, 4.75]]),
+                            inner_rings=[numpy.array([[5.75, 1.75],
+                                                      [6.75, 1.75],
+                                                      [6.25, 2.75]])])]
+
+        x, y = geotransform_to_axes(geotransform, nx, ny)
+        points, _ = grid_to_points(numpy.zeros((ny, nx)), x, y)
+
+        for closed in [True, False]:
+            labels = rasterize_polygons(polygons, geotransform, nx, ny,
+                                        closed=closed)
+            assert labels.shape == (ny, nx)
+
+            # Same as clipping grid points by polygons
+            reference = assign_points_to_polygons(points, polygons,
+                                                  closed=closed)
+            assert numpy.alltrue(labels.reshape(-1) == reference)
+
+        # First row is the northernmost
+        labels = rasterize_polygons(polygons, geotransform, nx, ny)
+        assert labels[ny - 1, 0] == 0
+        assert labels[0, 0] == -1
+        assert labels[ny - 1, 9] == 0
+        assert labels[ny - 1, 10] == -1
+        assert labels[2, 12] == 1
+        assert labels[5, 12] == -1  # In hole
+
     def test_populate_polygon(self):
         """Polygon can be populated by random points
         """
@@ -1583,6 +1733,104 @@ class TestPolygon(unittest.TestCase):
 
     test_clip_points_by_polygons_with_holes.slow = True
 
+    def test_assign_points_to_polygons(self):
+        """Points can be assigned to multiple (overlapping) polygons
+        """
+
+        # Two overlapping squares and one far away
+        polygons = [numpy.array([[0, 0], [2, 0], [2, 2], [0, 2]]),
+                    numpy.array([[1, 1], [3, 1], [3, 3], [1, 3]]),
+                    numpy.array([[10, 10], [11, 10], [11, 11], [10, 11]])]
+        points = [[0.5, 0.5], [1.5, 1.5], [2.5, 2.5], [5, 5],
+                  [10.5, 10.5], [2, 1.5]]
+
+        polygon_ids = assign_points_to_polygons(points, polygons)
+        assert numpy.alltrue(polygon_ids == [0, 0, 1, -1, 2, 0])
+
+        polygon_ids = assign_points_to_polygons(points, polygons,
+                                                first_polygon_wins=False)
+        assert numpy.alltrue(polygon_ids == [0, 1, 1, -1, 2, 1])
+
+        # Points on the boundary
+        polygon_ids = assign_points_to_polygons(points, polygons,
+                                                closed=False)
+        assert numpy.alltrue(polygon_ids == [0, 0, 1, -1, 2, 1])
+
+        # No points
+        polygon_ids = assign_points_to_polygons(numpy.zeros((0, 2)),
+                                                polygons)
+        assert len(polygon_ids) == 0
+
+    def test_assign_points_to_polygons_with_holes(self):
+        """Assigning points to polygons agrees with in_and_outside_polygon
+        """
+
+        # Define an outer ring
+        outer_ring = numpy.array([[106.79, -6.233],
+                                  [106.80, -6.24],
+                                  [106.78, -6.23],
+                                  [106.77, -6.21],
+                                  [106.79, -6.233]])
+
+        # Define inner rings
+        inner_rings = [numpy.array([[106.77827, -6.2252],
+                                    [106.77775, -6.22378],
+                                    [106.78, -6.22311],
+                                    [106.78017, -6.22530],
+                                    [106.77827, -6.2252]]),
+                       numpy.array([[106.78652, -6.23215],
+                                    [106.78642, -6.23075],
+                                    [106.78746, -6.23143],
+                                    [106.78831, -6.23307],
+                                    [106.78652, -6.23215]])]
+        polygons = [Polygon(outer_ring=outer_ring, inner_rings=inner_rings),
+                    Polygon(outer_ring=inner_rings[0])]
+
+        # Make some test points
+        points = generate_random_points_in_bbox(outer_ring, 1000, seed=13)
+
+        polygon_ids = assign_points_to_polygons(points, polygons)
+
+        inside, outside = in_and_outside_polygon(points, outer_ring,
+                                                 holes=inner_rings)
+        in_hole = inside_polygon(points, inner_rings[0])
+        assert numpy.alltrue(polygon_ids[inside] == 0)
+        assert numpy.alltrue(polygon_ids[in_hole] == 1)
+        assert numpy.sum(polygon_ids == -1) == len(outside) - len(in_hole)
+
+    def test_packed_polygons(self):
+        """Packed polygons give the same results as lists of polygons
+        """
+
+        polygons = [numpy.array([[0.25, 0.25], [4.75, 0.25], [4.75, 2.25],
+                                 [0.25, 2.25]]),
+                    Polygon(outer_ring=numpy.array([[3.0, 1.0], [9.0, 1.0],
+                                                    [6.25, 4.75]]),
+                            inner_rings=[numpy.array([[5.75, 1.75],
+                                                      [6.75, 1.75],
+                                                      [6.25, 2.75]])]),
+                    numpy.array([[20.0, 20.0], [21.0, 20.0], [21.0, 21.0]])]
+        packed = pack_geometry(polygons)
+        assert len(packed) == 3
+        assert numpy.allclose(packed.bounding_boxes[1], [3.0, 1.0, 9.0, 4.75])
+        assert numpy.alltrue(packed.intersects_bbox([0, 0, 10, 10]) ==
+                             [True, True, False])
+
+        bbox_corners = numpy.array([[0, 0], [10, 5]])
+        points = generate_random_points_in_bbox(bbox_corners, 1000, seed=17)
+        for closed in [True, False]:
+            reference = assign_points_to_polygons(points, polygons,
+                                                  closed=closed)
+            polygon_ids = assign_points_to_polygons(points, packed,
+                                                    closed=closed)
+            assert numpy.alltrue(polygon_ids == reference)
+            assert numpy.sum(reference == 1) > 0
+
+        geotransform = (0.0, 0.5, 0, 5.0, 0, -0.5)
+        reference = rasterize_polygons(polygons, geotransform, 20, 10)
+        labels = rasterize_polygons(packed, geotransform, 20, 10)
+        assert numpy.alltrue(labels == reference)
+
     def test_intersection1(self):
         """Intersection of two simple lines works
         """
@@ -2098,6 +2346,148 @@ class TestPolygon(unittest.TestCase):
                               [[0.3, 0.2],
                                [0.31666667, 0.31666667]])
 
+    def test_clip_lines_by_multiple_polygons_first_wins(self):
+        """Lines are only clipped by polygons they are not already inside
+        """
+
+        polygons = [[[0, 0], [1, 0], [1, 1], [0, 1]],  # Unit square
+                    [[1, 0], [3, 0], [2, 1]],  # Adjacent triangle
+                    [[-1, -1], [5, -1], [5, 3], [5, 3]],  # Overlapping
+                    [[-1, -1], [6, -1], [6, 6], [6, 6]]]  # Cover the others
+
+        input_lines = [[[0, 0.5], [4, 0.5]],
+                       [[2, 0], [2, 5]],
+                       [[0, 0], [5, 5]],
+                       [[10, 10], [30, 10]],
+                       [[-1, 0.5], [0.5, 0.5], [2.5, 3]],
+                       [[0.3, 0.2], [0.7, 3], [1.0, 1.9]]]
+
+        lines_covered = clip_lines_by_polygons(input_lines, polygons,
+                                               first_polygon_wins=True)
+        assert len(lines_covered) == len(polygons)
+
+        # Reference: clip what is left of the lines by one polygon at a time
+        remaining = dict((k, [numpy.array(line, dtype=float)])
+                         for k, line in enumerate(input_lines))
+        for i, polygon in enumerate(polygons):
+            for k in remaining.keys():
+                inside_length = 0
+                outside = []
+                for line in remaining[k]:
+                    inside, outside_lines = clip_line_by_polygon(line,
+                                                                 polygon)
+                    inside_length += sum([line_length(x) for x in inside])
+                    outside.extend(outside_lines)
+                remaining[k] = outside
+
+                length = sum([line_length(x) for x in lines_covered[i][k]])
+                assert numpy.allclose(length, inside_length)
+
+        # Line 0 is split between all polygons
+        assert numpy.allclose(lines_covered[0][0], [[[0, 0.5], [1, 0.5]]])
+        assert numpy.allclose(lines_covered[1][0], [[[1.5, 0.5], [2.5, 0.5]]])
+        assert numpy.allclose(lines_covered[2][0], [[[1.25, 0.5], [1.5, 0.5]],
+                                                    [[2.5, 0.5], [4, 0.5]]])
+        assert numpy.allclose(lines_covered[3][0], [[[1, 0.5], [1.25, 0.5]]])
+
+        # Line 3 is outside everything
+        for lines in lines_covered:
+            assert len(lines) == len(input_lines)
+            assert lines[3] == []
+
+    def test_clip_lines_by_polygons_with_holes(self):
+        """Lines inside holes are not covered by polygon
+        """
+
+        outer_ring = numpy.array([[0, 0], [4, 0], [4, 4], [0, 4]])
+        inner_ring = numpy.array([[1, 1], [3, 1], [3, 3], [1, 3]])
+        polygons = [Polygon(outer_ring=outer_ring,
+                            inner_rings=[inner_ring]),
+                    numpy.array([[10, 10], [11, 10], [11, 11]])]
+        input_lines = [[[-1, 2], [5, 2]],
+                       [[2, 2], [2, 2.5]],
+                       [[0.5, 0.5], [3.5, 0.5]]]
+
+        for geometry in [polygons, pack_geometry(polygons)]:
+            lines_covered = clip_lines_by_polygons(input_lines, geometry)
+            assert len(lines_covered) == 2
+            assert lines_covered[1] == {0: [], 1: [], 2: []}
+            assert lines_covered[0][1] == []
+            assert numpy.allclose(lines_covered[0][0],
+                                  [[[0, 2], [1, 2]], [[3, 2], [4, 2]]])
+            assert numpy.allclose(lines_covered[0][2],
+                                  [[[0.5, 0.5], [3.5, 0.5]]])
+
+    def test_clip_lines_by_grid(self):
+        """Lines are clipped by the cells of a labelled grid
+        """
+
+        # 3x4 grid of unit cells with west edge at x=0 and north edge at y=3
+        labels = numpy.array([[0, 0, 1, 1],
+                              [0, 2, 2, 1],
+                              [-1, -1, 2, 2]])
+        geotransform = (0.0, 1.0, 0, 3.0, 0, -1.0)
+        input_lines = [[[-1, 2.5], [5, 2.5]],
+                       [[0.5, 0.5], [3.5, 2.5], [3.5, 0.5]],
+                       [[10, 10], [11, 11]],
+                       [[1.2, 0.8], [1.2, 1.5], [2.7, 1.5]]]
+
+        lines_covered = clip_lines_by_grid(input_lines, labels, geotransform)
+        assert sorted(lines_covered.keys()) == [-1, 0, 1, 2]
+
+        # Line 0 runs through the first row and outside the grid.
+        # Clipped lines have a vertex where they cross grid lines.
+        assert numpy.allclose(lines_covered[-1][0],
+                              [[[-1, 2.5], [0, 2.5]], [[4, 2.5], [5, 2.5]]])
+        assert numpy.allclose(lines_covered[0][0],
+                              [[[0, 2.5], [1, 2.5], [2, 2.5]]])
+        assert numpy.allclose(lines_covered[1][0],
+                              [[[2, 2.5], [3, 2.5], [4, 2.5]]])
+        assert numpy.allclose(lines_covered[-1][2], [[[10, 10], [11, 11]]])
+
+        # Vertices are kept in the clipped lines
+        assert len(lines_covered[1][1]) == 1
+        assert [3.5, 2.5] in lines_covered[1][1][0].tolist()
+
+        # Reference: clip lines by the polygon of each cell
+        cells = []
+        cell_labels = []
+        for row in range(3):
+            for col in range(4):
+                cells.append([[col, 3 - row], [col + 1, 3 - row],
+                              [col + 1, 2 - row], [col, 2 - row]])
+                cell_labels.append(labels[row, col])
+        reference = clip_lines_by_polygons(input_lines, cells)
+
+        for split_cells in [False, True]:
+            lines_covered = clip_lines_by_grid(input_lines, labels,
+                                               geotransform,
+                                               split_cells=split_cells)
+            for label in [0, 1, 2]:
+                for k in range(len(input_lines)):
+                    length = sum([line_length(x) for x in
+                                  lines_covered[label].get(k, [])])
+                    reference_length = 0
+                    number_of_cells = 0
+                    for i, cell in enumerate(cells):
+                        if cell_labels[i] == label and reference[i][k]:
+                            reference_length += sum(
+                                [line_length(x) for x in reference[i][k]])
+                            number_of_cells += 1
+                    assert numpy.allclose(length, reference_length)
+
+                    if split_cells and number_of_cells > 0:
+                        # One line per cell crossed
+                        assert (len(lines_covered[label][k]) ==
+                                number_of_cells)
+
+        # Lines are joined across cells with the same label
+        lines_covered = clip_lines_by_grid(input_lines, labels, geotransform)
+        assert numpy.allclose(lines_covered[2][3],
+                              [[[1.2, 1], [1.2, 1.5], [2, 1.5], [2.7, 1.5]]])
+        assert numpy.allclose(lines_covered[-1][3], [[[1.2, 0.8], [1.2, 1]]])
+        assert 3 not in lines_covered[0]
+
     def test_clip_lines_by_polygon_real_data(self):
         """Real roads are clipped by complex polygon
         """
@@ -21,6 +21,7 @@ import numpy
 import logging
 
 from socket import gethostname
+from collections import OrderedDict
 import getpass
 import platform
 from datetime import datetime
@@ -61,7 +62,7 @@ from safe.common.utilities import get_non_conflicting_attribute_name
 from safe.utilities.utilities import get_error_message
 from safe.utilities.memory_checker import check_memory_usage
 from safe.utilities.i18n import tr
-from safe.utilities.clipper import clip_layer
+from safe.utilities.clipper import clip_layers
 from safe.utilities.gis import (
     convert_to_safe_layer,
     get_wgs84_resolution,
@@ -149,6 +150,10 @@ class ImpactFunction(object):
         self._show_intermediate_layers = False
         # Force memory.
         self._force_memory = False
+        # Store raster data in temporary files rather than in memory.
+        self._use_memmap = False
+        # Floating point type of raster data read for the analysis.
+        self._raster_dtype = numpy.float64
         # Layer produced by the impact function
         self._impact = None
         # The question of the impact function
@@ -348,7 +353,11 @@ class ImpactFunction(object):
             self._hazard = layer
         else:
             if self.function_type() == 'old-style':
-                self._hazard = SafeLayer(convert_to_safe_layer(layer))
+                self._hazard = SafeLayer(
+                    convert_to_safe_layer(
+                        layer,
+                        dtype=self.raster_dtype,
+                        memmap=self.use_memmap))
             elif self.function_type() == 'qgis2.0':
                 # convert for new style impact function
                 self._hazard = SafeLayer(layer)
@@ -383,7 +392,11 @@ class ImpactFunction(object):
             self._exposure = layer
         else:
             if self.function_type() == 'old-style':
-                self._exposure = SafeLayer(convert_to_safe_layer(layer))
+                self._exposure = SafeLayer(
+                    convert_to_safe_layer(
+                        layer,
+                        dtype=self.raster_dtype,
+                        memmap=self.use_memmap))
             elif self.function_type() == 'qgis2.0':
                 # convert for new style impact function
                 self._exposure = SafeLayer(layer)
@@ -516,6 +529,56 @@ class ImpactFunction(object):
         else:
             raise Exception('force_memory is not a boolean.')
 
+    @property
+    def use_memmap(self):
+        """Property if raster data is memory mapped to temporary files.
+
+        :return: The value.
+        :rtype: bool
+        """
+        return self._use_memmap
+
+    @use_memmap.setter
+    def use_memmap(self, flag):
+        """Setter if raster data is memory mapped to temporary files.
+
+        Impact functions can opt into this for national scale raster
+        analyses so that they run at disk speed rather than running out
+        of memory. It applies to layers converted after it is set.
+
+        :param flag: The value.
+        :type flag: bool
+        """
+        if isinstance(flag, bool):
+            self._use_memmap = flag
+        else:
+            raise Exception('use_memmap is not a boolean.')
+
+    @property
+    def raster_dtype(self):
+        """Property for the floating point type of raster data.
+
+        :return: The value.
+        :rtype: type
+        """
+        return self._raster_dtype
+
+    @raster_dtype.setter
+    def raster_dtype(self, dtype):
+        """Setter for the floating point type of raster data.
+
+        Impact functions can use numpy.float32 to halve the memory used by
+        their raster layers, or None to keep the type of the files, see
+        class Raster. It applies to layers converted after it is set.
+
+        :param dtype: The value.
+        :type dtype: type
+        """
+        if dtype is None or numpy.issubdtype(dtype, numpy.floating):
+            self._raster_dtype = dtype
+        else:
+            raise Exception('raster_dtype is not a floating point type.')
+
     @property
     def impact(self):
         """Property for the impact layer generated by the analysis.
@@ -1220,7 +1283,9 @@ class ImpactFunction(object):
         clipped and re-sampled if needed, and in the EPSG:4326 geographic
         coordinate reference system.
 
-        :returns: The clipped hazard and exposure layers.
+        :returns: The clipped hazard and exposure layers. Vector layers are
+            safe Vector layers held in memory if there is no aggregation
+            layer.
         :rtype: (QgsMapLayer, QgsMapLayer)
         """
 
@@ -1262,27 +1327,16 @@ class ImpactFunction(object):
         # the best resolution.
         title = tr('Preparing hazard data')
 
+        # Without an aggregation layer the clipped vector layers are only
+        # read by the impact function, so they can be kept in memory.
+        in_memory = self.aggregator is not None and self.aggregator.aoi_mode
+
         message = m.Message(
             m.Heading(title, **PROGRESS_UPDATE_STYLE),
             m.Paragraph(detail))
         send_dynamic_message(self, message)
-        try:
-            clipped_hazard = clip_layer(
-                layer=self.hazard.qgis_layer(),
-                extent=adjusted_geo_extent,
-                cell_size=cell_size,
-                hard_clip_flag=self.clip_hard)
-        except CallGDALError, e:
-            raise e
-        except IOError, e:
-            raise e
 
         title = tr('Preparing exposure data')
-        # Find out what clipping behaviour we have - see #2210
-        settings = QSettings()
-        mode = settings.value(
-            'inasafe/analysis_extents_mode',
-            'HazardExposureView')
         if mode == 'HazardExposureView':
             detail = tr(
                 'Resampling and clipping the exposure layer to match '
@@ -1305,13 +1359,47 @@ class ImpactFunction(object):
             m.Paragraph(detail))
         send_dynamic_message(self, message)
 
-        clipped_exposure = clip_layer(
-            layer=self.exposure.qgis_layer(),
-            extent=adjusted_geo_extent,
-            cell_size=cell_size,
-            extra_keywords=extra_exposure_keywords,
-            hard_clip_flag=self.clip_hard)
-        return clipped_hazard, clipped_exposure
+        # A raster layer is warped in a worker thread while the other layer
+        # is clipped, see clip_layers
+        jobs = OrderedDict([
+            ('hazard', {
+                'layer': self.hazard.qgis_layer(),
+                'extent': adjusted_geo_extent,
+                'cell_size': cell_size,
+                'hard_clip_flag': self.clip_hard,
+                'in_memory': in_memory}),
+            ('exposure', {
+                'layer': self.exposure.qgis_layer(),
+                'extent': adjusted_geo_extent,
+                'cell_size': cell_size,
+                'extra_keywords': extra_exposure_keywords,
+                'hard_clip_flag': self.clip_hard,
+                'in_memory': in_memory})
+        ])
+        titles = {
+            'hazard': tr('Hazard data prepared'),
+            'exposure': tr('Exposure data prepared')
+        }
+        clipped_layers = {}
+        try:
+            for name, clipped_layer, seconds in clip_layers(jobs):
+                clipped_layers[name] = clipped_layer
+                self.provenance.append_step(
+                    'Clipping Step',
+                    'The %s layer was clipped in %.2f seconds.' % (
+                        name, seconds),
+                    data={'layer': name, 'seconds': seconds})
+                message = m.Message(
+                    m.Heading(titles[name], **PROGRESS_UPDATE_STYLE),
+                    m.Paragraph(tr(
+                        'Clipping took %.2f seconds.') % seconds))
+                send_dynamic_message(self, message)
+        except CallGDALError, e:
+            raise e
+        except IOError, e:
+            raise e
+
+        return clipped_layers['hazard'], clipped_layers['exposure']
 
     def _setup_aggregator(self):
         """Create an aggregator for this analysis run."""
@@ -1,8 +1,12 @@
 # coding=utf-8
 
+import numpy
+from PyQt4.QtCore import QSettings
+
 from safe.common.exceptions import (
     MetadataLayerConstraintError)
 from safe.definitions import layer_mode_continuous, layer_geometry_raster
+from safe.engine.tiling import run_tiled
 from safe.impact_functions.base import ImpactFunction
 from safe.impact_functions.bases.layer_types.continuous_raster_exposure \
     import ContinuousRasterExposureMixin
@@ -22,6 +26,11 @@ class ContinuousRHContinuousRE(
     """Continuous Raster Hazarad, Continuous Raster Exposure base class.
 
     """
+    # Impact functions computing the impact cell by cell can run tile by
+    # tile by declaring a module level kernel and the reductions of its
+    # results, see safe.engine.tiling.run_tiled
+    tiled_kernel = None
+    tiled_reductions = None
 
     def __init__(self):
         """Constructor"""
@@ -36,6 +45,13 @@ class ContinuousRHContinuousRE(
         if not valid:
             raise MetadataLayerConstraintError()
 
+        # Tiled kernels sum in double precision, so the layers are read in
+        # single precision. They are kept in temporary files so that
+        # national grids do not run out of memory.
+        if self.tiled_kernel is not None:
+            self.raster_dtype = numpy.float32
+            self.use_memmap = True
+
     @ImpactFunction.hazard.setter
     # pylint: disable=W0221
     def hazard(self, value):
@@ -45,3 +61,31 @@ class ContinuousRHContinuousRE(
     # pylint: disable=W0221
     def exposure(self, value):
         ImpactFunction.exposure.fset(self, value)
+
+    def run_tiled(self, *args):
+        """Run the tiled kernel on the hazard and exposure layers.
+
+        The number of worker processes is read from the setting
+        inasafe/tiled_processes. The default 1 computes the tiles within
+        QGIS, 0 uses all the CPUs.
+
+        The impact grid is returned as an array and is not written to a
+        GeoTIFF tile by tile. The impact functions need the whole grid for
+        their zero impact checks and the classes of their styles.
+
+        :param args: Extra arguments of the kernel.
+        :type args: tuple
+
+        :returns: The impact grid and the reduced results of the tiles.
+        :rtype: (numpy.ndarray, dict)
+        """
+        settings = QSettings()
+        processes = settings.value('inasafe/tiled_processes', 1, type=int)
+        return run_tiled(
+            self.tiled_kernel,
+            self.hazard.layer,
+            self.exposure.layer,
+            self.tiled_reductions,
+            args=args,
+            exposure_scaling=True,
+            processes=processes)
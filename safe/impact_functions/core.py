@@ -29,6 +29,7 @@ from math import ceil
 import numpy
 from collections import OrderedDict
 
+from safe.common.utilities import verify
 from safe.defaults import default_minimum_needs
 from safe.gui.tools.minimum_needs.needs_profile import filter_needs_parameters
 import safe.messaging as m
@@ -147,6 +148,218 @@ def has_no_data(layer_data):
     return numpy.isnan(numpy.sum(layer_data))
 
 
+def _in_range(value, value_range, right=True):
+    """Determine whether a value falls in a range of classify_values.
+
+    :param value: A number.
+    :type value: float
+
+    :param value_range: A range [minimum, maximum], see classify_values.
+    :type value_range: list
+
+    :param right: Whether the maximum rather than the minimum of a range
+        is included in the range.
+    :type right: bool
+
+    :returns: True if the value falls in the range.
+    :rtype: bool
+    """
+    minimum, maximum = value_range
+    if minimum is not None and minimum == maximum:
+        return value == minimum
+    if right:
+        return ((minimum is None or minimum < value) and
+                (maximum is None or value <= maximum))
+    else:
+        return ((minimum is None or minimum <= value) and
+                (maximum is None or value < maximum))
+
+
+def classify_values(values, ranges, default=-1, right=True):
+    """Classify values by ranges.
+
+    The ranges follow the conventions of the raster impact functions:
+
+    * [a, a]: the value must be equal to a.
+    * [None, b]: the value must be less than or equal to b.
+    * [a, None]: the value must be greater than a.
+    * [a, b]: the value must be between a excluded and b included.
+
+    If right is False the minimum rather than the maximum of a range is
+    included, e.g. [a, b] means a <= value < b.
+
+    When ranges overlap the first range in which a value falls is used.
+    All values are classified with one call to numpy.searchsorted.
+
+    :param values: Values to classify. Nan values get the default class.
+    :type values: numpy.ndarray, list
+
+    :param ranges: Ranges given either as a dictionary mapping class id
+        to range, e.g. an OrderedDict, or a list of (class id, range) pairs.
+    :type ranges: OrderedDict, list
+
+    :param default: The class of values that fall in none of the ranges.
+    :type default: int
+
+    :param right: Whether the maximum rather than the minimum of a range
+        is included in the range.
+    :type right: bool
+
+    :returns: Array of class ids with the same shape as values.
+    :rtype: numpy.ndarray
+    """
+    if hasattr(ranges, 'items'):
+        ranges = ranges.items()
+    values = numpy.asarray(values, dtype=numpy.float)
+
+    # Values are only compared with the bounds of the ranges, so all values
+    # strictly between two consecutive bounds fall in the same ranges.
+    bounds = sorted(set(
+        bound for _, value_range in ranges for bound in value_range
+        if bound is not None))
+
+    # A representative value for each interval between bounds and for each
+    # bound itself in the order
+    # (-inf, b0), b0, (b0, b1), b1, ..., bn, (bn, inf)
+    representatives = []
+    for i, bound in enumerate(bounds):
+        if i == 0:
+            representatives.append(bound - max(1.0, abs(bound)))
+        else:
+            representatives.append((bounds[i - 1] + bound) / 2.0)
+        representatives.append(bound)
+    if len(bounds) > 0:
+        representatives.append(bounds[-1] + max(1.0, abs(bounds[-1])))
+    else:
+        representatives.append(0.0)
+
+    table = numpy.zeros(len(representatives), dtype=numpy.int)
+    for i, representative in enumerate(representatives):
+        table[i] = default
+        for class_id, value_range in ranges:
+            if _in_range(representative, value_range, right=right):
+                table[i] = class_id
+                break
+
+    # Find the interval or bound of each value
+    bounds = numpy.array(bounds, dtype=numpy.float)
+    indices = numpy.searchsorted(bounds, values)
+    on_bound = numpy.zeros(values.shape, dtype=bool)
+    inside = indices < len(bounds)
+    on_bound[inside] = bounds[indices[inside]] == values[inside]
+
+    classes = table[2 * indices + on_bound]
+    classes[numpy.isnan(values)] = default
+    return classes
+
+
+def sum_per_interval(values, weights, lower, upper, out=None):
+    """Sum weights per interval of values in one pass.
+
+    Value v falls in interval i if lower[i] < v <= upper[i]. Intervals
+    must be sorted and must not overlap. The grids are processed in blocks
+    so only small temporary arrays are needed.
+
+    :param values: Values to bin, e.g. a hazard grid.
+    :type values: numpy.ndarray
+
+    :param weights: Weights with the same shape as values, e.g. an
+        exposure grid. Nan weights are not summed.
+    :type weights: numpy.ndarray
+
+    :param lower: Lower bound of each interval (excluded).
+    :type lower: list
+
+    :param upper: Upper bound of each interval (included).
+    :type upper: list
+
+    :param out: Optional array with the same shape as values. It receives
+        the weight where the value falls in one of the intervals and
+        0 elsewhere.
+    :type out: numpy.ndarray
+
+    :returns: The sum of the weights in each interval.
+    :rtype: numpy.ndarray
+    """
+    lower = numpy.asarray(lower, dtype=numpy.float)
+    upper = numpy.asarray(upper, dtype=numpy.float)
+    verify(numpy.all(lower < upper) and numpy.all(lower[1:] >= upper[:-1]),
+           'Intervals must be sorted and must not overlap')
+
+    values = numpy.reshape(values, -1)
+    weights = numpy.reshape(weights, -1)
+    if out is not None:
+        out = out.reshape(-1)
+
+    totals = numpy.zeros(len(upper))
+    block = 2 ** 20
+    for start in xrange(0, len(values), block):
+        block_values = values[start:start + block]
+        block_weights = weights[start:start + block]
+
+        # Index of the interval of each value
+        indices = numpy.searchsorted(upper, block_values)
+        inside = indices < len(upper)
+        inside[inside] = block_values[inside] > lower[indices[inside]]
+
+        if out is not None:
+            block_out = out[start:start + block]
+            block_out.fill(0)
+            numpy.copyto(block_out, block_weights, where=inside)
+
+        inside &= ~numpy.isnan(block_weights)
+        totals += numpy.bincount(indices[inside],
+                                 weights=block_weights[inside],
+                                 minlength=len(upper))
+    return totals
+
+
+def population_per_depth(depths, population, thresholds):
+    """Count the population between consecutive depth thresholds.
+
+    This is the tiled kernel of the raster flood and tsunami evacuation
+    impact functions, see safe.engine.tiling.run_tiled.
+
+    :param depths: Water depths, e.g. a tile of the hazard grid.
+    :type depths: numpy.ndarray
+
+    :param population: Population with the same shape as depths.
+    :type population: numpy.ndarray
+
+    :param thresholds: Sorted depth thresholds. People count in class i if
+        thresholds[i] <= depth < thresholds[i + 1] and in the last class if
+        the depth is at least the last threshold.
+    :type thresholds: list
+
+    :returns: The population in the last class, nan where either grid has
+        no data, and a dictionary of results with the population of each
+        class ('affected'), the total population ('total') and whether
+        there is missing data ('no_data').
+    :rtype: (numpy.ndarray, dict)
+    """
+    affected = numpy.zeros(len(thresholds))
+    for i, lower in enumerate(thresholds):
+        if i == len(thresholds) - 1:
+            people = numpy.where(depths >= lower, population, 0)
+        else:
+            upper = thresholds[i + 1]
+            people = numpy.where(
+                (depths >= lower) * (depths < upper), population, 0)
+        affected[i] = numpy.nansum(people, dtype=numpy.float64)
+
+    # Carry the no data values forward to the impact layer.
+    impact = people
+    impact[numpy.isnan(population)] = numpy.nan
+    impact[numpy.isnan(depths)] = numpy.nan
+
+    results = {
+        'affected': affected,
+        'total': numpy.nansum(population, dtype=numpy.float64),
+        'no_data': has_no_data(depths) or has_no_data(population)
+    }
+    return impact, results
+
+
 def get_key_for_value(value, value_map):
     """Obtain the key of a value from a value map.
 
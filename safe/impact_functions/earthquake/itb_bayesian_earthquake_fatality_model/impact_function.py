@@ -60,7 +60,9 @@ class ITBBayesianFatalityFunction(ITBFatalityFunction):
             # Threshold below which layer should be transparent
             ('tolerance', 0.01),
             ('calculate_displaced_people', True),
-            ('magnitude_bin', numpy.power(10, range(1, 6), dtype=float))
+            ('magnitude_bin', numpy.power(10, range(1, 6), dtype=float)),
+            # Percentiles of the fatalities over the posterior samples
+            ('ensemble_percentiles', [5, 50, 95])
         ])
 
     def compute_fatality_rate(self):
@@ -83,6 +85,32 @@ class ITBBayesianFatalityFunction(ITBFatalityFunction):
             fatality_rate[mmi] = fatality_[:, i][:, numpy.newaxis]
         return fatality_rate
 
+    def compute_fatality_percentiles(self, exposed_per_mmi, fatality_rate):
+        """Percentiles of total fatalities over the posterior samples.
+
+        The fatality rates of the model are samples of its posterior, so
+        the percentiles are taken over the total fatalities of all samples
+        rather than over random draws from them.
+
+        :param exposed_per_mmi: Number of people exposed at each MMI level
+            in mmi_range.
+        :type exposed_per_mmi: numpy.ndarray
+
+        :param fatality_rate: Fatality rate by MMI as returned by
+            compute_fatality_rate.
+        :type fatality_rate: dict
+
+        :returns: Total fatalities for each of the ensemble_percentiles.
+        :rtype: OrderedDict
+        """
+        mmi_range = self.hardcoded_parameters['mmi_range']
+        percentiles = self.hardcoded_parameters['ensemble_percentiles']
+        samples = numpy.hstack([fatality_rate[mmi] for mmi in mmi_range])
+        total_fatalities = numpy.dot(
+            samples, numpy.nan_to_num(numpy.asarray(exposed_per_mmi)))
+        values = numpy.percentile(total_fatalities, percentiles)
+        return OrderedDict(zip(percentiles, values))
+
     def compute_probability(self, total_fatalities):
         """ Compute probaility of fatality in each magnitude bin.
 
@@ -44,6 +44,19 @@ class TestITBBayesianEarthquakeFatalityFunction(unittest.TestCase):
         expected_result = numpy.array([20., 20., 20., 10., 10., 20.])
         numpy.testing.assert_allclose(expected_result, result, rtol=1.0e-3)
 
+    def test_compute_fatality_percentiles(self):
+        impact_function = ITBBayesianFatalityFunction.instance()
+        fatality_rate = impact_function.compute_fatality_rate()
+        exposed_per_mmi = numpy.array([0, 0, 0, 0, 0, 100, 200, 0, 0])
+        result = impact_function.compute_fatality_percentiles(
+            exposed_per_mmi, fatality_rate)
+        self.assertEqual([5, 50, 95], result.keys())
+        # Percentiles of the total fatalities of all posterior samples
+        total_fatalities = (
+            100 * fatality_rate[7] + 200 * fatality_rate[8]).ravel()
+        expected_result = numpy.percentile(total_fatalities, [5, 50, 95])
+        numpy.testing.assert_allclose(expected_result, result.values())
+
     def test_run(self):
         """TestITBBayesianEarthquakeFatalityFunction: Test running the IF."""
         # FIXME(Hyeuk): test requires more realistic hazard and population data
@@ -127,6 +140,16 @@ class TestITBBayesianEarthquakeFatalityFunction(unittest.TestCase):
             expected_result, result)
         self.assertEqual(expected_result, result, message)
 
+        # Percentiles over all the posterior samples
+        fatality_rate = impact_function.compute_fatality_rate()
+        expected_result = numpy.percentile(
+            200 * fatality_rate[8], [5, 50, 95])
+        result = impact_layer.get_keywords('fatalities_percentiles')
+        numpy.testing.assert_allclose(expected_result, result.values())
+        self.assertIn(
+            'Uncertainty of the number of fatalities',
+            impact_layer.get_keywords('impact_summary'))
+
     def test_filter(self):
         """TestITBBayesianEarthquakeFatalityFunction: Test filtering IF"""
         hazard_keywords = {
@@ -12,6 +12,7 @@ Contact : ole.moller.nielsen@gmail.com
 """
 import numpy
 import logging
+import operator
 
 from safe.common.utilities import OrderedDict
 from safe.impact_functions.bases.continuous_rh_continuous_re import \
@@ -19,7 +20,8 @@ from safe.impact_functions.bases.continuous_rh_continuous_re import \
 from safe.impact_functions.earthquake.itb_earthquake_fatality_model\
     .metadata_definitions import ITBFatalityMetadata
 from safe.impact_functions.core import (
-    population_rounding)
+    population_rounding,
+    sum_per_interval)
 from safe.storage.raster import Raster
 from safe.common.utilities import (
     humanize_class,
@@ -41,6 +43,34 @@ __date__ = '24/03/15'
 LOGGER = logging.getLogger('InaSAFE')
 
 
+def population_per_mmi(mmi, population, lower, upper):
+    """Count the population in each class of shaking intensity.
+
+    This is the tiled kernel of the impact function, see
+    safe.engine.tiling.run_tiled.
+
+    :param mmi: Shaking intensity, e.g. a tile of the hazard grid.
+    :type mmi: numpy.ndarray
+
+    :param population: Population with the same shape as mmi.
+    :type population: numpy.ndarray
+
+    :param lower: Lower bound of each class (excluded).
+    :type lower: list
+
+    :param upper: Upper bound of each class (included).
+    :type upper: list
+
+    :returns: The population in any of the classes and a dictionary of
+        results with the population of each class ('exposed_per_mmi').
+    :rtype: (numpy.ndarray, dict)
+    """
+    mask = numpy.zeros(population.shape, dtype=population.dtype)
+    exposed_per_mmi = sum_per_interval(
+        mmi, population, lower, upper, out=mask)
+    return mask, {'exposed_per_mmi': exposed_per_mmi}
+
+
 class ITBFatalityFunction(
         ContinuousRHContinuousRE,
         PopulationExposureReportMixin):
@@ -105,6 +135,8 @@ class ITBFatalityFunction(
     """
 
     _metadata = ITBFatalityMetadata()
+    tiled_kernel = staticmethod(population_per_mmi)
+    tiled_reductions = {'exposed_per_mmi': operator.add}
 
     def __init__(self):
         super(ITBFatalityFunction, self).__init__()
@@ -126,6 +158,7 @@ class ITBFatalityFunction(
             ('calculate_displaced_people', True)
         ])
         self.total_fatalities = None
+        self.fatalities_percentiles = None
 
     def compute_fatality_rate(self):
         """ITB method to compute fatality rate.
@@ -205,6 +238,32 @@ class ITBFatalityFunction(
         message.add(checklist)
         return message
 
+    def impact_summary(self):
+        """The impact summary with the uncertainty of the fatalities.
+
+        :returns: The impact summary.
+        :rtype: safe.messaging.Message
+        """
+        message = super(ITBFatalityFunction, self).impact_summary()
+        if self.fatalities_percentiles is None:
+            return message
+
+        table = m.Table(style_class='table table-condensed table-striped')
+        table.caption = None
+        row = m.Row()
+        row.add(m.Cell(tr('Uncertainty of the number of fatalities'),
+                       header=True))
+        row.add(m.Cell(''))
+        table.add(row)
+        for percentile, fatalities in self.fatalities_percentiles.items():
+            row = m.Row()
+            row.add(m.Cell(tr('%s%% percentile') % percentile, header=True))
+            row.add(m.Cell(
+                format_int(population_rounding(fatalities)), align='right'))
+            table.add(row)
+        message.add(table)
+        return message
+
     def notes(self):
         """Notes and caveats for the IF report.
 
@@ -259,6 +318,64 @@ class ITBFatalityFunction(
         """
         return None
 
+    def fatality_rate_ensemble(self, fatality_rate, size, random_state):
+        """Draw fatality rates for an ensemble of model realisations.
+
+        The ITB power model only estimates the expected fatality rate and
+        does not define its uncertainty (see caveat 3), so there is nothing
+        to draw from. Models with a distribution override this method.
+
+        :param fatality_rate: Fatality rate by MMI as returned by
+            compute_fatality_rate.
+        :type fatality_rate: dict
+
+        :param size: Number of draws.
+        :type size: int
+
+        :param random_state: Source of the random draws.
+        :type random_state: numpy.random.RandomState
+
+        :returns: Fatality rates with one row per draw and one column per
+            MMI level in mmi_range, or None if the model does not define
+            a distribution of its fatality rates.
+        :rtype: numpy.ndarray, None
+        """
+        return None
+
+    def compute_fatality_percentiles(self, exposed_per_mmi, fatality_rate):
+        """Percentiles of total fatalities over an ensemble of model draws.
+
+        All draws are sampled in one batch and the total fatalities of
+        every draw are a single matrix product with the number of people
+        exposed at each MMI level, so the grids are not visited again.
+        The draws are seeded with ensemble_seed, so the same input always
+        gives the same percentiles.
+
+        :param exposed_per_mmi: Number of people exposed at each MMI level
+            in mmi_range.
+        :type exposed_per_mmi: numpy.ndarray
+
+        :param fatality_rate: Fatality rate by MMI as returned by
+            compute_fatality_rate.
+        :type fatality_rate: dict
+
+        :returns: Total fatalities for each of the ensemble_percentiles or
+            None if the model does not define a distribution of its
+            fatality rates.
+        :rtype: OrderedDict, None
+        """
+        size = self.hardcoded_parameters['ensemble_size']
+        percentiles = self.hardcoded_parameters['ensemble_percentiles']
+        random_state = numpy.random.RandomState(
+            self.hardcoded_parameters['ensemble_seed'])
+        rates = self.fatality_rate_ensemble(fatality_rate, size, random_state)
+        if rates is None:
+            return None
+        total_fatalities = numpy.dot(
+            rates, numpy.nan_to_num(numpy.asarray(exposed_per_mmi)))
+        values = numpy.percentile(total_fatalities, percentiles)
+        return OrderedDict(zip(percentiles, values))
+
     def run(self):
         """Indonesian Earthquake Fatality Model."""
         self.validate()
@@ -271,28 +388,25 @@ class ITBFatalityFunction(
         displacement_rate = self.hardcoded_parameters['displacement_rate']
         fatality_rate = self.compute_fatality_rate()
 
-        # Extract data grids
-        hazard = self.hazard.layer.get_data()   # Ground Shaking
-        # Population Density
-        exposure = self.exposure.layer.get_data(scaling=True)
-
         # Calculate people affected by each MMI level
         mmi_range = self.hardcoded_parameters['mmi_range']
         number_of_exposed = {}
         number_of_displaced = {}
         number_of_fatalities = {}
+        # Count people affected by each shake level tile by tile over the
+        # grids. Cells where MMI is in class i are (mmi - step, mmi + step].
+        # The people in all classes are kept in mask for the map (#2235).
+        step = self.hardcoded_parameters['step']
+        mask, results = self.run_tiled(
+            [mmi - step for mmi in mmi_range],
+            [mmi + step for mmi in mmi_range])
+        exposed_per_mmi = results['exposed_per_mmi']
+
         # Calculate fatality rates for observed Intensity values (hazard
         # based on ITB power model
-        mask = numpy.zeros(hazard.shape)
-        for mmi in mmi_range:
-            # Identify cells where MMI is in class i and
-            # count people affected by this shake level
-            step = self.hardcoded_parameters['step']
-            mmi_matches = numpy.where(
-                (hazard > mmi - step) * (hazard <= mmi + step), exposure, 0)
-
+        for i, mmi in enumerate(mmi_range):
             # Calculate expected number of fatalities per level
-            exposed = numpy.nansum(mmi_matches)
+            exposed = exposed_per_mmi[i]
             fatalities = fatality_rate[mmi] * exposed
 
             # Calculate expected number of displaced people per level
@@ -304,10 +418,6 @@ class ITBFatalityFunction(
             # displacements = numpy.where(
             #    displacements > fatalities, displacements - fatalities, 0)
 
-            # Sum up numbers for map
-            # We need to use matrices here and not just numbers #2235
-            mask += mmi_matches   # Displaced
-
             # Generate text with result for this study
             # This is what is used in the real time system exposure table
             number_of_exposed[mmi] = exposed
@@ -326,6 +436,13 @@ class ITBFatalityFunction(
         else:
             prob_fatality_mag = None
 
+        # Uncertainty bands of the total fatalities
+        if 'ensemble_percentiles' in self.hardcoded_parameters:
+            self.fatalities_percentiles = self.compute_fatality_percentiles(
+                exposed_per_mmi, fatality_rate)
+        else:
+            self.fatalities_percentiles = None
+
         # Compute number of fatalities
         self.total_population = numpy.nansum(number_of_exposed.values())
         self.total_fatalities = numpy.median(total_fatalities_raw)
@@ -396,6 +513,7 @@ class ITBFatalityFunction(
             'legend_title': legend_title,
             'total_needs': total_needs,
             'prob_fatality_mag': prob_fatality_mag,
+            'fatalities_percentiles': self.fatalities_percentiles,
         }
 
         self.set_if_provenance()
@@ -53,6 +53,17 @@ class TestITBEarthquakeFatalityFunction(unittest.TestCase):
             self.assertAlmostEqual(
                 expected_result[item], result[item], places=4)
 
+    def test_compute_fatality_percentiles(self):
+        impact_function = ITBFatalityFunction.instance()
+        impact_function.hardcoded_parameters['ensemble_size'] = 1000
+        impact_function.hardcoded_parameters['ensemble_percentiles'] = [5, 95]
+        impact_function.hardcoded_parameters['ensemble_seed'] = 1
+        fatality_rate = impact_function.compute_fatality_rate()
+        exposed_per_mmi = numpy.array([0, 0, 0, 0, 0, 0, 200, 0, 0])
+        result = impact_function.compute_fatality_percentiles(
+            exposed_per_mmi, fatality_rate)
+        self.assertIsNone(result)
+
     def test_run(self):
         """TestITEarthquakeFatalityFunction: Test running the IF."""
         # FIXME(Hyeuk): test requires more realistic hazard and population data
@@ -137,6 +148,10 @@ class TestITBEarthquakeFatalityFunction(unittest.TestCase):
         result = impact_layer.get_keywords('prob_fatality_mag')
         self.assertEqual(expected_result, result)
 
+        # The ITB model does not define the uncertainty of its rates
+        result = impact_layer.get_keywords('fatalities_percentiles')
+        self.assertIsNone(result)
+
         self.assertEqual(numpy.nansum(impact_layer.data), 200)
 
     def test_filter(self):
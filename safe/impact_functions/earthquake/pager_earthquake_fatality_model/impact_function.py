@@ -67,7 +67,12 @@ class PAGFatalityFunction(ITBFatalityFunction):
             # Threshold below which layer should be transparent
             ('tolerance', 0.01),
             ('calculate_displaced_people', True),
-            ('magnitude_bin', numpy.power(10, range(1, 6), dtype=float))
+            ('magnitude_bin', numpy.power(10, range(1, 6), dtype=float)),
+            # Ensemble of model draws for the uncertainty of the fatalities.
+            # The seed is fixed so that reports do not change between runs.
+            ('ensemble_size', 10000),
+            ('ensemble_percentiles', [5, 50, 95]),
+            ('ensemble_seed', 1)
         ])
 
     def compute_fatality_rate(self):
@@ -84,6 +89,34 @@ class PAGFatalityFunction(ITBFatalityFunction):
             mmi, median=theta, sigma=beta) for mmi in mmi_range}
         return fatality_rate
 
+    def fatality_rate_ensemble(self, fatality_rate, size, random_state):
+        """Draw fatality rates with the lognormal uncertainty of the model.
+
+        Pager gives the uncertainty of the total fatalities as a lognormal
+        distribution with standard deviation Zeta, so each draw scales the
+        fatality rates by the same lognormal factor.
+
+        :param fatality_rate: Fatality rate by MMI as returned by
+            compute_fatality_rate.
+        :type fatality_rate: dict
+
+        :param size: Number of draws.
+        :type size: int
+
+        :param random_state: Source of the random draws.
+        :type random_state: numpy.random.RandomState
+
+        :returns: Fatality rates with one row per draw and one column per
+            MMI level in mmi_range.
+        :rtype: numpy.ndarray
+        """
+        mmi_range = self.hardcoded_parameters['mmi_range']
+        zeta = self.hardcoded_parameters['Zeta']
+        rates = numpy.array(
+            [fatality_rate[mmi] for mmi in mmi_range], dtype=numpy.float)
+        factors = numpy.exp(zeta * random_state.standard_normal((size, 1)))
+        return factors * rates.reshape(1, -1)
+
     def compute_probability(self, total_fatalities):
         """Pager method compute probaility of fatality in each magnitude bin.
 
@@ -15,6 +15,7 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
 import unittest
+import numpy
 
 from safe.test.utilities import test_data_path, get_qgis_app, clip_layers
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
@@ -53,6 +54,26 @@ class TestPagerEarthquakeFatalityFunction(unittest.TestCase):
             self.assertAlmostEqual(expected_result[item],
                                    result[item], places=4, msg=message)
 
+    def test_compute_fatality_percentiles(self):
+        impact_function = PAGFatalityFunction.instance()
+        impact_function.hardcoded_parameters['ensemble_seed'] = 1
+        impact_function.hardcoded_parameters['ensemble_size'] = 100000
+        fatality_rate = impact_function.compute_fatality_rate()
+        # Everybody is exposed to MMI 8
+        exposed_per_mmi = numpy.array([0, 0, 0, 0, 0, 0, 200, 0, 0])
+        result = impact_function.compute_fatality_percentiles(
+            exposed_per_mmi, fatality_rate)
+        self.assertEqual([5, 50, 95], result.keys())
+        # Total fatalities are lognormal with median 200 * rate(8)
+        zeta = impact_function.hardcoded_parameters['Zeta']
+        median = 200 * fatality_rate[8]
+        expected_result = [
+            median * numpy.exp(-1.6449 * zeta),
+            median,
+            median * numpy.exp(1.6449 * zeta)]
+        numpy.testing.assert_allclose(
+            expected_result, result.values(), rtol=0.05)
+
     def test_round_to_sum(self):
         impact_function = PAGFatalityFunction.instance()
         result = impact_function.round_to_sum([
@@ -171,6 +192,17 @@ class TestPagerEarthquakeFatalityFunction(unittest.TestCase):
             expected_result, result)
         self.assertEqual(expected_result, result, message)
 
+        # The uncertainty bands are the same for every run and reported
+        result = impact_layer.get_keywords('fatalities_percentiles')
+        self.assertEqual([5, 50, 95], result.keys())
+        impact_function.run()
+        self.assertEqual(
+            result,
+            impact_function.impact.get_keywords('fatalities_percentiles'))
+        self.assertIn(
+            'Uncertainty of the number of fatalities',
+            impact_layer.get_keywords('impact_summary'))
+
     def test_filter(self):
         """TestPagerEarthquakeFatalityFunction: Test filtering IF"""
         hazard_keywords = {
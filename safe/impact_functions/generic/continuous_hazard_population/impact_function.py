@@ -20,6 +20,7 @@ __revision__ = '$Format:%H$'
 __copyright__ = ('Copyright 2014, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
+import operator
 import numpy
 
 from safe.impact_functions.generic\
@@ -30,7 +31,8 @@ from safe.impact_functions.bases.continuous_rh_continuous_re import \
 from safe.impact_functions.impact_function_manager import ImpactFunctionManager
 from safe.impact_functions.core import (
     population_rounding,
-    has_no_data)
+    has_no_data,
+    classify_values)
 from safe.storage.raster import Raster
 from safe.utilities.i18n import tr
 from safe.common.utilities import get_thousand_separator
@@ -46,12 +48,68 @@ import safe.messaging as m
 from safe.messaging import styles
 
 
+def population_per_hazard_zone(hazard, population, thresholds):
+    """Count the population in the low, medium and high hazard zones.
+
+    This is the tiled kernel of the impact function, see
+    safe.engine.tiling.run_tiled.
+
+    :param hazard: Hazard values, e.g. a tile of the hazard grid.
+    :type hazard: numpy.ndarray
+
+    :param population: Population with the same shape as hazard.
+    :type population: numpy.ndarray
+
+    :param thresholds: The low, medium and high thresholds.
+    :type thresholds: list
+
+    :returns: The population in any of the zones and a dictionary of
+        results with the population of the low, medium and high zones
+        ('affected'), the total population ('total') and whether there is
+        missing data ('no_data').
+    :rtype: (numpy.ndarray, dict)
+    """
+    low_t, medium_t, high_t = thresholds
+
+    # Classify hazard into the zones low (1): hazard < low_t,
+    # medium (2): low_t <= hazard < medium_t and
+    # high (3): medium_t <= hazard <= high_t. Other cells are 0.
+    hazard_zones = classify_values(
+        hazard,
+        [(1, [None, low_t]),
+         (2, [low_t, medium_t]),
+         (3, [medium_t, high_t]),
+         (3, [high_t, high_t])],
+        default=0,
+        right=False)
+
+    # Get the value of the exposure if the exposure is in a hazard zone,
+    # else just assign 0
+    impacted_exposure = numpy.where(hazard_zones > 0, population, 0)
+
+    valid = ~numpy.isnan(population)
+    affected = numpy.bincount(
+        hazard_zones[valid], weights=population[valid], minlength=4)[1:]
+
+    results = {
+        'affected': affected,
+        'total': numpy.nansum(population, dtype=numpy.float64),
+        'no_data': has_no_data(hazard) or has_no_data(population)
+    }
+    return impacted_exposure, results
+
+
 class ContinuousHazardPopulationFunction(
         ContinuousRHContinuousRE,
         PopulationExposureReportMixin):
     # noinspection PyUnresolvedReferences
     """Plugin for impact of population as derived by continuous hazard."""
     _metadata = ContinuousHazardPopulationMetadata()
+    tiled_kernel = staticmethod(population_per_hazard_zone)
+    tiled_reductions = {
+        'affected': operator.add,
+        'total': operator.add,
+        'no_data': operator.or_}
 
     def __init__(self):
         super(ContinuousHazardPopulationFunction, self).__init__()
@@ -124,43 +182,20 @@ class ContinuousHazardPopulationFunction(
             raise FunctionParametersError(
                 'Each threshold should be larger than the previous.')
 
-        # The 3 categories
-        low_t = thresholds[0]
-        medium_t = thresholds[1]
-        high_t = thresholds[2]
-
-        # Extract data as numeric arrays
-        hazard_data = self.hazard.layer.get_data(nan=True)  # Category
-        if has_no_data(hazard_data):
+        # Count people in each hazard zone tile by tile
+        impacted_exposure, results = self.run_tiled(thresholds)
+        if results['no_data']:
             self.no_data_warning = True
-
-        # Calculate impact as population exposed to each category
-        exposure_data = self.exposure.layer.get_data(nan=True, scaling=True)
-        if has_no_data(exposure_data):
-            self.no_data_warning = True
-
-        # Make 3 data for each zone. Get the value of the exposure if the
-        # exposure is in the hazard zone, else just assign 0
-        low_exposure = numpy.where(hazard_data < low_t, exposure_data, 0)
-        medium_exposure = numpy.where(
-            (hazard_data >= low_t) & (hazard_data < medium_t),
-            exposure_data, 0)
-        high_exposure = numpy.where(
-            (hazard_data >= medium_t) & (hazard_data <= high_t),
-            exposure_data, 0)
-        impacted_exposure = low_exposure + medium_exposure + high_exposure
+        low_exposure, medium_exposure, high_exposure = results['affected']
 
         # Count totals
-        self.total_population = int(numpy.nansum(exposure_data))
+        self.total_population = int(results['total'])
         self.affected_population[
-            tr('Population in high hazard areas')] = int(
-                numpy.nansum(high_exposure))
+            tr('Population in high hazard areas')] = int(high_exposure)
         self.affected_population[
-            tr('Population in medium hazard areas')] = int(
-                numpy.nansum(medium_exposure))
+            tr('Population in medium hazard areas')] = int(medium_exposure)
         self.affected_population[
-            tr('Population in low hazard areas')] = int(
-                numpy.nansum(low_exposure))
+            tr('Population in low hazard areas')] = int(low_exposure)
         self.unaffected_population = (
             self.total_population - self.total_affected_population)
 
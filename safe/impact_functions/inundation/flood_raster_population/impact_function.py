@@ -3,11 +3,12 @@
 __author__ = 'Rizky Maulana Nugraha'
 
 import logging
+import operator
 import numpy
 
 from safe.impact_functions.core import (
     population_rounding,
-    has_no_data)
+    population_per_depth)
 from safe.impact_functions.impact_function_manager \
     import ImpactFunctionManager
 from safe.impact_functions.inundation.flood_raster_population\
@@ -41,6 +42,11 @@ class FloodEvacuationRasterHazardFunction(
     # noinspection PyUnresolvedReferences
     """Risk plugin for flood population evacuation."""
     _metadata = FloodEvacuationRasterHazardMetadata()
+    tiled_kernel = staticmethod(population_per_depth)
+    tiled_reductions = {
+        'affected': operator.add,
+        'total': operator.add,
+        'no_data': operator.or_}
 
     def __init__(self):
         """Constructor."""
@@ -131,20 +137,11 @@ class FloodEvacuationRasterHazardFunction(
             isinstance(thresholds, list),
             'Expected thresholds to be a list. Got %s' % str(thresholds))
 
-        # Extract data as numeric arrays
-
-        data = self.hazard.layer.get_data(nan=True)  # Depth
-        if has_no_data(data):
-            self.no_data_warning = True
-
-        # Calculate impact as population exposed to depths > max threshold
-        population = self.exposure.layer.get_data(nan=True, scaling=True)
-        total = int(numpy.nansum(population))
-        if has_no_data(population):
+        # Count people per depth class tile by tile
+        impact, results = self.run_tiled(thresholds)
+        if results['no_data']:
             self.no_data_warning = True
-
-        # merely initialize
-        impact = None
+        total = int(results['total'])
 
         for i, lo in enumerate(thresholds):
             if i == len(thresholds) - 1:
@@ -153,17 +150,15 @@ class FloodEvacuationRasterHazardFunction(
                     'People in >= %.1f m of water') % lo
                 self.impact_category_ordering.append(thresholds_name)
                 self._evacuation_category = thresholds_name
-                impact = medium = numpy.where(data >= lo, population, 0)
             else:
                 # Intermediate thresholds
                 hi = thresholds[i + 1]
                 thresholds_name = tr(
                     'People in %.1f m to %.1f m of water' % (lo, hi))
                 self.impact_category_ordering.append(thresholds_name)
-                medium = numpy.where((data >= lo) * (data < hi), population, 0)
 
             # Count
-            val = int(numpy.nansum(medium))
+            val = int(results['affected'][i])
             self.affected_population[thresholds_name] = val
 
         # Put the deepest area in top #2385
@@ -172,10 +167,6 @@ class FloodEvacuationRasterHazardFunction(
         self.total_population = total
         self.unaffected_population = total - self.total_affected_population
 
-        # Carry the no data values forward to the impact layer.
-        impact = numpy.where(numpy.isnan(population), numpy.nan, impact)
-        impact = numpy.where(numpy.isnan(data), numpy.nan, impact)
-
         # Count totals
         evacuated = self.total_evacuated
 
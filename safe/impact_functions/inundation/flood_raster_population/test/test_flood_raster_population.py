@@ -18,9 +18,11 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
 import unittest
+import numpy
 from safe.test.utilities import get_qgis_app, test_data_path
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
+from qgis.core import QgsRasterLayer
 
 from safe.storage.core import read_layer
 from safe.impact_functions.impact_function_manager \
@@ -76,6 +78,25 @@ class TestFloodEvacuationFunctionRasterHazard(unittest.TestCase):
         self.assertEqual(total_needs_weekly['Clean Water [l]'], 6700)
         self.assertEqual(total_needs_single['Toilets'], 5)
 
+    def test_run_single_precision(self):
+        """Layers are read in single precision and memory mapped."""
+        function = FloodEvacuationRasterHazardFunction.instance()
+
+        hazard_path = test_data_path('hazard', 'continuous_flood_20_20.asc')
+        exposure_path = test_data_path(
+            'exposure', 'pop_binary_raster_20_20.asc')
+
+        function.parameters['thresholds'].value = [0.5, 0.7, 1.0]
+        function.hazard = QgsRasterLayer(hazard_path, 'flood')
+        function.exposure = QgsRasterLayer(exposure_path, 'population')
+        for layer in [function.hazard.layer, function.exposure.layer]:
+            self.assertEqual(layer.get_data().dtype, numpy.float32)
+            self.assertIsInstance(layer.data, numpy.memmap)
+
+        function.run()
+        keywords = function.impact.get_keywords()
+        self.assertEqual(float(keywords['evacuated']), 100)
+
     def test_filter(self):
         """Test filtering IF from layer keywords"""
         hazard_keywords = {
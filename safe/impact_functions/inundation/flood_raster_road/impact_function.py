@@ -2,17 +2,13 @@
 """Impact of flood on roads."""
 from collections import OrderedDict
 
+import numpy
 from qgis.core import (
-    QGis,
     QgsCoordinateReferenceSystem,
     QgsCoordinateTransform,
-    QgsFeature,
     QgsFeatureRequest,
     QgsField,
-    QgsGeometry,
-    QgsPoint,
     QgsRectangle,
-    QgsSpatialIndex,
     QgsVectorFileWriter,
     QgsVectorLayer
 )
@@ -24,7 +20,9 @@ from safe.impact_functions.bases.continuous_rh_classified_ve import \
 from safe.impact_functions.inundation.flood_raster_road\
     .metadata_definitions import FloodRasterRoadsMetadata
 from safe.utilities.i18n import tr
-from safe.utilities.gis import add_output_feature, union_geometries
+from safe.utilities.gis import (
+    convert_to_safe_layer,
+    intersect_lines_with_grid)
 from safe.storage.vector import Vector
 from safe.common.utilities import get_utm_epsg, unique_filename
 from safe.common.exceptions import GetDataError
@@ -38,168 +36,6 @@ import safe.messaging as m
 from safe.messaging import styles
 
 
-def _raster_to_vector_cells(
-        raster, minimum_threshold, maximum_threshold, output_crs):
-    """Generate vectors features (rectangles) for raster cells.
-
-     Cells which are not within threshold (threshold_min < V < threshold_max)
-     will be excluded. The provided CRS will be used to determine the
-     CRS of the output vector cells layer.
-
-    :param minimum_threshold: The minimum threshold for pixels to be included.
-    :type minimum_threshold: float
-
-    :param maximum_threshold: The maximum threshold for pixels to be included.
-    :type maximum_threshold: float
-
-    :param raster: A raster layer that will be vectorised.
-    :type raster: QgsRasterLayer
-
-    :param output_crs: The CRS to use for the output vector cells layer.
-    :type output_crs: QgsCoordinateReferenceSystem
-
-    :returns: A two-tuple containing a spatial index and a map (dict) where
-        map keys are feature id's and the value is the feature for that id.
-    :rtype: (QgsSpatialIndex, dict)
-    """
-
-    # get raster data
-    provider = raster.dataProvider()
-    extent = provider.extent()
-    raster_cols = provider.xSize()
-    raster_rows = provider.ySize()
-    block = provider.block(1, extent, raster_cols, raster_rows)
-    raster_xmin = extent.xMinimum()
-    raster_ymax = extent.yMaximum()
-    cell_width = extent.width() / raster_cols
-    cell_height = extent.height() / raster_rows
-
-    uri = "Polygon?crs=" + output_crs.authid()
-    vl = QgsVectorLayer(uri, "cells", "memory")
-    features = []
-
-    # prepare coordinate transform to reprojection
-    ct = QgsCoordinateTransform(raster.crs(), output_crs)
-
-    for y in xrange(raster_rows):
-        for x in xrange(raster_cols):
-            # only use cells that are within the specified threshold
-            value = block.value(y, x)
-            if value < minimum_threshold or value > maximum_threshold:
-                continue
-
-            # construct rectangular polygon feature for the cell
-            x0 = raster_xmin + (x * cell_width)
-            x1 = raster_xmin + ((x + 1) * cell_width)
-            y0 = raster_ymax - (y * cell_height)
-            y1 = raster_ymax - ((y + 1) * cell_height)
-            outer_ring = [
-                QgsPoint(x0, y0), QgsPoint(x1, y0),
-                QgsPoint(x1, y1), QgsPoint(x0, y1),
-                QgsPoint(x0, y0)]
-            # noinspection PyCallByClass
-            geometry = QgsGeometry.fromPolygon([outer_ring])
-            geometry.transform(ct)
-            f = QgsFeature()
-            f.setGeometry(geometry)
-            features.append(f)
-
-    _, features = vl.dataProvider().addFeatures(features)
-
-    # construct a temporary map for fast access to features by their IDs
-    # (we will be getting feature IDs from spatial index)
-    flood_cells_map = {}
-    for f in features:
-        flood_cells_map[f.id()] = f
-
-    # build a spatial index so we can quickly identify
-    # flood cells overlapping roads
-    if QGis.QGIS_VERSION_INT >= 20800:
-        # woohoo we can use bulk insert (much faster)
-        index = QgsSpatialIndex(vl.getFeatures())
-    else:
-        index = QgsSpatialIndex()
-        for f in vl.getFeatures():
-            index.insertFeature(f)
-
-    return index, flood_cells_map
-
-
-def _intersect_lines_with_vector_cells(
-        line_layer,
-        request,
-        index,
-        flood_cells_map,
-        output_layer,
-        target_field):
-    """
-    A helper function to find all vector cells that intersect with lines.
-
-    In typical usage, you will have a roads layer and polygon cells from
-    vectorising a raster layer. The goal is to obtain a subset of cells
-    which intersect with the roads. This will then be used to determine
-    if any given road segment is flooded.
-
-    :param line_layer: Vector layer with containing linear features
-        such as roads.
-    :type line_layer: QgsVectorLayer
-
-    :param request: Request for fetching features from lines layer.
-    :type request: QgsFeatureRequest
-
-    :param index: Spatial index with flood features.
-    :type index: QgsSpatialIndex
-
-    :param flood_cells_map: Map from flood feature IDs to actual features.
-        See :func:`_raster_to_vector_cells` for more details.
-    :type flood_cells_map: dict
-
-    :param output_layer: Layer to which features will be written.
-    :type output_layer: QgsVectorLayer
-
-    :param target_field: Name of the field in output_layer which will receive
-        information whether the feature is flooded or not.
-    :type target_field: basestring
-
-    :return: None
-    """
-
-    features = []
-    fields = output_layer.dataProvider().fields()
-
-    rd = 0
-    for f in line_layer.getFeatures(request):
-        # query flood cells located in the area of the road and build
-        # a (multi-)polygon geometry with flooded area relevant to this road
-        ids = index.intersects(f.geometry().boundingBox())
-        geoms = [flood_cells_map[i].geometry() for i in ids]
-        flood_geom = union_geometries(geoms)
-
-        # find out which parts of the road are flooded
-        in_geom = f.geometry().intersection(flood_geom)
-        if in_geom and (in_geom.wkbType() == QGis.WKBLineString or
-                        in_geom.wkbType() == QGis.WKBMultiLineString):
-            add_output_feature(
-                features, in_geom, 1,
-                fields, f.attributes(), target_field)
-
-        # find out which parts of the road are not flooded
-        out_geom = f.geometry().difference(flood_geom)
-        if out_geom and (out_geom.wkbType() == QGis.WKBLineString or
-                         out_geom.wkbType() == QGis.WKBMultiLineString):
-            add_output_feature(
-                features, out_geom, 0,
-                fields, f.attributes(), target_field)
-
-        # every once in a while commit the created features to the output layer
-        rd += 1
-        if rd % 1000 == 0:
-            output_layer.dataProvider().addFeatures(features)
-            features = []
-
-    output_layer.dataProvider().addFeatures(features)
-
-
 class FloodRasterRoadsFunction(
         ContinuousRHClassifiedVE,
         RoadExposureReportMixin):
@@ -352,29 +188,28 @@ class FloodRasterRoadsFunction(
             line_layer_tmp, filename, "utf-8", None, "ESRI Shapefile")
         line_layer = QgsVectorLayer(filename, "flooded roads", "ogr")
 
-        # Create vector features from the flood raster
-        # For each raster cell there is one rectangular polygon
-        # Data also get spatially indexed for faster operation
-        index, flood_cells_map = _raster_to_vector_cells(
-            small_raster,
-            threshold_min,
-            threshold_max,
-            self.exposure.layer.crs())
+        # Classify the flood raster cells: 1 where the depth is within
+        # the thresholds, not classified (-1) elsewhere
+        flood_data = convert_to_safe_layer(small_raster)
+        depths = flood_data.get_data(nan=True)
+        labels = numpy.where(
+            (depths >= threshold_min) & (depths <= threshold_max), 1, -1)
 
-        if len(flood_cells_map) == 0:
+        if not numpy.any(labels == 1):
             message = tr(
                 'There are no objects in the hazard layer with "value" > %s. '
                 'Please check the value or use other extent.' % (
                     threshold_min, ))
             raise GetDataError(message)
 
-        # Do the heavy work - for each road get flood polygon for that area and
-        # do the intersection/difference to find out which parts are flooded
-        _intersect_lines_with_vector_cells(
+        # Do the heavy work - walk each road through the raster cells to
+        # find out which parts are flooded
+        intersect_lines_with_grid(
             self.exposure.layer,
             request,
-            index,
-            flood_cells_map,
+            labels,
+            flood_data.get_geotransform(),
+            small_raster.crs(),
             line_layer,
             target_field)
 
@@ -21,6 +21,7 @@ __copyright__ = 'lana.pcfre@gmail.com'
 
 
 import unittest
+import numpy
 
 from safe.test.utilities import get_qgis_app, test_data_path
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
@@ -30,7 +31,6 @@ from qgis.core import (
     QgsFeatureRequest,
     QgsField,
     QgsRasterLayer,
-    QgsRectangle,
     QgsVectorLayer
 )
 
@@ -39,10 +39,9 @@ from safe.storage.safe_layer import SafeLayer
 # noinspection PyProtectedMember
 from safe.impact_functions.inundation.flood_raster_road.impact_function \
     import (
-        FloodRasterRoadsFunction,
-        _raster_to_vector_cells,
-        _intersect_lines_with_vector_cells)
+        FloodRasterRoadsFunction)
 from safe.gis.qgis_vector_tools import create_layer
+from safe.utilities.gis import convert_to_safe_layer, intersect_lines_with_grid
 from safe.impact_functions.impact_function_manager import ImpactFunctionManager
 
 
@@ -112,11 +111,11 @@ class TestFloodRasterRoadsFunction(unittest.TestCase):
             expected, retrieved_if)
         self.assertEqual(expected, retrieved_if, message)
 
-    def test_raster_to_vector_and_line_intersection(self):
+    def test_intersect_lines_with_grid(self):
         """Test the core part of the analysis.
 
-        1. Test creation of spatial index of flood cells
-        2. Test intersection of flood cells with roads layer
+        1. Test classification of flood cells
+        2. Test intersection of roads with the classified cells
         """
 
         raster_name = test_data_path(
@@ -129,36 +128,32 @@ class TestFloodRasterRoadsFunction(unittest.TestCase):
         raster = QgsRasterLayer(raster_name, 'Flood')
         exposure = QgsVectorLayer(exposure_name, 'Exposure', 'ogr')
 
-        index, flood_cells_map = _raster_to_vector_cells(
-            raster, 0.1, 1e10, exposure.crs())
-
-        self.assertEqual(len(flood_cells_map), 221)
-
-        rect_with_all_cells = raster.extent()
-        rect_with_4_cells = QgsRectangle(106.824, -6.177, 106.825, -6.179)
-        rect_with_0_cells = QgsRectangle(106.818, -6.168, 106.828, -6.175)
-        self.assertEqual(len(index.intersects(rect_with_all_cells)), 221)
-        self.assertEqual(len(index.intersects(rect_with_4_cells)), 4)
-        self.assertEqual(len(index.intersects(rect_with_0_cells)), 0)
+        flood_data = convert_to_safe_layer(raster)
+        depths = flood_data.get_data(nan=True)
+        labels = numpy.where((depths >= 0.1) & (depths <= 1e10), 1, -1)
+        self.assertEqual(numpy.sum(labels == 1), 221)
 
         layer = create_layer(exposure)
         new_field = QgsField('flooded', QVariant.Int)
         layer.dataProvider().addAttributes([new_field])
 
         request = QgsFeatureRequest()
-        _intersect_lines_with_vector_cells(
-            exposure, request, index, flood_cells_map, layer, 'flooded')
-
-        feature_count = layer.featureCount()
-        self.assertEqual(feature_count, 184)
+        intersect_lines_with_grid(
+            exposure, request, labels, flood_data.get_geotransform(),
+            raster.crs(), layer, 'flooded')
 
-        flooded = 0
-        iterator = layer.getFeatures()
-        for feature in iterator:
+        # Roads are split into flooded and dry parts
+        lengths = {0: 0, 1: 0}
+        for feature in layer.getFeatures():
             attributes = feature.attributes()
-            if attributes[3] == 1:
-                flooded += 1
-        self.assertEqual(flooded, 25)
+            lengths[attributes[3]] += feature.geometry().length()
+        self.assertGreater(lengths[1], 0)
+
+        expected_length = sum(
+            feature.geometry().length()
+            for feature in exposure.getFeatures(request))
+        self.assertAlmostEqual(
+            lengths[0] + lengths[1], expected_length, places=6)
 
     def test_zero_intersection(self):
         hazard_path = test_data_path(
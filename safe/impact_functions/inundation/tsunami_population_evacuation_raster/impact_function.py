@@ -1,12 +1,13 @@
 # coding=utf-8
 """Tsunami Evacuation Impact Function."""
+import operator
 import numpy
 
 from safe.impact_functions.bases.continuous_rh_continuous_re import \
     ContinuousRHContinuousRE
 from safe.impact_functions.core import (
     population_rounding,
-    has_no_data
+    population_per_depth
 )
 from safe.impact_functions.impact_function_manager import ImpactFunctionManager
 from safe.impact_functions.inundation\
@@ -37,6 +38,11 @@ class TsunamiEvacuationFunction(
     # noinspection PyUnresolvedReferences
     """Impact function for tsunami evacuation."""
     _metadata = TsunamiEvacuationMetadata()
+    tiled_kernel = staticmethod(population_per_depth)
+    tiled_reductions = {
+        'affected': operator.add,
+        'total': operator.add,
+        'no_data': operator.or_}
 
     def __init__(self):
         super(TsunamiEvacuationFunction, self).__init__()
@@ -107,24 +113,16 @@ class TsunamiEvacuationFunction(
             isinstance(thresholds, list),
             'Expected thresholds to be a list. Got %s' % str(thresholds))
 
-        # Extract data as numeric arrays
-        data = self.hazard.layer.get_data(nan=True)  # Depth
-        if has_no_data(data):
+        # Count people per depth class tile by tile
+        impact, results = self.run_tiled(thresholds)
+        if results['no_data']:
             self.no_data_warning = True
 
-        # Calculate impact as population exposed to depths > max threshold
-        population = self.exposure.layer.get_data(nan=True, scaling=True)
-        if has_no_data(population):
-            self.no_data_warning = True
-
-        # merely initialize
-        impact = None
         for i, lo in enumerate(thresholds):
             if i == len(thresholds) - 1:
                 # The last threshold
                 thresholds_name = tr(
                     'People in >= %.1f m of water') % lo
-                impact = medium = numpy.where(data >= lo, population, 0)
                 self.impact_category_ordering.append(thresholds_name)
                 self._evacuation_category = thresholds_name
             else:
@@ -132,21 +130,16 @@ class TsunamiEvacuationFunction(
                 hi = thresholds[i + 1]
                 thresholds_name = tr(
                     'People in %.1f m to %.1f m of water' % (lo, hi))
-                medium = numpy.where((data >= lo) * (data < hi), population, 0)
 
             # Count
-            val = int(numpy.nansum(medium))
+            val = int(results['affected'][i])
             self.affected_population[thresholds_name] = val
 
         # Put the deepest area in top #2385
         self.impact_category_ordering.reverse()
 
-        # Carry the no data values forward to the impact layer.
-        impact = numpy.where(numpy.isnan(population), numpy.nan, impact)
-        impact = numpy.where(numpy.isnan(data), numpy.nan, impact)
-
         # Count totals
-        self.total_population = int(numpy.nansum(population))
+        self.total_population = int(results['total'])
         self.unaffected_population = (
             self.total_population - self.total_affected_population)
 
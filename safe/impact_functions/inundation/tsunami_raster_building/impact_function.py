@@ -20,12 +20,14 @@ __copyright__ = 'imajimatika@gmail.com'
 
 import logging
 from collections import OrderedDict
+import numpy
 
 from safe.impact_functions.inundation\
     .tsunami_raster_building.metadata_definitions import \
     TsunamiRasterBuildingMetadata
 from safe.impact_functions.bases.continuous_rh_classified_ve import \
     ContinuousRHClassifiedVE
+from safe.impact_functions.core import classify_values
 from safe.storage.vector import Vector
 from safe.utilities.i18n import tr
 from safe.common.utilities import get_osm_building_usage, verify
@@ -165,22 +167,21 @@ class TsunamiRasterBuildingFunction(
             (self.hazard_classes[4], {})
         ])
         categories = self.affected_buildings.keys()
+
+        # Classify the interpolated depths. If not a number, buildings are
+        # not inundated.
+        ranges = OrderedDict()
+        ranges[0] = [None, 0.0]
+        ranges[1] = [0.0, low_max]  # low
+        ranges[2] = [low_max, medium_max]  # medium
+        ranges[3] = [medium_max, high_max]  # high
+        ranges[4] = [high_max, None]  # very high
+        water_depths = numpy.array(
+            interpolated_layer.get_data(self.target_field), dtype=numpy.float)
+        inundated_statuses = classify_values(water_depths, ranges, default=0)
+
         for i in range(total_features):
-            # Get the interpolated depth
-            water_depth = float(features[i][self.target_field])
-            if water_depth <= 0:
-                inundated_status = 0
-            elif 0 < water_depth <= low_max:
-                inundated_status = 1  # low
-            elif low_max < water_depth <= medium_max:
-                inundated_status = 2  # medium
-            elif medium_max < water_depth <= high_max:
-                inundated_status = 3  # high
-            elif high_max < water_depth:
-                inundated_status = 4  # very high
-            # If not a number or a value beside real number.
-            else:
-                inundated_status = 0
+            inundated_status = int(inundated_statuses[i])
 
             # Count affected buildings by usage type if available
             if (structure_class_field in attribute_names and
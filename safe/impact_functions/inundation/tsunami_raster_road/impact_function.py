@@ -3,28 +3,26 @@
 from collections import OrderedDict
 
 from qgis.core import (
-    QGis,
     QgsCoordinateReferenceSystem,
     QgsCoordinateTransform,
-    QgsFeature,
     QgsFeatureRequest,
     QgsField,
-    QgsGeometry,
-    QgsPoint,
     QgsRectangle,
-    QgsSpatialIndex,
     QgsVectorFileWriter,
     QgsVectorLayer
 )
 from PyQt4.QtCore import QVariant
 
 from safe.common.exceptions import ZeroImpactException
+from safe.impact_functions.core import classify_values
 from safe.impact_functions.bases.continuous_rh_classified_ve import \
     ContinuousRHClassifiedVE
 from safe.impact_functions.inundation.tsunami_raster_road\
     .metadata_definitions import TsunamiRasterRoadMetadata
 from safe.utilities.i18n import tr
-from safe.utilities.gis import add_output_feature, union_geometries
+from safe.utilities.gis import (
+    convert_to_safe_layer,
+    intersect_lines_with_grid)
 from safe.storage.vector import Vector
 from safe.common.utilities import get_utm_epsg, unique_filename
 from safe.gis.qgis_raster_tools import clip_raster
@@ -43,197 +41,6 @@ __date__ = '11/03/16'
 __copyright__ = 'etienne@kartoza.com'
 
 
-def _raster_to_vector_cells(raster, ranges, output_crs):
-    """Generate vectors features (rectangles) for raster cells.
-
-     Cells which are not within one of the ranges will be excluded.
-     The provided CRS will be used to determine the CRS of the output
-     vector cells layer.
-
-    :param ranges: A dictionary of ranges. The key will be the id the range.
-    :type ranges: OrderedDict
-
-    :param raster: A raster layer that will be vectorised.
-    :type raster: QgsRasterLayer
-
-    :param output_crs: The CRS to use for the output vector cells layer.
-    :type output_crs: QgsCoordinateReferenceSystem
-
-    :returns: A two-tuple containing a spatial index and a map (dict) where
-        map keys are feature id's and the value is the feature for that id.
-    :rtype: (QgsSpatialIndex, dict)
-    """
-
-    # get raster data
-    provider = raster.dataProvider()
-    extent = provider.extent()
-    raster_cols = provider.xSize()
-    raster_rows = provider.ySize()
-    block = provider.block(1, extent, raster_cols, raster_rows)
-    raster_xmin = extent.xMinimum()
-    raster_ymax = extent.yMaximum()
-    cell_width = extent.width() / raster_cols
-    cell_height = extent.height() / raster_rows
-
-    uri = "Polygon?crs=" + output_crs.authid()
-    vl = QgsVectorLayer(uri, "cells", "memory")
-    vl.dataProvider().addAttributes([QgsField('affected', QVariant.Int)])
-    vl.updateFields()
-    features = []
-
-    # prepare coordinate transform to reprojection
-    ct = QgsCoordinateTransform(raster.crs(), output_crs)
-
-    rd = 0
-    for y in xrange(raster_rows):
-        for x in xrange(raster_cols):
-            # only use cells that are within the specified threshold
-            value = block.value(y, x)
-            current_threshold = None
-
-            for threshold_id, threshold in ranges.iteritems():
-
-                # If, eg [0, 0], the value must be equal to 0.
-                if threshold[0] == threshold[1] and threshold[0] == value:
-                    current_threshold = threshold_id
-
-                # If, eg [None, 0], the value must be less than 0.
-                if threshold[0] is None and value <= threshold[1]:
-                    current_threshold = threshold_id
-
-                # If, eg [0, None], the value must be greater than 0.
-                if threshold[1] is None and threshold[0] < value:
-                    current_threshold = threshold_id
-
-                # If, eg [0, 1], the value must be
-                # between 0 excluded and 1 included.
-                if threshold[0] < value <= threshold[1]:
-                    current_threshold = threshold_id
-
-                if current_threshold is not None:
-                    # construct rectangular polygon feature for the cell
-                    x0 = raster_xmin + (x * cell_width)
-                    x1 = raster_xmin + ((x + 1) * cell_width)
-                    y0 = raster_ymax - (y * cell_height)
-                    y1 = raster_ymax - ((y + 1) * cell_height)
-                    outer_ring = [
-                        QgsPoint(x0, y0), QgsPoint(x1, y0),
-                        QgsPoint(x1, y1), QgsPoint(x0, y1),
-                        QgsPoint(x0, y0)]
-                    # noinspection PyCallByClass
-                    geometry = QgsGeometry.fromPolygon([outer_ring])
-                    geometry.transform(ct)
-                    f = QgsFeature()
-                    f.setGeometry(geometry)
-                    f.setAttributes([current_threshold])
-                    features.append(f)
-                    break
-
-            # every once in a while, add the created features to the output.
-            rd += 1
-            if rd % 1000 == 0:
-                vl.dataProvider().addFeatures(features)
-                features = []
-
-    # Add the latest features
-    vl.dataProvider().addFeatures(features)
-
-    # construct a temporary map for fast access to features by their IDs
-    # (we will be getting feature IDs from spatial index)
-    flood_cells_map = {}
-    for f in vl.getFeatures():
-        flood_cells_map[f.id()] = f
-
-    # build a spatial index so we can quickly identify
-    # flood cells overlapping roads
-    if QGis.QGIS_VERSION_INT >= 20800:
-        # woohoo we can use bulk insert (much faster)
-        index = QgsSpatialIndex(vl.getFeatures())
-    else:
-        index = QgsSpatialIndex()
-        for f in vl.getFeatures():
-            index.insertFeature(f)
-
-    return index, flood_cells_map
-
-
-def _intersect_lines_with_vector_cells(
-        line_layer,
-        request,
-        index,
-        flood_cells_map,
-        output_layer,
-        target_field):
-    """
-    A helper function to find all vector cells that intersect with lines.
-
-    In typical usage, you will have a roads layer and polygon cells from
-    vectorising a raster layer. The goal is to obtain a subset of cells
-    which intersect with the roads. This will then be used to determine
-    if any given road segment is flooded.
-
-    :param line_layer: Vector layer with containing linear features
-        such as roads.
-    :type line_layer: QgsVectorLayer
-
-    :param request: Request for fetching features from lines layer.
-    :type request: QgsFeatureRequest
-
-    :param index: Spatial index with flood features.
-    :type index: QgsSpatialIndex
-
-    :param flood_cells_map: Map from flood feature IDs to actual features.
-        See :func:`_raster_to_vector_cells` for more details.
-    :type flood_cells_map: dict
-
-    :param output_layer: Layer to which features will be written.
-    :type output_layer: QgsVectorLayer
-
-    :param target_field: Name of the field in output_layer which will receive
-        information whether the feature is flooded or not.
-    :type target_field: basestring
-
-    :return: None
-    """
-
-    features = []
-    fields = output_layer.dataProvider().fields()
-
-    rd = 0
-    for f in line_layer.getFeatures(request):
-        # query flood cells located in the area of the road and build
-        # a (multi-)polygon geometry with flooded area relevant to this road
-        ids = index.intersects(f.geometry().boundingBox())
-        flood_features = [flood_cells_map[i] for i in ids]
-
-        for feature in flood_features:
-            # find out which parts of the road are flooded
-            in_geom = f.geometry().intersection(feature.geometry())
-            if in_geom and (in_geom.wkbType() == QGis.WKBLineString or
-                            in_geom.wkbType() == QGis.WKBMultiLineString):
-                affected_value = feature.attributes()[0]
-                add_output_feature(
-                    features, in_geom, affected_value,
-                    fields, f.attributes(), target_field)
-
-        # find out which parts of the road are not flooded
-        geoms = [j.geometry() for j in flood_features]
-        out_geom = f.geometry().difference(union_geometries(geoms))
-        if out_geom and (out_geom.wkbType() == QGis.WKBLineString or
-                         out_geom.wkbType() == QGis.WKBMultiLineString):
-            add_output_feature(
-                features, out_geom, 0,
-                fields, f.attributes(), target_field)
-        # every once in a while commit the created features to the output layer
-        rd += 1
-        if rd % 1000 == 0:
-            output_layer.dataProvider().addFeatures(features)
-            features = []
-
-    # Add the latest features
-    output_layer.dataProvider().addFeatures(features)
-
-
 class TsunamiRasterRoadsFunction(
         ContinuousRHClassifiedVE,
         RoadExposureReportMixin):
@@ -385,9 +192,8 @@ class TsunamiRasterRoadsFunction(
         small_raster = clip_raster(
             self.hazard.layer, width, height, QgsRectangle(*clip_extent))
 
-        # Create vector features from the flood raster
-        # For each raster cell there is one rectangular polygon
-        # Data also get spatially indexed for faster operation
+        # Classify the tsunami raster cells into the hazard zones.
+        # Other cells are not classified (-1).
         ranges = OrderedDict()
         ranges[0] = [0.0, 0.0]
         ranges[1] = [0.0, low_max]
@@ -395,10 +201,8 @@ class TsunamiRasterRoadsFunction(
         ranges[3] = [medium_max, high_max]
         ranges[4] = [high_max, None]
 
-        index, flood_cells_map = _raster_to_vector_cells(
-            small_raster,
-            ranges,
-            self.exposure.layer.crs())
+        tsunami_data = convert_to_safe_layer(small_raster)
+        labels = classify_values(tsunami_data.get_data(nan=True), ranges)
 
         # Filter geometry and data using the extent
         ct = QgsCoordinateTransform(
@@ -420,15 +224,18 @@ class TsunamiRasterRoadsFunction(
             line_layer_tmp, filename, "utf-8", None, "ESRI Shapefile")
         line_layer = QgsVectorLayer(filename, "flooded roads", "ogr")
 
-        # Do the heavy work - for each road get flood polygon for that area and
-        # do the intersection/difference to find out which parts are flooded
-        _intersect_lines_with_vector_cells(
+        # Do the heavy work - walk each road through the raster cells to
+        # find the hazard zone of each part. Roads are split at every
+        # classified cell.
+        intersect_lines_with_grid(
             self.exposure.layer,
             request,
-            index,
-            flood_cells_map,
+            labels,
+            tsunami_data.get_geotransform(),
+            small_raster.crs(),
             line_layer,
-            target_field)
+            target_field,
+            split_cells=True)
 
         target_field_index = line_layer.dataProvider().\
             fieldNameIndex(target_field)
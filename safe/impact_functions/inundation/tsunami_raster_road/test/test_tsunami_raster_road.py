@@ -21,11 +21,11 @@ __copyright__ = 'etienne@kartoza.com'
 
 import unittest
 from collections import OrderedDict
+import numpy
 from qgis.core import (
     QgsFeatureRequest,
     QgsField,
     QgsRasterLayer,
-    QgsRectangle,
     QgsVectorLayer
 )
 from PyQt4.QtCore import QVariant
@@ -35,10 +35,10 @@ from safe.impact_functions.impact_function_manager\
 # noinspection PyProtectedMember
 from safe.impact_functions.inundation.tsunami_raster_road\
     .impact_function import (
-        TsunamiRasterRoadsFunction,
-        _raster_to_vector_cells,
-        _intersect_lines_with_vector_cells)
+        TsunamiRasterRoadsFunction)
 from safe.gis.qgis_vector_tools import create_layer
+from safe.impact_functions.core import classify_values
+from safe.utilities.gis import convert_to_safe_layer, intersect_lines_with_grid
 from safe.test.utilities import get_qgis_app, test_data_path
 
 
@@ -131,11 +131,11 @@ class TsunamiRasterRoadsFunctionTest(unittest.TestCase):
             expected, retrieved_if)
         self.assertEqual(expected, retrieved_if, message)
 
-    def test_raster_to_vector_and_line_intersection(self):
+    def test_intersect_lines_with_grid(self):
         """Test the core part of the analysis.
 
-        1. Test creation of spatial index of flood cells
-        2. Test intersection of flood cells with roads layer
+        1. Test classification of tsunami cells
+        2. Test intersection of roads with the classified cells
         """
 
         raster_name = test_data_path(
@@ -152,32 +152,28 @@ class TsunamiRasterRoadsFunctionTest(unittest.TestCase):
         ranges[0] = [0, 1]
         ranges[1] = [1, 2]
         ranges[2] = [2, 100]
-        index, flood_cells_map = _raster_to_vector_cells(
-            raster, ranges, exposure.crs())
-
-        self.assertEqual(len(flood_cells_map), 4198)
-        rect_with_all_cells = raster.extent()
-        rect_with_4_cells = QgsRectangle(106.824, -6.177, 106.825, -6.179)
-        rect_with_0_cells = QgsRectangle(106.818, -6.168, 106.828, -6.175)
-        self.assertEqual(len(index.intersects(rect_with_all_cells)), 4198)
-        self.assertEqual(len(index.intersects(rect_with_4_cells)), 43)
-        self.assertEqual(len(index.intersects(rect_with_0_cells)), 504)
+        tsunami_data = convert_to_safe_layer(raster)
+        labels = classify_values(tsunami_data.get_data(nan=True), ranges)
+        self.assertEqual(numpy.sum(labels >= 0), 4198)
 
         layer = create_layer(exposure)
         new_field = QgsField('flooded', QVariant.Int)
         layer.dataProvider().addAttributes([new_field])
 
         request = QgsFeatureRequest()
-        _intersect_lines_with_vector_cells(
-            exposure, request, index, flood_cells_map, layer, 'flooded')
-
-        feature_count = layer.featureCount()
-        self.assertEqual(feature_count, 388)
+        intersect_lines_with_grid(
+            exposure, request, labels, tsunami_data.get_geotransform(),
+            raster.crs(), layer, 'flooded', split_cells=True)
 
-        flooded = 0
-        iterator = layer.getFeatures()
-        for feature in iterator:
+        # Roads are split by hazard zone
+        lengths = {0: 0, 1: 0, 2: 0}
+        for feature in layer.getFeatures():
             attributes = feature.attributes()
-            if attributes[3] == 1:
-                flooded += 1
-        self.assertEqual(flooded, 40)
+            lengths[attributes[3]] += feature.geometry().length()
+        self.assertGreater(lengths[1], 0)
+
+        expected_length = sum(
+            feature.geometry().length()
+            for feature in exposure.getFeatures(request))
+        self.assertAlmostEqual(
+            sum(lengths.values()), expected_length, places=6)
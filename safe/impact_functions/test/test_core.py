@@ -26,10 +26,13 @@ from collections import OrderedDict
 from safe.test.utilities import get_qgis_app, TESTDATA, HAZDATA
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
+import numpy
 from safe.impact_functions.core import (
     population_rounding_full,
     population_rounding,
-    evacuated_population_needs)
+    evacuated_population_needs,
+    classify_values,
+    sum_per_interval)
 from safe.common.resource_parameter import ResourceParameter
 from safe.defaults import default_minimum_needs
 
@@ -144,5 +147,81 @@ class TestCore(unittest.TestCase):
             [[r['table name'], r['amount']] for r in result])
         assert result['Toilets'] == 2
 
+    def test_classify_values(self):
+        """Test for classify_values function."""
+        ranges = OrderedDict()
+        ranges[0] = [0.0, 0.0]
+        ranges[1] = [0.0, 1.0]
+        ranges[2] = [1.0, 3.0]
+        ranges[3] = [3.0, None]
+        ranges[4] = [None, 10.0]
+
+        values = numpy.array([
+            [-1.0, 0.0, 0.5, 1.0],
+            [2.0, 3.0, 3.5, numpy.nan]])
+        classes = classify_values(values, ranges)
+        self.assertEqual(classes.shape, (2, 4))
+        self.assertEqual(
+            classes.tolist(), [[4, 0, 1, 1], [2, 2, 3, -1]])
+
+        # Loop over values and ranges as the raster impact functions did
+        for value in numpy.linspace(-2, 5, 141):
+            expected = 9
+            for class_id, value_range in ranges.items():
+                if value_range[0] == value_range[1] == value:
+                    expected = class_id
+                elif value_range[0] is None and value <= value_range[1]:
+                    expected = class_id
+                elif value_range[1] is None and value_range[0] < value:
+                    expected = class_id
+                elif (value_range[0] is not None and
+                      value_range[0] < value <= value_range[1]):
+                    expected = class_id
+                else:
+                    continue
+                break
+            self.assertEqual(
+                classify_values([value], ranges, default=9)[0], expected)
+
+        # Ranges including their minimum, given as a list
+        classes = classify_values(
+            [0.0, 1.0, 1.5, 2.0, 2.5],
+            [(1, [None, 1.0]), (2, [1.0, 2.0]), (2, [2.0, 2.0])],
+            default=0,
+            right=False)
+        self.assertEqual(classes.tolist(), [1, 2, 2, 2, 0])
+
+    def test_sum_per_interval(self):
+        """Test for sum_per_interval function."""
+        random_state = numpy.random.RandomState(1234)
+        values = random_state.uniform(0, 11, (300, 200))
+        values[0, :10] = numpy.nan
+        values[1, :10] = [1.5, 2.5, 3.5, 4.5, 10.5, 0, 11, 2, 3, 4]
+        weights = random_state.uniform(0, 100, (300, 200))
+        weights[2, :10] = numpy.nan
+
+        lower = [mmi - 0.5 for mmi in range(2, 11)]
+        upper = [mmi + 0.5 for mmi in range(2, 11)]
+        out = numpy.ones(values.shape) * 7
+        totals = sum_per_interval(values, weights, lower, upper, out=out)
+
+        # Compare with one pass per interval
+        expected_out = numpy.zeros(values.shape)
+        for i in range(len(lower)):
+            matches = numpy.where(
+                (values > lower[i]) * (values <= upper[i]), weights, 0)
+            self.assertAlmostEqual(
+                totals[i] / numpy.nansum(matches), 1.0, places=12)
+            expected_out += matches
+        numpy.testing.assert_array_equal(out, expected_out)
+        # Lower bounds are excluded and upper bounds included
+        self.assertEqual(out[1, 0], 0)
+        self.assertEqual(out[1, 1], weights[1, 1])
+        self.assertEqual(out[1, 5], 0)
+
+        # Overlapping intervals are not allowed
+        self.assertRaises(
+            Exception, sum_per_interval, values, weights, [0, 1], [2, 3])
+
 if __name__ == '__main__':
     unittest.main()
@@ -17,15 +17,14 @@ from safe.impact_functions.bases.classified_vh_classified_ve import \
     ClassifiedVHClassifiedVE
 from safe.impact_functions.volcanic.volcano_point_building\
     .metadata_definitions import VolcanoPointBuildingFunctionMetadata
-from safe.storage.vector import Vector
+from safe.storage.vector import Vector, convert_polygons_to_centroids
+from safe.storage.utilities import DEFAULT_ATTRIBUTE
 from safe.utilities.i18n import tr
-from safe.engine.core import buffer_points
+from safe.engine.core import distance_bands
 from safe.common.utilities import (
     get_thousand_separator,
     get_non_conflicting_attribute_name,
     get_osm_building_usage)
-from safe.engine.interpolation import (
-    assign_hazard_values_to_exposure_data)
 from safe.impact_reports.building_exposure_report_mixin import (
     BuildingExposureReportMixin)
 from safe.common.exceptions import KeywordNotFoundError
@@ -107,14 +106,7 @@ class VolcanoPointBuildingFunction(
                     self.hazard.name, self.hazard.layer.get_geometry_name()))
             raise Exception(message)
 
-        # Make hazard layer by buffering the point
         centers = self.hazard.layer.get_geometry()
-        features = self.hazard.layer.get_data()
-        hazard_layer = buffer_points(
-            centers,
-            radii,
-            hazard_zone_attribute,
-            data_table=features)
         # Category names for the impact zone
         category_names = radii
         # In kilometers
@@ -122,26 +114,58 @@ class VolcanoPointBuildingFunction(
             tr('Radius %.1f km') % key for key in radii[::]]
 
         # Get names of volcanoes considered
-        if volcano_name_attribute in hazard_layer.get_attribute_names():
+        hazard_attribute_names = self.hazard.layer.get_attribute_names()
+        if volcano_name_attribute in hazard_attribute_names:
             volcano_name_list = set()
-            for row in hazard_layer.get_data():
-                # Run through all polygons and get unique names
+            for row in self.hazard.layer.get_data():
+                # Run through all volcanoes and get unique names
                 volcano_name_list.add(row[volcano_name_attribute])
             self.volcano_names = ', '.join(volcano_name_list)
 
         # Find the target field name that has no conflict with the attribute
         # names in the hazard layer
-        hazard_attribute_names = hazard_layer.get_attribute_names()
         target_field = get_non_conflicting_attribute_name(
-            self.target_field, hazard_attribute_names)
-
-        # Run interpolation function for polygon2polygon
-        interpolated_layer = assign_hazard_values_to_exposure_data(
-            hazard_layer, self.exposure.layer)
-
-        # Extract relevant interpolated layer data
-        attribute_names = interpolated_layer.get_attribute_names()
-        features = interpolated_layer.get_data()
+            self.target_field,
+            hazard_attribute_names + [hazard_zone_attribute])
+
+        # Classify buildings by distance to the nearest volcano. The zones
+        # are concentric circles, so no buffer polygons are needed.
+        if self.exposure.layer.is_polygon_data:
+            points = convert_polygons_to_centroids(
+                self.exposure.layer).get_geometry()
+        else:
+            points = self.exposure.layer.get_geometry()
+        nearest, zones = distance_bands(centers, radii, points)
+
+        # Attributes of the volcanoes get names that do not conflict with
+        # the attribute names in the exposure layer
+        attribute_names = self.exposure.layer.get_attribute_names()
+        volcano_attribute_name = {}
+        used_names = list(attribute_names)
+        for name in hazard_attribute_names:
+            safe_name = get_non_conflicting_attribute_name(name, used_names)
+            used_names.append(safe_name)
+            volcano_attribute_name[name] = safe_name
+
+        # Extract relevant exposure data and add the attributes of the
+        # nearest volcano, the radius of the zone and the id of the zone
+        # as numbered by buffer_points
+        volcanoes = self.hazard.layer.get_data()
+        features = self.exposure.layer.get_data(copy=True)
+        for i in range(len(features)):
+            if zones[i] < 0:
+                volcano = {}
+                radius = polygon_id = inside = None
+            else:
+                volcano = volcanoes[nearest[i]]
+                radius = radii[zones[i]]
+                polygon_id = int(nearest[i] * len(radii) + zones[i])
+                inside = True
+            for name in hazard_attribute_names:
+                features[i][volcano_attribute_name[name]] = volcano.get(name)
+            features[i][hazard_zone_attribute] = radius
+            features[i]['polygon_id'] = polygon_id
+            features[i][DEFAULT_ATTRIBUTE] = inside
 
         self.buildings = {}
         self.affected_buildings = OrderedDict()
@@ -246,8 +270,8 @@ class VolcanoPointBuildingFunction(
         # Create vector layer and return
         impact_layer = Vector(
             data=features,
-            projection=interpolated_layer.get_projection(),
-            geometry=interpolated_layer.get_geometry(),
+            projection=self.exposure.layer.get_projection(),
+            geometry=self.exposure.layer.get_geometry(),
             name=tr('Buildings affected by volcanic buffered point'),
             keywords=impact_layer_keywords,
             style_info=style_info)
@@ -22,6 +22,7 @@ from safe.impact_functions.impact_function_manager import ImpactFunctionManager
 from safe.impact_functions.volcanic.volcano_point_building.impact_function \
     import VolcanoPointBuildingFunction
 from safe.storage.core import read_layer
+from safe.storage.utilities import DEFAULT_ATTRIBUTE
 from safe.storage.safe_layer import SafeLayer
 
 
@@ -62,6 +63,16 @@ class TestVolcanoPointBuildingFunction(unittest.TestCase):
         message = 'Expecting %s, but it returns %s' % (expected_sum, zone_sum)
         self.assertEqual(zone_sum, expected_sum, message)
 
+        # The buildings carry the attributes of the volcano
+        new_attribute_names = (
+            set(impact_layer.get_attribute_names()) -
+            set(exposure_layer.get_attribute_names()))
+        self.assertGreaterEqual(
+            len(new_attribute_names),
+            len(hazard_layer.get_attribute_names()) + 3)
+        self.assertTrue(all(impact_layer.get_data(DEFAULT_ATTRIBUTE)))
+        self.assertNotIn(None, impact_layer.get_data('polygon_id'))
+
     def test_filter(self):
         """TestVolcanoPointBuildingFunction: Test filtering IF"""
         hazard_keywords = {
@@ -19,8 +19,7 @@ from safe.impact_functions.volcanic.volcano_point_population\
 from safe.impact_functions.core import (
     population_rounding,
     has_no_data)
-from safe.engine.core import buffer_points
-from safe.engine.interpolation import assign_hazard_values_to_exposure_data
+from safe.engine.core import grid_distance_bands
 from safe.storage.raster import Raster
 from safe.utilities.i18n import tr
 from safe.common.utilities import (
@@ -131,17 +130,10 @@ class VolcanoPointPopulationFunction(
 
         data_table = self.hazard.layer.get_data()
 
-        # Use concentric circles
-        category_title = 'Radius'
-
-        centers = self.hazard.layer.get_geometry()
-        hazard_layer = buffer_points(
-            centers, radii, category_title, data_table=data_table)
-
         # Get names of volcanoes considered
-        if volcano_name_attribute in hazard_layer.get_attribute_names():
+        if volcano_name_attribute in self.hazard.layer.get_attribute_names():
             volcano_name_list = []
-            # Run through all polygons and get unique names
+            # Run through all volcanoes and get unique names
             for row in data_table:
                 volcano_name_list.append(row[volcano_name_attribute])
 
@@ -150,31 +142,25 @@ class VolcanoPointPopulationFunction(
                 volcano_names += '%s, ' % radius
             self.volcano_names = volcano_names[:-2]  # Strip trailing ', '
 
-        # Run interpolation function for polygon2raster
-        interpolated_layer, covered_exposure_layer = \
-            assign_hazard_values_to_exposure_data(
-                hazard_layer,
-                self.exposure.layer,
-                attribute_name=self.target_field
-            )
+        # Classify population cells by distance to the nearest volcano. The
+        # zones are concentric circles, so no buffer polygons are needed.
+        centers = self.hazard.layer.get_geometry()
+        population = self.exposure.layer.get_data(scaling=False)
+        ny, nx = population.shape
+        _, zones = grid_distance_bands(
+            centers, radii, self.exposure.layer.get_geotransform(), nx, ny)
 
-        # Initialise affected population per categories
-        for radius in radii:
-            category = 'Radius %s km ' % format_int(radius)
-            self.affected_population[category] = 0
+        # Population covered by the hazard zones
+        covered_population = numpy.array(population, dtype=numpy.float)
+        covered_population[zones < 0] = numpy.nan
 
         if has_no_data(self.exposure.layer.get_data(nan=True)):
             self.no_data_warning = True
-        # Count affected population per polygon and total
-        for row in interpolated_layer.get_data():
-            # Get population at this location
-            population = row[self.target_field]
-            if not numpy.isnan(population):
-                population = float(population)
-                # Update population count for this category
-                category = 'Radius %s km ' % format_int(
-                    row[category_title])
-                self.affected_population[category] += population
+        # Count affected population per category
+        for i, radius in enumerate(radii):
+            category = 'Radius %s km ' % format_int(radius)
+            self.affected_population[category] = float(
+                numpy.nansum(covered_population[zones == i]))
 
         # Count totals
         self.total_population = population_rounding(
@@ -190,8 +176,7 @@ class VolcanoPointPopulationFunction(
         # Create style
         colours = ['#FFFFFF', '#38A800', '#79C900', '#CEED00',
                    '#FFCC00', '#FF6600', '#FF0000', '#7A0000']
-        classes = create_classes(
-            covered_exposure_layer.get_data().flat[:], len(colours))
+        classes = create_classes(covered_population.flat[:], len(colours))
         interval_classes = humanize_class(classes)
         # Define style info for output polygons showing population counts
         style_classes = []
@@ -250,9 +235,9 @@ class VolcanoPointPopulationFunction(
         impact_layer_keywords = self.generate_impact_keywords(extra_keywords)
 
         impact_layer = Raster(
-            data=covered_exposure_layer.get_data(),
-            projection=covered_exposure_layer.get_projection(),
-            geotransform=covered_exposure_layer.get_geotransform(),
+            data=covered_population,
+            projection=self.exposure.layer.get_projection(),
+            geotransform=self.exposure.layer.get_geotransform(),
             name=tr('People affected by the buffered point volcano'),
             keywords=impact_layer_keywords,
             style_info=style_info)
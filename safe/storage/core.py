@@ -5,6 +5,7 @@
 """
 
 import os
+import numpy
 
 from qgis.core import QgsVectorLayer, QgsRasterLayer
 
@@ -18,14 +19,18 @@ import logging
 logger = logging.getLogger('inasafe')
 
 
-def read_layer(filename):
+def read_layer(filename, lazy=False, dtype=numpy.float64, memmap=False):
     """Read spatial layer from file.
     This can be either raster or vector data.
+
+    If lazy is True, raster pixel values are read on demand, dtype
+    sets the floating point type of raster data in memory and memmap
+    stores raster data in temporary files. See class Raster for details.
     """
 
     _, ext = os.path.splitext(filename)
-    if ext in ['.asc', '.tif', '.nc']:
-        return Raster(filename)
+    if ext in ['.asc', '.tif', '.nc', '.vrt']:
+        return Raster(filename, lazy=lazy, dtype=dtype, memmap=memmap)
     elif ext in ['.shp', '.sqlite']:
         return Vector(filename)
     else:
@@ -46,7 +51,7 @@ def read_qgis_layer(filename):
     base_name, ext = os.path.splitext(filename)
     vector_extension = [
         '.shp', '.sqlite', '.json']
-    raster_extension = ['.asc', '.tif', '.nc']
+    raster_extension = ['.asc', '.tif', '.nc', '.vrt']
 
     if ext in vector_extension:
         return QgsVectorLayer(filename, base_name, 'ogr')
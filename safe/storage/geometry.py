@@ -1,5 +1,7 @@
 # Geometry types
 
+import numpy
+
 
 class Geometry:
     """Common class for geometries
@@ -28,3 +30,138 @@ class Polygon(Geometry):
         s = 'Polygon(%s, inner_rings=%s' % (self.outer_ring,
                                             self.inner_rings)
         return s
+
+
+class PackedGeometry(Geometry):
+    """Many polygons or lines packed into flat arrays
+
+    All vertices are stored in one Mx2 array of coordinates lon, lat.
+    Ring i consists of coordinates[ring_offsets[i]:ring_offsets[i + 1]]
+    and part k (one polygon or line) of rings part_offsets[k] to
+    part_offsets[k + 1], the first of which is the outer ring of a polygon.
+
+    The bounding box [west, south, east, north] of each part is
+    precomputed as a Kx4 array so that all parts can be tested against an
+    area of interest at once. Parts without vertices get a bounding box
+    of NaN which does not intersect anything.
+
+    Rings are returned as views into coordinates, so packed geometry can
+    be passed to the polygon algorithms in safe/gis/polygon.py without
+    creating one array per ring.
+    """
+
+    def __init__(self, coordinates, ring_offsets, part_offsets, lines=False):
+        self.coordinates = numpy.array(coordinates, dtype=numpy.float,
+                                       copy=False).reshape((-1, 2))
+        self.ring_offsets = numpy.array(ring_offsets, dtype=numpy.int,
+                                        copy=False)
+        self.part_offsets = numpy.array(part_offsets, dtype=numpy.int,
+                                        copy=False)
+        self.lines = lines
+
+        # Bounding boxes of all parts from the range of their vertices
+        starts = self.ring_offsets[self.part_offsets[:-1]]
+        ends = self.ring_offsets[self.part_offsets[1:]]
+        empty = starts == ends
+        self.bounding_boxes = numpy.empty((len(starts), 4))
+        self.bounding_boxes[:] = numpy.nan
+        if len(self.coordinates) > 0:
+            starts = numpy.minimum(starts, len(self.coordinates) - 1)
+            self.bounding_boxes[:, :2] = numpy.minimum.reduceat(
+                self.coordinates, starts, axis=0)
+            self.bounding_boxes[:, 2:] = numpy.maximum.reduceat(
+                self.coordinates, starts, axis=0)
+            self.bounding_boxes[empty] = numpy.nan
+
+    def __len__(self):
+        return len(self.part_offsets) - 1
+
+    def __getitem__(self, k):
+        """Part k as an array (lines) or Polygon instance
+        """
+        if self.lines:
+            return self.get_outer_ring(k)
+        else:
+            return Polygon(outer_ring=self.get_outer_ring(k),
+                           inner_rings=self.get_inner_rings(k))
+
+    def __repr__(self):
+        return ('PackedGeometry(%i parts, %i rings, %i vertices)'
+                % (len(self), len(self.ring_offsets) - 1,
+                   len(self.coordinates)))
+
+    def get_ring(self, i):
+        """Vertices of ring i as an Nx2 array view
+        """
+        return self.coordinates[self.ring_offsets[i]:
+                                self.ring_offsets[i + 1]]
+
+    def get_outer_ring(self, k):
+        """Outer ring of polygon k (or vertices of line k)
+        """
+        return self.get_ring(self.part_offsets[k])
+
+    def get_inner_rings(self, k):
+        """List of inner rings of polygon k
+        """
+        return [self.get_ring(i) for i in range(self.part_offsets[k] + 1,
+                                                self.part_offsets[k + 1])]
+
+    def intersects_bbox(self, bbox):
+        """Find the parts whose bounding box intersects a bounding box
+
+        :param bbox: Bounding box [west, south, east, north]
+        :type bbox: list
+
+        :returns: Boolean array which is True for each intersecting part
+        :rtype: numpy.ndarray
+        """
+        west, south, east, north = bbox
+        boxes = self.bounding_boxes
+        return ((boxes[:, 0] <= east) * (boxes[:, 2] >= west) *
+                (boxes[:, 1] <= north) * (boxes[:, 3] >= south))
+
+    def to_geometry(self):
+        """Unpack into a list of arrays (lines) or Polygon instances
+        """
+        return [self[k] for k in range(len(self))]
+
+
+def pack_geometry(geometry, lines=False):
+    """Pack polygons or lines into flat arrays
+
+    :param geometry: List of polygon geometry objects or list of arrays of
+        vertices (polygon outer rings or lines)
+    :type geometry: list
+
+    :param lines: Set to True if geometry is a list of lines.
+    :type lines: bool
+
+    :returns: Packed geometry with a copy of all vertices
+    :rtype: PackedGeometry
+    """
+
+    rings = []
+    part_sizes = []
+    for g in geometry:
+        if hasattr(g, 'outer_ring'):
+            rings.append(g.outer_ring)
+            rings.extend(g.inner_rings)
+            part_sizes.append(1 + len(g.inner_rings))
+        else:
+            rings.append(g)
+            part_sizes.append(1)
+
+    rings = [numpy.reshape(numpy.asarray(r, dtype=numpy.float), (-1, 2))
+             for r in rings]
+    ring_offsets = numpy.zeros(len(rings) + 1, dtype=numpy.int)
+    numpy.cumsum([len(r) for r in rings], out=ring_offsets[1:])
+    part_offsets = numpy.zeros(len(part_sizes) + 1, dtype=numpy.int)
+    numpy.cumsum(part_sizes, out=part_offsets[1:])
+    if len(rings) > 0:
+        coordinates = numpy.concatenate(rings)
+    else:
+        coordinates = numpy.zeros((0, 2))
+
+    return PackedGeometry(coordinates, ring_offsets, part_offsets,
+                          lines=lines)
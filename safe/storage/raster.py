@@ -4,13 +4,15 @@
 import os
 import gc
 import numpy
+import tempfile
 import copy as copy_module
 from osgeo import gdal
 
 from qgis.core import (QgsRasterLayer, QgsRasterFileWriter, QgsRasterPipe)
 
 from safe.utilities.i18n import tr
-from safe.common.utilities import verify, unique_filename
+from safe.common.utilities import verify, unique_filename, temp_dir
+from safe.gis.interpolation2d import RasterSampler
 from safe.gis.numerics import (
     nan_allclose,
     geotransform_to_axes,
@@ -45,6 +47,30 @@ from safe.utilities.metadata import (
     write_read_iso_19115_metadata
 )
 
+# Approximate number of pixels in each block yielded by Raster.iter_blocks
+BLOCK_PIXELS = 2 ** 20
+
+
+def memmap_array(shape, dtype=numpy.float64):
+    """Create zero filled array backed by a temporary file
+
+    Args:
+        * shape: Shape of array
+        * dtype: Numpy data type of array
+
+    Returns:
+        * numpy.memmap instance stored in the InaSAFE temp directory
+
+    Note:
+        The file is removed once the array is no longer referenced, so
+        such arrays can be used like normal arrays for data that does
+        not fit in memory.
+    """
+
+    handle = tempfile.NamedTemporaryFile(dir=temp_dir('memmap'),
+                                         suffix='.dat')
+    return numpy.memmap(handle, dtype=dtype, mode='w+', shape=shape)
+
 
 class Raster(Layer):
     """InaSAFE representation of raster data
@@ -71,6 +97,19 @@ class Raster(Layer):
         * style_info: Dictionary with information about how this layer
             should be styled. See impact_functions/styles.py
             for examples.
+        * lazy: Optional flag. If True and data is a filename, the raster
+            band is kept open and pixel values are only read on demand,
+            either window by window through get_data(window=...) and
+            iter_blocks() or in full on the first call to get_data().
+        * dtype: Optional floating point type of the data held in memory.
+            Default is double precision (issue #75). Use e.g. numpy.float32
+            to halve the memory footprint. If None, the smallest floating
+            point type that can represent the values of the file or array
+            without loss is used.
+        * memmap: Optional flag. If True, the grid and arrays derived from
+            it through get_data and create_array are stored in temporary
+            files rather than in memory. This is slower but allows
+            analysing grids that are larger than the available memory.
 
     Returns:
         * InaSAFE raster layer instance
@@ -85,7 +124,8 @@ class Raster(Layer):
     """
 
     def __init__(self, data=None, projection=None, geotransform=None,
-                 name=None, keywords=None, style_info=None):
+                 name=None, keywords=None, style_info=None, lazy=False,
+                 dtype=numpy.float64, memmap=False):
         """Initialise object with either data or filename
 
         NOTE: Doc strings in constructor are not harvested and exposed in
@@ -100,6 +140,17 @@ class Raster(Layer):
                        keywords=keywords,
                        style_info=style_info)
 
+        self.lazy = False
+        self.dtype = dtype
+        self.memmap = memmap
+
+        # Most recent result of get_data requiring nodata replacement or
+        # scaling as (source data, nodata value, scale, result)
+        self._scaled_data = None
+
+        # Sampler for interpolation as (source data, scale, sampler)
+        self._sampler = None
+
         # Input checks
         if data is None:
             # Instantiate empty object
@@ -109,14 +160,20 @@ class Raster(Layer):
 
         # Initialisation
         if isinstance(data, basestring):
-            self.read_from_file(data)
+            self.read_from_file(data, lazy=lazy)
         elif isinstance(data, QgsRasterLayer):
             self.read_from_qgis_native(data)
         else:
             # Assume that data is provided as a numpy array
             # with extra keyword arguments supplying metadata
 
-            self.data = numpy.array(data, dtype='d', copy=False)
+            data = numpy.asarray(data)
+            dtype = self._get_dtype(data.dtype)
+            if memmap and not isinstance(data, numpy.memmap):
+                self.data = memmap_array(data.shape, dtype)
+                self.data[:] = data
+            else:
+                self.data = numpy.array(data, dtype=dtype, copy=False)
 
             proj4 = self.get_projection(proj4=True)
             if 'longlat' in proj4 and 'WGS84' in proj4:
@@ -139,7 +196,7 @@ class Raster(Layer):
     def __len__(self):
         """Size of data set defined as total number of grid points
         """
-        return len(self.get_data().flat)
+        return self.rows * self.columns
 
     def __eq__(self, other, rtol=1.0e-5, atol=1.0e-8):
         """Override '==' to allow comparison with other raster objecs
@@ -178,8 +235,13 @@ class Raster(Layer):
         # Raster layers are identical up to the specified tolerance
         return True
 
-    def read_from_file(self, filename):
+    def read_from_file(self, filename, lazy=False):
         """Read and unpack raster data
+
+        Args:
+            * filename: Name of raster file known to GDAL
+            * lazy: If True, only metadata is read and the band is kept
+                    open for windowed reading. See get_data and iter_blocks.
         """
 
         # Open data file for reading
@@ -254,14 +316,22 @@ class Raster(Layer):
             msg = 'Could not read raster band from %s' % filename
             raise ReadLayerError(msg)
 
+        nodata = band.GetNoDataValue()
+        if nodata is None:
+            nodata = -9999
+        self.file_nodata_value = nodata
+
+        if lazy:
+            # Defer reading of pixel values until they are requested
+            self.lazy = True
+            self.data = None
+            return
+
         # Force garbage collection to free up any memory we can (TS)
         gc.collect()
 
         # Read from raster file
-        data = band.ReadAsArray()
-
-        # Convert to double precision (issue #75)
-        data = numpy.array(data, dtype=numpy.float64)
+        data = self._read_band()
 
         # Self check
         M, N = data.shape
@@ -270,16 +340,162 @@ class Raster(Layer):
             'raster file %s' % self.filename)
         verify(M == self.rows, msg)
         verify(N == self.columns, msg)
-        nodata = self.band.GetNoDataValue()
-        if nodata is None:
-            nodata = -9999
-
-        if nodata is not numpy.nan:
-            NaN = numpy.ones((M, N), numpy.float64) * numpy.nan
-            data = numpy.where(data == nodata, NaN, data)
 
         self.data = data
 
+    def _read_band(self):
+        """Read all pixel values from the open raster band
+
+        Note:
+            Memory mapped layers are filled strip by strip so the grid
+            never has to fit in memory.
+        """
+
+        if not self.memmap:
+            return self._read_window()
+
+        strip = max(1, BLOCK_PIXELS // self.columns)
+        data = None
+        for yoff in range(0, self.rows, strip):
+            ysize = min(strip, self.rows - yoff)
+            block = self._read_window((0, yoff, self.columns, ysize))
+            if data is None:
+                data = memmap_array((self.rows, self.columns), block.dtype)
+            data[yoff:yoff + ysize] = block
+
+        return data
+
+    def create_array(self, dtype=None):
+        """Create zero filled array with the dimensions of the grid
+
+        Args:
+            * dtype: Optional numpy data type. Default is the floating
+                     point type of the layer.
+
+        Returns:
+            * numpy array of size rows x columns. If the layer is memory
+              mapped, so is the array.
+
+        Note:
+            Impact functions can use this to allocate full size
+            intermediate grids that follow the memory mapping of their
+            input layers.
+        """
+
+        if dtype is None:
+            dtype = self._get_dtype(numpy.float64)
+
+        shape = (self.rows, self.columns)
+        if self.memmap:
+            return memmap_array(shape, dtype)
+        else:
+            return numpy.zeros(shape, dtype)
+
+    def _copy_array(self, A):
+        """Copy array into memory or temporary file as given by memmap
+        """
+
+        if self.memmap:
+            B = memmap_array(A.shape, A.dtype)
+            B[:] = A
+            return B
+        else:
+            return A.copy()
+
+    def _get_dtype(self, native_dtype):
+        """Get floating point type used in memory for given native type
+        """
+
+        if self.dtype is None:
+            return numpy.promote_types(native_dtype, numpy.float32)
+        else:
+            return numpy.dtype(self.dtype)
+
+    def _read_window(self, window=None):
+        """Read window of pixel values from the open raster band
+
+        Args:
+            * window: Optional tuple (xoff, yoff, xsize, ysize) in pixels
+                      following the GDAL convention. If None, the entire
+                      band is read.
+
+        Returns:
+            * numpy array with nodata values replaced by NaN. The type of
+              the array is given by the dtype of the layer.
+
+        Note:
+            Nodata values are replaced in place, so no more than one
+            array of the size of the window is allocated once the values
+            are in the requested dtype.
+        """
+
+        if window is None:
+            data = self.band.ReadAsArray()
+        else:
+            xoff, yoff, xsize, ysize = window
+            data = self.band.ReadAsArray(xoff, yoff, xsize, ysize)
+
+        data = numpy.array(data,
+                           dtype=self._get_dtype(data.dtype),
+                           copy=False)
+
+        data[data == self.file_nodata_value] = numpy.nan
+        return data
+
+    def get_block_size(self):
+        """Get default block size used by iter_blocks as (columns, rows)
+
+        Note:
+            For rasters read from file, blocks are aligned with the native
+            GDAL block layout of the band. Blocks of only a few lines (as
+            e.g. in striped GeoTIFFs) are stacked so that each block holds
+            around a million pixels.
+        """
+
+        if self.lazy:
+            columns, rows = self.band.GetBlockSize()
+        else:
+            columns, rows = self.columns, 1
+
+        columns = max(1, min(columns, self.columns))
+        rows = max(1, rows)
+        stack = max(1, BLOCK_PIXELS // (columns * rows))
+        rows = min(rows * stack, self.rows)
+
+        return columns, rows
+
+    def iter_blocks(self, block_size=None, nan=True, scaling=None):
+        """Iterate over raster data block by block
+
+        Args:
+            * block_size: Optional (columns, rows) of each block.
+                          Default is given by get_block_size.
+            * nan, scaling: See get_data
+
+        Returns:
+            * generator of 2-tuples (window, data) where window is
+              (xoff, yoff, xsize, ysize) in pixels and data is the
+              corresponding array as returned by get_data(window=window)
+
+        Note:
+            For lazy rasters only one block is held in memory at a time,
+            which allows impact functions to stream through rasters that
+            are too large to be read in full.
+        """
+
+        if block_size is None:
+            block_size = self.get_block_size()
+        block_columns, block_rows = block_size
+
+        for yoff in range(0, self.rows, block_rows):
+            ysize = min(block_rows, self.rows - yoff)
+            for xoff in range(0, self.columns, block_columns):
+                xsize = min(block_columns, self.columns - xoff)
+                window = (xoff, yoff, xsize, ysize)
+                yield window, self.get_data(nan=nan,
+                                            scaling=scaling,
+                                            window=window)
+
     def write_to_file(self, filename):
         """Save raster data to file
 
@@ -378,7 +594,8 @@ class Raster(Layer):
         qgis_layer = safe_to_qgis_layer(self)
         return qgis_layer
 
-    def get_data(self, nan=True, scaling=None, copy=False):
+    def get_data(self, nan=True, scaling=None, copy=False, window=None,
+                 cache=False):
         """Get raster data as numeric array
 
         Args:
@@ -414,20 +631,61 @@ class Raster(Layer):
 
             * copy (optional): If present and True return copy
 
+            * window (optional): Tuple (xoff, yoff, xsize, ysize) in pixels.
+                                 If present, only that part of the grid is
+                                 returned. Lazy rasters read just the
+                                 window from file.
+
+            * cache (optional): If True the array for the entire grid with
+                                nodata replacement or scaling applied is
+                                cached and shared read only between calls
+                                with the same arguments.
+
         Note:
             Scaling does not currently work with projected layers.
             See issue #123
+
+            Calling get_data without a window on a lazy raster reads the
+            entire band into memory once.
+
+            Unless cache is True a new array is returned which the caller
+            is free to modify. Cached arrays are read only, use them where
+            the same processed grid is needed repeatedly.
         """
 
-        if copy:
-            A = copy_module.deepcopy(self.data)
+        if window is None and self.data is None and self.lazy:
+            # Read entire band on first request
+            self.data = self._read_band()
+
+        if window is not None:
+            xoff, yoff, xsize, ysize = window
+            if (xoff < 0 or yoff < 0 or xsize < 0 or ysize < 0 or
+                    xoff + xsize > self.columns or
+                    yoff + ysize > self.rows):
+                msg = ('Window %s is outside raster %s of size [%i x %i]'
+                       % (str(window), self.get_name(),
+                          self.rows, self.columns))
+                raise GetDataError(msg)
+
+            if self.data is None and self.lazy:
+                A = self._read_window(window)
+                is_copy = True
+            else:
+                A = self.data[yoff:yoff + ysize, xoff:xoff + xsize]
+                is_copy = False
         else:
             A = self.data
             verify(A.shape[0] == self.rows and A.shape[1] == self.columns)
+            is_copy = False
+
+        if copy and not is_copy:
+            A = self._copy_array(A)
+            is_copy = True
 
         # Handle no data value
         # Must explicit comparison to False and True as nan can be a number
         # so 0 would evaluate to False and e.g. 1 to True.
+        new_nodata_value = None
         if not isinstance(nan, bool):
             # We are handling all non-NaN's in read_from_file and
             # assuming NaN's in internal numpy arrays [issue #297].
@@ -439,11 +697,50 @@ class Raster(Layer):
                        'number. I got "nan=%s"' % str(nan))
                 raise InaSAFEError(msg)
 
-            # Replace NODATA_VALUE with NaN array
-            NoData = numpy.ones(A.shape, A.dtype) * new_nodata_value
-            A = numpy.where(numpy.isnan(A), NoData, A)
-
         # Take care of possible scaling
+        sigma = self._get_scaling_factor(scaling)
+
+        if new_nodata_value is None and sigma == 1:
+            # Data is returned unmodified but never shared with the layer
+            if is_copy:
+                return A
+            else:
+                return self._copy_array(A)
+
+        # Reuse cached result for the entire grid if data is unchanged
+        cache = cache and window is None and not copy
+        if cache and self._scaled_data is not None:
+            source, cached_nodata_value, cached_sigma, B = self._scaled_data
+            if (source is self.data and
+                    cached_nodata_value == new_nodata_value and
+                    cached_sigma == sigma):
+                return B
+
+        if not is_copy:
+            A = self._copy_array(A)
+
+        # Replace NaN's and scale in place
+        if new_nodata_value is not None:
+            numpy.copyto(A, new_nodata_value, where=numpy.isnan(A))
+        if sigma != 1:
+            A *= sigma
+
+        if cache:
+            A.flags.writeable = False
+            self._scaled_data = (self.data, new_nodata_value, sigma, A)
+
+        return A
+
+    def _get_scaling_factor(self, scaling):
+        """Get factor to scale data by as specified for get_data
+
+        Args:
+            * scaling: True, False, None or a number (see get_data)
+
+        Returns:
+            * sigma: Number to multiply data values by
+        """
+
         if scaling is None:
             # Redefine scaling from density keyword if possible
             keywords = self.get_keywords()
@@ -473,8 +770,47 @@ class Raster(Layer):
                        'number: %s' % (scaling, str(e)))
                 raise GetDataError(msg)
 
-        # Return possibly scaled data
-        return sigma * A
+        return sigma
+
+    def get_sampler(self, scaling=None):
+        """Get sampler to interpolate raster values at points
+
+        Args:
+            * scaling: Optional scaling of data as for get_data
+
+        Returns:
+            * sampler: RasterSampler for the data as returned by
+                       get_data(nan=True, scaling=scaling)
+
+        Note:
+            The sampler is created once and reused while the data of the
+            layer is unchanged, so repeated interpolation from this layer
+            (e.g. by assign_hazard_values_to_exposure_data) neither
+            validates nor copies the grid again.
+        """
+
+        sigma = self._get_scaling_factor(scaling)
+
+        if self.data is None and self.lazy:
+            # Read entire band on first request
+            self.data = self._read_band()
+
+        if self._sampler is not None:
+            source, cached_sigma, sampler = self._sampler
+            if source is self.data and cached_sigma == sigma:
+                return sampler
+
+        if sigma == 1:
+            # Interpolation does not modify the data, so no copy needed
+            A = self.data
+        else:
+            A = self.get_data(nan=True, scaling=sigma, cache=True)
+
+        longitudes, latitudes = self.get_geometry()
+        sampler = RasterSampler(longitudes, latitudes, A)
+        self._sampler = (self.data, sigma, sampler)
+
+        return sampler
 
     def get_geotransform(self, copy=False):
         """Return geotransform for this raster layer
@@ -531,7 +867,9 @@ class Raster(Layer):
         return Raster(data=self.get_data(copy=True),
                       geotransform=self.get_geotransform(copy=True),
                       projection=self.get_projection(),
-                      keywords=self.get_keywords())
+                      keywords=self.get_keywords(),
+                      dtype=self.dtype,
+                      memmap=self.memmap)
 
     def __mul__(self, other):
         return self.get_data() * other.get_data()
@@ -15,10 +15,12 @@ import os
 import logging
 import unittest
 
+import numpy
 from qgis.core import QgsRasterLayer
 
 from safe.storage.utilities import read_keywords
 from safe.storage.raster import Raster
+from safe.gis.interpolation2d import interpolate_raster
 from safe.test.utilities import test_data_path, get_qgis_app
 
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
@@ -62,6 +64,137 @@ class RasterTest(unittest.TestCase):
             layer_exent, qgis_extent,
             'Expected %s extent, got %s' % (qgis_extent, layer_exent))
 
+    def test_lazy_raster_windows_and_blocks(self):
+        """Test that lazy rasters can be read window by window."""
+        filename = RASTER_BASE + '.tif'
+        layer = Raster(data=filename)
+        lazy_layer = Raster(data=filename, lazy=True)
+
+        self.assertTrue(lazy_layer.lazy)
+        self.assertIsNone(lazy_layer.data)
+        self.assertEqual(lazy_layer.rows, layer.rows)
+        self.assertEqual(lazy_layer.columns, layer.columns)
+        self.assertEqual(len(lazy_layer), len(layer))
+
+        A = layer.get_data()
+
+        # Windows are read from file without loading the whole band
+        window = (3, 5, 17, 11)
+        W = lazy_layer.get_data(window=window)
+        self.assertEqual(W.shape, (11, 17))
+        self.assertTrue(numpy.allclose(
+            W, A[5:16, 3:20], equal_nan=True))
+        self.assertTrue(numpy.allclose(
+            layer.get_data(window=window), W, equal_nan=True))
+        self.assertIsNone(lazy_layer.data)
+
+        # Blocks cover the grid exactly once
+        count = 0
+        for (xoff, yoff, xsize, ysize), block in lazy_layer.iter_blocks(
+                block_size=(64, 32)):
+            self.assertEqual(block.shape, (ysize, xsize))
+            self.assertTrue(numpy.allclose(
+                block,
+                A[yoff:yoff + ysize, xoff:xoff + xsize],
+                equal_nan=True))
+            count += block.size
+        self.assertEqual(count, len(layer))
+        self.assertIsNone(lazy_layer.data)
+
+        # Full read gives the same result as eager reading
+        self.assertTrue(lazy_layer == layer)
+
+    def test_raster_dtype_and_cached_data(self):
+        """Test single precision rasters and caching of processed data."""
+        filename = RASTER_BASE + '.tif'
+        layer = Raster(data=filename)
+        single_layer = Raster(data=filename, dtype=numpy.float32)
+
+        self.assertEqual(layer.get_data().dtype, numpy.float64)
+        A = single_layer.get_data()
+        self.assertEqual(A.dtype, numpy.float32)
+        self.assertTrue(numpy.allclose(
+            A, layer.get_data(), equal_nan=True))
+
+        # Plain data is returned as a new array
+        A[0, 0] = -1
+        self.assertNotEqual(single_layer.get_data()[0, 0], -1)
+
+        # Processed data is a new array unless caching is requested
+        B = single_layer.get_data(nan=0.0, scaling=2.0)
+        self.assertTrue(B.flags.writeable)
+        self.assertFalse(B is single_layer.get_data(nan=0.0, scaling=2.0))
+
+        # Cached processed data is shared and read only
+        B = single_layer.get_data(nan=0.0, scaling=2.0, cache=True)
+        self.assertTrue(
+            B is single_layer.get_data(nan=0.0, scaling=2.0, cache=True))
+        self.assertFalse(B.flags.writeable)
+        self.assertEqual(B.dtype, numpy.float32)
+        self.assertFalse(numpy.isnan(B).any())
+        expected = 2 * layer.get_data(nan=0.0)
+        self.assertTrue(numpy.allclose(B, expected))
+
+        C = single_layer.get_data(
+            nan=0.0, scaling=2.0, copy=True, cache=True)
+        self.assertFalse(C is B)
+        self.assertTrue(C.flags.writeable)
+        self.assertFalse(single_layer.get_data(nan=0.0) is B)
+
+    def test_memmap_raster(self):
+        """Test that raster data can be stored in temporary files."""
+        filename = RASTER_BASE + '.tif'
+        layer = Raster(data=filename)
+        memmap_layer = Raster(data=filename, memmap=True)
+
+        self.assertIsInstance(memmap_layer.data, numpy.memmap)
+        self.assertTrue(memmap_layer == layer)
+        self.assertIsInstance(memmap_layer.get_data(), numpy.memmap)
+        self.assertIsInstance(
+            memmap_layer.get_data(nan=0.0, scaling=2.0), numpy.memmap)
+        self.assertTrue(numpy.allclose(
+            memmap_layer.get_data(nan=0.0, scaling=2.0),
+            layer.get_data(nan=0.0, scaling=2.0)))
+
+        # Intermediate grids follow the layer
+        A = memmap_layer.create_array()
+        self.assertIsInstance(A, numpy.memmap)
+        self.assertEqual(A.shape, (layer.rows, layer.columns))
+        self.assertEqual(numpy.sum(A), 0)
+        self.assertNotIsInstance(layer.create_array(), numpy.memmap)
+
+        # Arrays are memory mapped when wrapped in new layers
+        copied_layer = memmap_layer.copy()
+        self.assertIsInstance(copied_layer.data, numpy.memmap)
+        self.assertTrue(copied_layer == layer)
+
+    def test_raster_sampler(self):
+        """Test that raster layers keep their interpolation sampler."""
+        filename = RASTER_BASE + '.tif'
+        layer = Raster(data=filename)
+
+        sampler = layer.get_sampler()
+        self.assertTrue(sampler is layer.get_sampler())
+        self.assertTrue(sampler.z is layer.data)
+
+        # Values agree with interpolation of the layer data
+        longitudes, latitudes = layer.get_geometry()
+        points = numpy.array([[longitudes[10], latitudes[20]],
+                              [longitudes.mean(), latitudes.mean()],
+                              [longitudes[0] - 1, latitudes[0]]])
+        values = sampler.sample(points)
+        expected = interpolate_raster(longitudes, latitudes,
+                                      layer.get_data(), points)
+        self.assertTrue(numpy.allclose(values, expected, equal_nan=True))
+        self.assertTrue(numpy.isnan(values[2]))
+
+        # Scaled data and new data get new samplers
+        scaled_sampler = layer.get_sampler(scaling=2.0)
+        self.assertFalse(scaled_sampler is sampler)
+        self.assertTrue(numpy.allclose(scaled_sampler.sample(points),
+                                       2 * values, equal_nan=True))
+        layer.data = layer.get_data(copy=True)
+        self.assertFalse(layer.get_sampler() is sampler)
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(RasterTest, 'test')
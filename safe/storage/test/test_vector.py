@@ -12,8 +12,12 @@ import os
 import logging
 import unittest
 
+import numpy
+from osgeo import ogr
+
+from safe.common.exceptions import GetDataError
 from safe.common.utilities import temp_dir, unique_filename
-from safe.storage.utilities import read_keywords
+from safe.storage.utilities import read_keywords, rings_equal
 from safe.storage.vector import Vector, QGIS_IS_AVAILABLE
 from safe.test.utilities import test_data_path, get_qgis_app
 
@@ -97,3 +101,163 @@ class VectorTest(unittest.TestCase):
             count = provider.featureCount()
             self.assertEqual(
                 count, 250, 'Expected 250 features, got %s' % count)
+
+    def test_columnar_attributes(self):
+        """Test that attributes read from file are stored by column."""
+        keywords = read_keywords(SHP_BASE + '.keywords')
+        layer = Vector(data=SHP_BASE + '.shp', keywords=keywords)
+
+        names = layer.get_attribute_names()
+        self.assertTrue(len(names) > 0)
+        columns = layer.get_columns()
+        self.assertEqual(list(columns.keys()), list(names))
+        for name in names:
+            column = layer.get_data(attribute=name)
+            self.assertIsInstance(column, numpy.ndarray)
+            self.assertEqual(len(column), len(layer))
+            # Columns are returned without copying
+            self.assertTrue(column is layer.get_data(attribute=name))
+            self.assertFalse(
+                column is layer.get_data(attribute=name, copy=True))
+
+        # Feature dictionaries are created on demand and match the columns
+        name = names[0]
+        expected = layer.get_data(attribute=name, copy=True)
+        features = layer.get_data()
+        self.assertEqual(len(features), len(layer))
+        for i, feature in enumerate(features):
+            self.assertEqual(sorted(feature.keys()), sorted(names))
+            value = feature[name]
+            self.assertTrue(
+                value == expected[i] or value != value,
+                '%s != %s' % (value, expected[i]))
+            self.assertEqual(layer.get_data(name, i), value)
+
+        # Changes to the dictionaries are kept
+        features[0]['new_attribute'] = 1
+        self.assertEqual(layer.get_data()[0]['new_attribute'], 1)
+        self.assertEqual(layer.get_data('new_attribute', 0), 1)
+
+    def test_columnar_constructor(self):
+        """Test that vector layers can be created from attribute arrays."""
+        geometry = [[0.0, 0.0], [1.0, 1.0], [2.0, 2.0]]
+        depth = numpy.array([0.5, 1.5, 2.5])
+        layer = Vector(
+            data={'depth': depth, 'name': ['a', 'b', 'c']},
+            geometry=geometry)
+        self.assertTrue(layer.get_data(attribute='depth') is depth)
+        self.assertEqual(layer.get_data('name', 1), 'b')
+        self.assertEqual(
+            layer.get_data(),
+            [{'depth': 0.5, 'name': 'a'},
+             {'depth': 1.5, 'name': 'b'},
+             {'depth': 2.5, 'name': 'c'}])
+
+        # Default attributes
+        layer = Vector(geometry=geometry)
+        self.assertEqual(list(layer.get_data(attribute='ID')), [0, 1, 2])
+        self.assertEqual(layer.get_data(), [{'ID': 0}, {'ID': 1}, {'ID': 2}])
+
+        # Layers created from feature dictionaries return lists
+        layer = Vector(data=[{'depth': 1.0}, {'depth': 2.0}, {'depth': 3.0}],
+                       geometry=geometry)
+        self.assertEqual(
+            layer.get_data(attribute='depth'), [1.0, 2.0, 3.0])
+
+    def test_empty_vector(self):
+        """Test that an empty vector layer has no attributes."""
+        layer = Vector()
+        self.assertEqual(len(layer), 0)
+        self.assertIsNone(layer.data)
+        self.assertEqual(layer.get_columns(), {})
+        self.assertRaises(GetDataError, layer.get_data)
+        self.assertRaises(GetDataError, layer.get_data, 'depth')
+
+        layer_copy = layer.copy()
+        self.assertEqual(len(layer_copy), 0)
+        self.assertIsNone(layer_copy.data)
+
+    def test_wkb_geometry_reading(self):
+        """Test that geometries decoded from WKB match those read by OGR."""
+        keywords = read_keywords(SHP_BASE + '.keywords')
+        layer = Vector(data=SHP_BASE + '.shp', keywords=keywords)
+
+        fid = ogr.Open(SHP_BASE + '.shp')
+        reference = Vector()
+        geometry = reference._read_geometry(fid.GetLayerByIndex(0),
+                                            SHP_BASE + '.shp')
+
+        self.assertEqual(layer.geometry_type, reference.geometry_type)
+        self.assertEqual(len(layer.geometry), len(geometry))
+        for polygon, expected in zip(layer.geometry, geometry):
+            self.assertTrue(rings_equal(polygon.outer_ring,
+                                        expected.outer_ring))
+            self.assertEqual(len(polygon.inner_rings),
+                             len(expected.inner_rings))
+            for ring, expected_ring in zip(polygon.inner_rings,
+                                           expected.inner_rings):
+                self.assertTrue(rings_equal(ring, expected_ring))
+
+    def test_packed_geometry(self):
+        """Test that packed geometry agrees with the geometry of a layer."""
+        layer = Vector(data=SHP_BASE + '.shp')
+        packed = layer.get_packed_geometry()
+        self.assertIs(packed, layer.get_packed_geometry())
+
+        self.assertEqual(len(packed), len(layer))
+        for k, polygon in enumerate(layer.get_geometry(
+                as_geometry_objects=True)):
+            self.assertTrue(rings_equal(packed.get_outer_ring(k),
+                                        polygon.outer_ring))
+            self.assertEqual(len(packed.get_inner_rings(k)),
+                             len(polygon.inner_rings))
+            bbox = [numpy.min(polygon.outer_ring[:, 0]),
+                    numpy.min(polygon.outer_ring[:, 1]),
+                    numpy.max(polygon.outer_ring[:, 0]),
+                    numpy.max(polygon.outer_ring[:, 1])]
+            self.assertTrue(numpy.allclose(packed.bounding_boxes[k], bbox))
+
+        # Bounding box prefilter
+        extent = layer.get_bounding_box()
+        self.assertTrue(numpy.all(packed.intersects_bbox(extent)))
+        self.assertFalse(numpy.any(packed.intersects_bbox([0, 0, 1, 1])))
+
+        # Geometry is packed again when it is replaced
+        layer.geometry = layer.geometry[:3]
+        packed = layer.get_packed_geometry()
+        self.assertEqual(len(packed), 3)
+
+        # Lines
+        lines = [numpy.array([[0, 0], [1, 1], [2, 0]]),
+                 [[5, 5], [6, 4]]]
+        layer = Vector(geometry=lines, geometry_type='line')
+        packed = layer.get_packed_geometry()
+        self.assertTrue(numpy.allclose(packed[1], lines[1]))
+        self.assertTrue(numpy.allclose(packed.bounding_boxes,
+                                       [[0, 0, 2, 1], [5, 4, 6, 5]]))
+
+    def test_wkb_geometry_reading_large_layer(self):
+        """Test that a large polygon layer decoded from WKB matches OGR."""
+        # Create polygons with 40 vertices each on a 100 x 100 grid
+        angles = numpy.linspace(0, 2 * numpy.pi, 40)
+        ring = 0.004 * numpy.array([numpy.cos(angles), numpy.sin(angles)]).T
+        geometry = []
+        for i in range(100):
+            for j in range(100):
+                geometry.append(ring + [106.0 + 0.01 * i, -6.0 + 0.01 * j])
+        data = {'id': range(len(geometry))}
+        filename = unique_filename(suffix='.shp', dir=temp_dir('test'))
+        Vector(data=data, geometry=geometry).write_to_file(filename)
+
+        layer = Vector(data=filename)
+
+        fid = ogr.Open(filename)
+        ogr_layer = fid.GetLayerByIndex(0)
+        reference = Vector()
+        expected = reference._read_geometry(ogr_layer, filename)
+
+        self.assertEqual(len(layer), len(expected))
+        for k in [0, 4321, len(layer) - 1]:
+            self.assertTrue(numpy.allclose(layer.geometry[k].outer_ring,
+                                           expected[k].outer_ring))
+    test_wkb_geometry_reading_large_layer.slow = True
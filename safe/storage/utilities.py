@@ -7,6 +7,7 @@ import re
 import copy
 import numpy
 import math
+import struct
 from ast import literal_eval
 from osgeo import ogr
 from collections import OrderedDict
@@ -43,6 +44,14 @@ TYPE_MAP = {type(None): ogr.OFTString,  # What else should this be?
             type(numpy.array([0.0])[0]): ogr.OFTReal,  # numpy.float64
             type(numpy.array([[0.0]])[0]): ogr.OFTReal}  # numpy.ndarray
 
+# Map between WKB geometry codes with z flag and OGR geometry types
+WKB_TO_OGR_GEOMETRY_TYPE = {(1, False): ogr.wkbPoint,
+                            (1, True): ogr.wkbPoint25D,
+                            (2, False): ogr.wkbLineString,
+                            (2, True): ogr.wkbLineString25D,
+                            (3, False): ogr.wkbPolygon,
+                            (3, True): ogr.wkbPolygon25D}
+
 # Map between verbose types and OGR geometry types
 INVERSE_GEOMETRY_TYPE_MAP = {'point': ogr.wkbPoint,
                              'line': ogr.wkbLineString,
@@ -1160,6 +1169,206 @@ def get_polygon_data(G):
                    inner_rings=inner_rings)
 
 
+# WKB codes of supported geometry types without dimension flags
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOLYGON = 6
+
+
+def _read_wkb_header(wkb, offset):
+    """Read header of WKB geometry starting at offset
+
+    :param wkb: WKB representation of geometry
+    :type wkb: str
+
+    :param offset: Byte offset of the geometry within wkb
+    :type offset: int
+
+    :returns: Tuple (byte_order, geometry_type, dimensions, has_z, offset)
+        where byte_order is a struct format prefix, geometry_type the WKB
+        code without dimension flags (None for measured geometries),
+        dimensions the number of values per vertex and offset the byte
+        offset following the header.
+    :rtype: tuple
+    """
+
+    if struct.unpack_from('B', wkb, offset)[0] == 1:
+        byte_order = '<'
+    else:
+        byte_order = '>'
+    code = struct.unpack_from(byte_order + 'I', wkb, offset + 1)[0]
+
+    # Dimensions are flagged either as in OGR (e.g. 0x80000003 for 2.5D
+    # polygons) or as in ISO WKB (e.g. 1003 for polygons with z)
+    iso_flag = (code & 0xffff) // 1000
+    has_z = bool(code & 0x80000000) or iso_flag in [1, 3]
+    has_m = bool(code & 0x40000000) or iso_flag in [2, 3]
+    geometry_type = (code & 0xffff) % 1000
+    if has_m:
+        geometry_type = None
+
+    return byte_order, geometry_type, 2 + has_z + has_m, has_z, offset + 5
+
+
+def _read_wkb_vertices(wkb, offset, byte_order, dimensions, count, chunks):
+    """Append x and y of count WKB vertices at offset to chunks
+
+    :returns: Byte offset following the vertices
+    :rtype: int
+    """
+
+    A = numpy.frombuffer(wkb, dtype=byte_order + 'f8',
+                         count=count * dimensions, offset=offset)
+    chunks.append(A.reshape(count, dimensions)[:, :2])
+    return offset + 8 * count * dimensions
+
+
+def _read_wkb_polygon(wkb, offset, byte_order, dimensions, chunks,
+                      ring_sizes):
+    """Append vertices and ring sizes of WKB polygon body at offset
+
+    :returns: Tuple of byte offset following the polygon and number of
+        rings in it
+    :rtype: tuple
+    """
+
+    number_of_rings = struct.unpack_from(byte_order + 'I', wkb, offset)[0]
+    offset += 4
+    for _ in range(number_of_rings):
+        N = struct.unpack_from(byte_order + 'I', wkb, offset)[0]
+        offset = _read_wkb_vertices(
+            wkb, offset + 4, byte_order, dimensions, N, chunks)
+        ring_sizes.append(N)
+
+    return offset, number_of_rings
+
+
+def wkb_to_arrays(geometries):
+    """Decode WKB geometries into flat coordinate arrays
+
+    :param geometries: WKB representation of each geometry as returned by
+        ExportToWkb. Points, lines, polygons and multipolygons are
+        supported.
+    :type geometries: list
+
+    :returns: Tuple (geometry_type, coordinates, ring_offsets,
+        geometry_offsets) or None if geometries are of different or
+        unsupported types or if there are none. See note below.
+    :rtype: tuple
+
+    Note:
+        Coordinates is an Mx2 array of all vertices (lon, lat). Ring i
+        consists of coordinates[ring_offsets[i]:ring_offsets[i + 1]] and
+        geometry k of rings geometry_offsets[k] to geometry_offsets[k + 1].
+        Points are read as rings of one vertex.
+
+        As in Vector.read_from_file, z values are ignored, multipolygons
+        are read as one polygon with all rings (like ogr.ForceToPolygon)
+        and geometry_type is the OGR type of the last geometry.
+
+        Only the vertices of each ring are copied in numpy, so this is
+        much faster than reading vertices one by one through OGR.
+    """
+
+    chunks = []
+    ring_sizes = []
+    geometry_sizes = []
+    common_type = None
+    geometry_type = None
+    for wkb in geometries:
+        byte_order, wkb_type, dimensions, has_z, offset = _read_wkb_header(
+            wkb, 0)
+
+        if wkb_type == WKB_POINT:
+            _read_wkb_vertices(wkb, offset, byte_order, dimensions, 1, chunks)
+            ring_sizes.append(1)
+            number_of_rings = 1
+        elif wkb_type == WKB_LINESTRING:
+            N = struct.unpack_from(byte_order + 'I', wkb, offset)[0]
+            _read_wkb_vertices(
+                wkb, offset + 4, byte_order, dimensions, N, chunks)
+            ring_sizes.append(N)
+            number_of_rings = 1
+        elif wkb_type == WKB_POLYGON:
+            _, number_of_rings = _read_wkb_polygon(
+                wkb, offset, byte_order, dimensions, chunks, ring_sizes)
+        elif wkb_type == WKB_MULTIPOLYGON:
+            number_of_parts = struct.unpack_from(
+                byte_order + 'I', wkb, offset)[0]
+            offset += 4
+            number_of_rings = 0
+            for _ in range(number_of_parts):
+                (part_byte_order, part_type, part_dimensions, _,
+                 offset) = _read_wkb_header(wkb, offset)
+                if part_type != WKB_POLYGON:
+                    return None
+                offset, n = _read_wkb_polygon(
+                    wkb, offset, part_byte_order, part_dimensions, chunks,
+                    ring_sizes)
+                number_of_rings += n
+            wkb_type = WKB_POLYGON
+            has_z = False
+        else:
+            return None
+
+        if number_of_rings == 0:
+            # Empty geometries are left to OGR
+            return None
+
+        if common_type is None:
+            common_type = wkb_type
+        elif common_type != wkb_type:
+            return None
+
+        geometry_type = WKB_TO_OGR_GEOMETRY_TYPE[(wkb_type, has_z)]
+        geometry_sizes.append(number_of_rings)
+
+    if common_type is None:
+        return None
+
+    coordinates = numpy.array(numpy.concatenate(chunks), dtype='d',
+                              copy=False)
+    ring_offsets = numpy.zeros(len(ring_sizes) + 1, dtype=numpy.int)
+    numpy.cumsum(ring_sizes, out=ring_offsets[1:])
+    geometry_offsets = numpy.zeros(len(geometry_sizes) + 1, dtype=numpy.int)
+    numpy.cumsum(geometry_sizes, out=geometry_offsets[1:])
+
+    return geometry_type, coordinates, ring_offsets, geometry_offsets
+
+
+def arrays_to_geometry(geometry_type, coordinates, ring_offsets,
+                       geometry_offsets):
+    """Create geometry as stored in Vector layers from flat arrays
+
+    :param geometry_type: OGR geometry type
+    :type geometry_type: int
+
+    :param coordinates, ring_offsets, geometry_offsets: Flat coordinate
+        arrays as returned by wkb_to_arrays
+
+    :returns: List of (lon, lat) tuples for points, list of Nx2 arrays for
+        lines and list of Polygon instances for polygons. Rings are views
+        into coordinates.
+    :rtype: list
+    """
+
+    if geometry_type in [ogr.wkbPoint, ogr.wkbPoint25D]:
+        return zip(coordinates[:, 0].tolist(), coordinates[:, 1].tolist())
+
+    rings = numpy.split(coordinates, ring_offsets[1:-1])
+    if geometry_type in [ogr.wkbLineString, ogr.wkbLineString25D]:
+        return [rings[i] for i in geometry_offsets[:-1]]
+
+    geometry = []
+    for i in range(len(geometry_offsets) - 1):
+        first = geometry_offsets[i]
+        last = geometry_offsets[i + 1]
+        geometry.append(Polygon(outer_ring=rings[first],
+                                inner_rings=rings[first + 1:last]))
+    return geometry
+
+
 def safe_to_qgis_layer(layer):
     """Helper function to make a QgsMapLayer from a safe read_layer layer.
 
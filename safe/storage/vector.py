@@ -41,7 +41,7 @@ from safe.common.exceptions import (
 )
 from layer import Layer
 from projection import Projection
-from geometry import Polygon
+from geometry import Polygon, PackedGeometry, pack_geometry
 from utilities import verify
 from utilities import DRIVER_MAP, TYPE_MAP
 from utilities import read_keywords
@@ -53,9 +53,10 @@ from utilities import calculate_polygon_centroid
 from utilities import points_along_line
 from utilities import geometry_type_to_string
 from utilities import get_ring_data, get_polygon_data
+from utilities import wkb_to_arrays, arrays_to_geometry
 from utilities import rings_equal
 from utilities import safe_to_qgis_layer
-from safe.common.utilities import unique_filename
+from safe.common.utilities import unique_filename, OrderedDict
 from safe.utilities.unicode import get_string
 from safe.utilities.i18n import tr
 from safe.utilities.metadata import (
@@ -67,6 +68,11 @@ from safe.utilities.metadata import (
 LOGGER = logging.getLogger('InaSAFE')
 _pseudo_inf = float(99999999)
 
+# OGR field types stored as integer arrays
+INTEGER_FIELD_TYPES = [ogr.OFTInteger]
+if hasattr(ogr, 'OFTInteger64'):
+    INTEGER_FIELD_TYPES.append(ogr.OFTInteger64)
+
 
 # noinspection PyExceptionInherit
 class Vector(Layer):
@@ -78,6 +84,8 @@ class Vector(Layer):
                 * A filename of a vector file format known to GDAL.
                 * List of dictionaries of field names and attribute values
                   associated with each point coordinate.
+                * Dictionary of field names and arrays of attribute values
+                  with one entry for each feature.
                 * A QgsVectorLayer associated with geometry and data.
                 * None
             * projection: Geospatial reference in WKT format.
@@ -133,6 +141,11 @@ class Vector(Layer):
             list of polygon geometry objects
             (as defined in module geometry.py)
 
+            Attributes read from file are stored by column as numpy arrays.
+            The list of dictionaries returned by get_data() is created
+            from the columns on first access and is used from then on, so
+            changes made to it are preserved.
+
     """
 
     def __init__(
@@ -161,6 +174,13 @@ class Vector(Layer):
             style_info=style_info,
             sublayer=sublayer)
 
+        # Geometry packed into flat arrays and the geometry it was made from
+        self._packed_geometry = None
+
+        # Attributes as a list of dictionaries or as columns, see data
+        self._data = None
+        self._columns = None
+
         # Input checks
         if data is None and geometry is None:
             # Instantiate empty object
@@ -203,13 +223,18 @@ class Vector(Layer):
             if data is None:
                 # Generate default attribute as OGR will do that anyway
                 # when writing
-                data = []
-                for i in range(len(geometry)):
-                    data.append({'ID': i})
+                data = {'ID': numpy.arange(len(geometry), dtype=numpy.int)}
 
             # Check data
-            self.data = data
-            if data is not None:
+            if isinstance(data, dict):
+                for name in data:
+                    msg = ('The number of entries in geometry (%s) and '
+                           'attribute %s (%s) must be the same'
+                           % (len(geometry), name, len(data[name])))
+                    verify(len(geometry) == len(data[name]), msg)
+                self.set_columns(data)
+            else:
+                self.data = data
                 msg = 'Data must be a sequence'
                 verify(is_sequence(data), msg)
 
@@ -487,9 +512,71 @@ class Vector(Layer):
 
         layer.ResetReading()
 
-        # Extract coordinates and attributes for all features
+        # Get attribute names and types once for all features
+        layer_definition = layer.GetLayerDefn()
+        field_names = []
+        field_types = []
+        for j in range(layer_definition.GetFieldCount()):
+            field_definition = layer_definition.GetFieldDefn(j)
+            field_names.append(field_definition.GetName())
+            field_types.append(field_definition.GetType())
+
+        # Extract geometries as WKB and attributes for all features
+        wkb_geometries = []
+        values = [[] for _ in field_names]
+        # Use feature iterator
+        for feature in layer:
+            G = feature.GetGeometryRef()
+            if G is None:
+                msg = ('Geometry was None in filename %s ' % filename)
+                raise ReadLayerError(msg)
+            wkb_geometries.append(G.ExportToWkb(ogr.wkbNDR))
+
+            # Record attributes by field
+            for j, field_values in enumerate(values):
+                field_values.append(feature.GetField(j))
+
+        # Decode coordinates of all geometries at once
+        arrays = wkb_to_arrays(wkb_geometries)
+        if arrays is None:
+            geometry = self._read_geometry(layer, filename)
+        else:
+            self.geometry_type = arrays[0]
+            geometry = arrays_to_geometry(*arrays)
+            if not self.is_point_data:
+                packed = PackedGeometry(*arrays[1:],
+                                        lines=self.is_line_data)
+                self._packed_geometry = (geometry, packed)
+
+        # Store geometry coordinates as a compact numeric array
+        self.geometry = geometry
+
+        # Store attributes as one array per field
+        columns = OrderedDict()
+        for j, name in enumerate(field_names):
+            columns[name] = attribute_column(values[j], field_types[j])
+        self.set_columns(columns)
+
+    def _read_geometry(self, layer, filename):
+        """Read geometries feature by feature through OGR
+
+        This is used for geometries that wkb_to_arrays can not decode.
+
+        :param layer: OGR layer
+        :type layer: ogr.Layer
+
+        :param filename: Name of file the layer was read from
+        :type filename: str
+
+        :raises: ReadLayerError
+
+        :returns: List of geometries as stored in self.geometry
+        :rtype: list
+        """
+
+        layer.ResetReading()
+
         geometry = []
-        data = []
         # Use feature iterator
         for feature in layer:
             # Record coordinates ordered as Longitude, Latitude
@@ -533,34 +620,7 @@ class Vector(Layer):
                                         self.geometry_type))
                     raise ReadLayerError(msg)
 
-            # Record attributes by name
-            number_of_fields = feature.GetFieldCount()
-            fields = {}
-            for j in range(number_of_fields):
-                name = feature.GetFieldDefnRef(j).GetName()
-
-                # FIXME (Ole): Ascertain the type of each field?
-                #              We need to cast each appropriately?
-                #              This is issue #66
-                #              (https://github.com/AIFDR/riab/issues/66)
-                # feature_type = feature.GetFieldDefnRef(j).GetType()
-                fields[name] = feature.GetField(j)
-
-                # We do this because there is NaN problem on windows
-                # NaN value must be converted to _pseudo_in to solve the
-                # problem. But, when InaSAFE read the file, it'll be
-                # converted back to NaN value, so that NaN in InaSAFE is a
-                # numpy.nan
-                # please check https://github.com/AIFDR/inasafe/issues/269
-                # for more information
-                if fields[name] == _pseudo_inf:
-                    fields[name] = float('nan')
-                    # print 'Field', name, feature_type, j, fields[name]
-
-            data.append(fields)
-        # Store geometry coordinates as a compact numeric array
-        self.geometry = geometry
-        self.data = data
+        return geometry
 
     def read_from_qgis_native(self, qgis_layer):
         """Read and unpack vector data from qgis layer QgsVectorLayer.
@@ -838,22 +898,110 @@ class Vector(Layer):
         This copy will be equal to self in the sense defined by __eq__
         """
 
+        if not hasattr(self, 'geometry'):
+            # Empty layer
+            return Vector(projection=self.get_projection(),
+                          keywords=self.get_keywords())
+
         if self.is_polygon_data:
             geometry = self.get_geometry(copy=True, as_geometry_objects=True)
         else:
             geometry = self.get_geometry(copy=True)
 
-        return Vector(data=self.get_data(copy=True),
+        if self._columns is not None:
+            data = self.get_columns(copy=True)
+        else:
+            data = self.get_data(copy=True)
+
+        return Vector(data=data,
                       geometry=geometry,
                       projection=self.get_projection(),
                       keywords=self.get_keywords())
 
+    @property
+    def data(self):
+        """List of dictionaries with the attributes of each feature
+
+        Note:
+            If attributes are stored by column, the list is created on
+            first access. It then replaces the columns, so that changes
+            made to the dictionaries are seen by all methods.
+        """
+
+        if self._data is None and self._columns is not None:
+            names = self._columns.keys()
+            columns = [self._columns[name].tolist() for name in names]
+            if len(names) > 0:
+                self._data = [dict(zip(names, row)) for row in zip(*columns)]
+            else:
+                self._data = [{} for _ in range(len(self))]
+            self._columns = None
+
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        """Set attributes as a list of dictionaries, one for each feature
+        """
+
+        self._data = data
+        self._columns = None
+
+    def set_columns(self, columns):
+        """Set attributes as arrays of values, one for each attribute
+
+        :param columns: Dictionary of attribute names and sequences with
+            one value for each feature. Sequences that are not numpy
+            arrays are converted.
+        :type columns: dict
+        """
+
+        self._data = None
+        self._columns = OrderedDict()
+        for name in columns:
+            column = columns[name]
+            if not isinstance(column, numpy.ndarray):
+                column = attribute_column(list(column))
+            self._columns[name] = column
+
+    def get_columns(self, copy=False):
+        """Get attributes as arrays of values, one for each attribute
+
+        :param copy: Indicate whether to return the stored arrays or copies.
+        :type copy: bool
+
+        :returns: Ordered dictionary of attribute names and arrays.
+        :rtype: OrderedDict
+
+        Note:
+            If attributes are stored as a list of dictionaries, the arrays
+            are created from it and are not stored.
+        """
+
+        if self._columns is not None:
+            columns = OrderedDict()
+            for name in self._columns:
+                if copy:
+                    columns[name] = self._columns[name].copy()
+                else:
+                    columns[name] = self._columns[name]
+            return columns
+
+        columns = OrderedDict()
+        if self._data is not None and len(self._data) > 0:
+            for name in self._data[0]:
+                columns[name] = attribute_column(
+                    [x[name] for x in self._data])
+        return columns
+
     def get_attribute_names(self):
         """Get available attribute names.
 
         These are the ones that can be used with get_data
         """
 
+        if self._columns is not None:
+            return self._columns.keys()
         return self.data[0].keys()
 
     def get_data(self, attribute=None, index=None, copy=False):
@@ -873,8 +1021,8 @@ class Vector(Layer):
         :raises: GetDataError
 
         :returns: A list where each entry is a dictionary of attributes for one
-            feature.
-        :rtype: list,
+            feature, the values of one attribute or a single value.
+        :rtype: list, numpy.ndarray
 
         Note:
             Data is returned as a list where each entry is a dictionary of
@@ -882,17 +1030,45 @@ class Vector(Layer):
             get_data() are related as 1-to-1
 
             If optional argument attribute is specified and a valid name,
-            then the list of values for that attribute is returned.
+            then the list of values for that attribute is returned. If
+            attributes are stored by column, the stored array is returned
+            instead, itself unless copy is True.
 
             If optional argument index is specified on the that value will
             be returned. Any value of index is ignored if attribute is None.
 
-            If optional argument copy is True and all attributes are requested,
-            a copy will be returned. Otherwise a pointer to the data is
-            returned.
+            If optional argument copy is True, a copy will be returned.
+            Otherwise a pointer to the data is returned.
         """
 
-        if hasattr(self, 'data'):
+        if self._columns is not None and attribute is not None:
+            msg = ('Specified attribute %s does not exist in '
+                   'vector layer %s. Valid names are %s'
+                   '' % (attribute, self, self._columns.keys()))
+            verify(attribute in self._columns, msg)
+
+            column = self._columns[attribute]
+            if index is None:
+                if copy:
+                    return column.copy()
+                else:
+                    return column
+            else:
+                msg = ('Specified index must be either None or '
+                       'an integer. I got %s' % index)
+                verify(isinstance(index, int), msg)
+
+                msg = ('Specified index must lie within the bounds '
+                       'of vector layer %s which is [%i, %i]'
+                       '' % (self, 0, len(self) - 1))
+                verify(0 <= index < len(self), msg)
+
+                value = column[index]
+                if isinstance(value, numpy.generic):
+                    value = value.item()
+                return value
+
+        if self.data is not None:
             if attribute is None:
                 if copy:
                     return copy_module.deepcopy(self.data)
@@ -977,6 +1153,35 @@ class Vector(Layer):
 
         return geometry
 
+    def get_packed_geometry(self):
+        """Return line or polygon geometry packed into flat arrays.
+
+        All vertices are kept in one array together with the offsets of
+        rings and features and the bounding box of each feature
+        (see PackedGeometry in geometry.py). The polygon algorithms in
+        safe/gis/polygon.py accept this in place of a list of polygons.
+
+        Geometry read from file is packed as it is decoded. Otherwise it
+        is packed on first use and kept until self.geometry is replaced.
+
+        :raises: InaSAFEError
+
+        :returns: Packed geometry of all features.
+        :rtype: PackedGeometry
+        """
+
+        if not (self.is_polygon_data or self.is_line_data):
+            msg = ('Packed geometry is only available for line and '
+                   'polygon data')
+            raise InaSAFEError(msg)
+
+        if (self._packed_geometry is None or
+                self._packed_geometry[0] is not self.geometry):
+            packed = pack_geometry(self.geometry, lines=self.is_line_data)
+            self._packed_geometry = (self.geometry, packed)
+
+        return self._packed_geometry[1]
+
     def get_bounding_box(self):
         """Get bounding box coordinates for vector layer.
 
@@ -1096,6 +1301,59 @@ class Vector(Layer):
 # ----------------------------------
 # Helper functions for class Vector
 # ----------------------------------
+def attribute_column(values, field_type=None):
+    """Convert list of attribute values to an array
+
+    :param values: Attribute values, one for each feature
+    :type values: list
+
+    :param field_type: Optional OGR field type the values were read as.
+        If None, the type is inferred from the values.
+    :type field_type: int
+
+    :returns: Integer or float array if all values are numbers of that
+        type, otherwise an object array holding the values as given.
+    :rtype: numpy.ndarray
+
+    Note:
+        Values read from file that are equal to _pseudo_inf are converted
+        to NaN as they represent NaN stored by write_to_file (issue #269).
+    """
+
+    from_file = field_type is not None
+    if not from_file:
+        types = set([type(x) for x in values])
+        if types == set([float]):
+            field_type = ogr.OFTReal
+        elif types == set([int]):
+            field_type = ogr.OFTInteger
+
+    if field_type == ogr.OFTReal and None not in values:
+        A = numpy.array(values, dtype=numpy.float)
+        if from_file:
+            A[A == _pseudo_inf] = numpy.nan
+        return A
+
+    if (field_type in INTEGER_FIELD_TYPES and None not in values and
+            not (from_file and _pseudo_inf in values)):
+        try:
+            return numpy.array(values, dtype=numpy.int)
+        except OverflowError:
+            pass
+
+    if from_file:
+        values = [float('nan') if x == _pseudo_inf else x for x in values]
+
+    A = numpy.empty(len(values), dtype=object)
+    try:
+        A[:] = values
+    except ValueError:
+        # Values are themselves sequences
+        for i, x in enumerate(values):
+            A[i] = x
+    return A
+
+
 def convert_line_to_points(V, delta):
     """Convert line vector data to point vector data
 
@@ -1166,3 +1424,118 @@ def convert_polygons_to_centroids(V):
                name='%s_centroid_data' % V.get_name(),
                keywords=V.get_keywords())
     return V
+
+
+def vector_from_wkb(wkb_geometries, field_names, values, field_types=None,
+                    projection=None, name=None, keywords=None):
+    """Create vector layer from features held in memory
+
+    This is the counterpart of Vector.read_from_file for features that
+    have not been written to a file, e.g. features clipped in QGIS.
+    Attribute names are kept as given rather than truncated to fit into
+    a shapefile.
+
+    :param wkb_geometries: WKB representation of each geometry
+    :type wkb_geometries: list
+
+    :param field_names: Attribute names
+    :type field_names: list
+
+    :param values: Attribute values, one list per field with a value for
+        each feature
+    :type values: list
+
+    :param field_types: Optional OGR field type of each field. Types are
+        inferred from the values where this is None.
+    :type field_types: list
+
+    :param projection: Projection of the geometries
+    :type projection: str, Projection
+
+    :param name: Name of the layer
+    :type name: str
+
+    :param keywords: Keywords of the layer
+    :type keywords: dict
+
+    :raises: ReadLayerError
+
+    :returns: Vector layer
+    :rtype: Vector
+    """
+
+    if field_types is None:
+        field_types = [None] * len(field_names)
+
+    # Store attributes as one array per field
+    columns = OrderedDict()
+    for j, field_name in enumerate(field_names):
+        columns[field_name] = attribute_column(values[j], field_types[j])
+
+    # Decode coordinates of all geometries at once
+    packed = None
+    arrays = wkb_to_arrays(wkb_geometries)
+    if arrays is None:
+        geometry, geometry_type = _wkb_to_geometry(wkb_geometries)
+    else:
+        geometry = arrays_to_geometry(*arrays)
+        geometry_type = arrays[0]
+        if geometry_type in [ogr.wkbLineString, ogr.wkbLineString25D]:
+            packed = PackedGeometry(*arrays[1:], lines=True)
+        elif geometry_type not in [ogr.wkbPoint, ogr.wkbPoint25D]:
+            packed = PackedGeometry(*arrays[1:])
+
+    if geometry_type in [ogr.wkbPoint, ogr.wkbPoint25D]:
+        geometry_type = 'point'
+    elif geometry_type in [ogr.wkbLineString, ogr.wkbLineString25D]:
+        geometry_type = 'line'
+    else:
+        geometry_type = None
+
+    V = Vector(data=columns,
+               projection=projection,
+               geometry=geometry,
+               geometry_type=geometry_type,
+               name=name,
+               keywords=keywords)
+    if packed is not None and V.geometry is geometry:
+        V._packed_geometry = (geometry, packed)
+    return V
+
+
+def _wkb_to_geometry(wkb_geometries):
+    """Decode WKB geometries one by one through OGR
+
+    This is used for geometries that wkb_to_arrays can not decode, e.g.
+    a mix of polygons and multipolygons.
+
+    :param wkb_geometries: WKB representation of each geometry
+    :type wkb_geometries: list
+
+    :raises: ReadLayerError
+
+    :returns: Tuple of the geometry as stored in Vector layers and the
+        OGR type of the last geometry (None if there are no geometries)
+    :rtype: tuple
+    """
+
+    geometry = []
+    geometry_type = None
+    for wkb in wkb_geometries:
+        G = ogr.CreateGeometryFromWkb(wkb)
+        geometry_type = ogr.GT_Flatten(G.GetGeometryType())
+        if geometry_type == ogr.wkbPoint:
+            geometry.append((G.GetX(), G.GetY()))
+        elif geometry_type == ogr.wkbLineString:
+            geometry.append(get_ring_data(G))
+        elif geometry_type in [ogr.wkbPolygon, ogr.wkbMultiPolygon]:
+            # Read multipolygons as single part like read_from_file
+            geometry_type = ogr.wkbPolygon
+            polygon = get_polygon_data(ogr.ForceToPolygon(G))
+            geometry.append(polygon)
+        else:
+            msg = ('Only point, line and polygon geometries are '
+                   'supported. Geometry type was %s.' % geometry_type)
+            raise ReadLayerError(msg)
+
+    return geometry, geometry_type
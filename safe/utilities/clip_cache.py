@@ -0,0 +1,495 @@
+# coding=utf-8
+"""InaSAFE Disaster risk assessment tool developed by AusAid -
+  **Cache of clipped layers.**
+
+.. note:: This program is free software; you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation; either version 2 of the License, or
+   (at your option) any later version.
+
+"""
+
+__author__ = 'agent@local'
+__revision__ = '$Format:%H$'
+__date__ = '17/10/2026'
+__copyright__ = 'Copyright 2026, Australia Indonesia Facility for '
+__copyright__ += 'Disaster Reduction'
+
+import os
+import glob
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from os.path import expanduser
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from osgeo import gdal
+from qgis.core import QgsMapLayer, QgsVectorLayer, QgsRasterLayer
+from PyQt4.QtCore import QSettings
+
+from safe.common.utilities import temp_dir
+from safe.utilities.keyword_io import KeywordIO
+
+LOGGER = logging.getLogger('InaSAFE')
+
+
+def default_clip_cache_path():
+    """Get the default directory of the clip cache.
+
+    :returns: The path to the default clip cache directory which is
+        ~/.inasafe/clip_cache
+    :rtype: str
+    """
+    home = expanduser('~')
+    return os.path.abspath(os.path.join(home, '.inasafe', 'clip_cache'))
+
+
+def dataset_files(path):
+    """Get the files making up a data set e.g. a shapefile and its sidecars.
+
+    :param path: Path to the main file of the data set.
+    :type path: str
+
+    :returns: Sorted paths of the main file and of all the files sharing its
+        base name.
+    :rtype: list
+    """
+    base, _ = os.path.splitext(path)
+    files = set(glob.glob(base + '.*'))
+    files.add(path)
+    return sorted(item for item in files if os.path.isfile(item))
+
+
+def store_dataset(path, directory):
+    """Copy a clipped data set to a directory.
+
+    Virtual rasters are warped from their source each time they are read,
+    so their pixels are written to a GeoTIFF instead of copying the
+    virtual raster.
+
+    :param path: Path to the main file of the data set.
+    :type path: str
+
+    :param directory: Existing directory to copy the data set to.
+    :type directory: str
+
+    :returns: Name of the main file of the copy or None if a virtual raster
+        could not be written to a GeoTIFF.
+    :rtype: str, None
+    """
+    is_virtual = path.lower().endswith('.vrt')
+    for file_name in dataset_files(path):
+        if is_virtual and os.path.basename(file_name).startswith(
+                os.path.basename(path)):
+            # The virtual raster itself and its auxiliary files
+            continue
+        shutil.copyfile(
+            file_name, os.path.join(directory, os.path.basename(file_name)))
+
+    if not is_virtual:
+        return os.path.basename(path)
+
+    main_file = os.path.splitext(os.path.basename(path))[0] + '.tif'
+    dataset = gdal.Translate(
+        os.path.join(directory, main_file), path, format='GTiff')
+    if dataset is None:
+        return None
+    dataset = None  # Close
+    return main_file
+
+
+def _lock_file(lock_file):
+    """Take an exclusive lock on an open file, waiting until it is free.
+
+    :param lock_file: The open file.
+    :type lock_file: file
+    """
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except IOError:
+            # LK_LOCK gives up after 10 seconds
+            continue
+
+
+def _unlock_file(lock_file):
+    """Release the lock taken on an open file by _lock_file.
+
+    :param lock_file: The open file.
+    :type lock_file: file
+    """
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        return
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ClipCache(object):
+    """A size bounded cache of clipped layers kept on disk.
+
+    Entries are keyed by the content of the source data set and by all the
+    parameters of the clip. The content hash of a source is only computed
+    again when the modification time or the size of one of its files
+    changes. When the cache grows above its maximum size the least recently
+    used entries are removed.
+
+    The index of the cache is locked while it is updated, so several
+    threads and QGIS instances can share the same cache directory.
+
+    Layers returned from the cache are copies of the cached files so the
+    caller is free to modify them.
+    """
+
+    def __init__(self, path=None, max_size=1024 * 1024 * 1024):
+        """Constructor for the ClipCache class.
+
+        :param path: Directory holding the cached layers. Defaults to
+            ~/.inasafe/clip_cache
+        :type path: str
+
+        :param max_size: Maximum total size of the cached files in bytes.
+        :type max_size: int
+        """
+        if path is None:
+            path = default_clip_cache_path()
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._keyword_io = KeywordIO()
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self._index_path = os.path.join(self.path, 'index.json')
+        self._lock_path = os.path.join(self.path, 'index.lock')
+        self._index = self._read_index()
+
+    @contextmanager
+    def _locked_index(self):
+        """Lock the index against other threads and processes.
+
+        The index is read again once the lock is held, so changes made by
+        other processes are kept when it is written back.
+        """
+        with self._lock:
+            with open(self._lock_path, 'a') as lock_file:
+                _lock_file(lock_file)
+                try:
+                    self._index = self._read_index()
+                    yield
+                finally:
+                    _unlock_file(lock_file)
+
+    def _read_index(self):
+        """Read the index of the cache from disk.
+
+        :returns: The index with 'entries' and 'sources' dictionaries.
+        :rtype: dict
+        """
+        try:
+            with open(self._index_path) as index_file:
+                index = json.load(index_file)
+        except (IOError, ValueError):
+            index = {}
+        index.setdefault('entries', {})
+        index.setdefault('sources', {})
+        return index
+
+    def _write_index(self):
+        """Write the index of the cache to disk.
+
+        The index is written to a temporary file which then replaces the
+        index, so it is never seen half written.
+        """
+        handle, file_name = tempfile.mkstemp('.json', 'index_', self.path)
+        with os.fdopen(handle, 'w') as index_file:
+            json.dump(self._index, index_file)
+        if os.name == 'nt' and os.path.exists(self._index_path):
+            # Windows can not rename over an existing file
+            os.remove(self._index_path)
+        os.rename(file_name, self._index_path)
+
+    def _source_signature(self, path):
+        """Get the modification times and sizes of the files of a source.
+
+        :param path: Path to the main file of the data set.
+        :type path: str
+
+        :returns: List of [file name, mtime, size] for each file.
+        :rtype: list
+        """
+        signature = []
+        for file_name in dataset_files(path):
+            status = os.stat(file_name)
+            signature.append(
+                [os.path.basename(file_name), status.st_mtime,
+                 status.st_size])
+        return signature
+
+    def content_hash(self, path):
+        """Get the hash of the content of a data set.
+
+        The hash is made by KeywordIO.hash_for_datasource from the path and
+        the files of the data set. It is remembered together with the
+        modification times and sizes of the files and only computed again
+        when one of them changes.
+
+        :param path: Path to the main file of the data set.
+        :type path: str
+
+        :returns: An md5 hash of the content of all the files of the data
+            set.
+        :rtype: str
+        """
+        path = os.path.abspath(path)
+        signature = self._source_signature(path)
+        with self._locked_index():
+            source = self._index['sources'].get(path)
+            if source is not None and source['signature'] == signature:
+                return source['hash']
+
+        hash_value = self._keyword_io.hash_for_datasource(
+            path, files=dataset_files(path))
+
+        with self._locked_index():
+            # Entries clipped from an older version of the source are stale
+            source = self._index['sources'].get(path)
+            if source is not None and source['hash'] != hash_value:
+                self._remove_entries(
+                    [key for key, entry in self._index['entries'].items()
+                     if entry['source'] == path])
+            self._index['sources'][path] = {
+                'signature': signature,
+                'hash': hash_value}
+            self._write_index()
+        return hash_value
+
+    def key(
+            self,
+            layer,
+            extent,
+            cell_size=None,
+            extra_keywords=None,
+            explode_flag=True,
+            hard_clip_flag=False,
+            explode_attribute=None):
+        """Get the cache key of a clip.
+
+        The parameters are the same as the ones of clip_layer.
+
+        :returns: The key of the clip or None if the layer is not read from
+            a local file and can not be cached.
+        :rtype: str, None
+        """
+        source = layer.source()
+        if not os.path.isfile(source):
+            return None
+
+        if hasattr(extent, 'exportToWkt'):
+            extent = extent.exportToWkt()
+        else:
+            extent = [repr(float(value)) for value in extent]
+        if cell_size is not None:
+            cell_size = repr(float(cell_size))
+        if extra_keywords is not None:
+            extra_keywords = sorted(
+                (str(key), repr(value))
+                for key, value in extra_keywords.items())
+        parameters = [
+            os.path.abspath(source),
+            self.content_hash(source),
+            layer.type(),
+            layer.crs().authid() or layer.crs().toWkt(),
+            extent,
+            cell_size,
+            extra_keywords,
+            explode_flag,
+            hard_clip_flag,
+            explode_attribute]
+
+        return self._keyword_io.hash_for_datasource(repr(parameters))
+
+    def get(self, key, layer):
+        """Get a copy of a cached clip.
+
+        The keywords of the clip, including those added while clipping,
+        are stored with it as its metadata file and copied too.
+
+        :param key: The key of the clip from ClipCache.key.
+        :type key: str
+
+        :param layer: The layer which was clipped.
+        :type layer: QgsMapLayer
+
+        :returns: The clipped layer or None if it is not in the cache.
+        :rtype: QgsMapLayer, None
+        """
+        with self._locked_index():
+            entry = self._index['entries'].get(key)
+            if entry is None:
+                return None
+            cached_files = [
+                os.path.join(self.path, key, file_name)
+                for file_name in entry['files']]
+            if not all(os.path.isfile(item) for item in cached_files):
+                self._remove_entries([key])
+                self._write_index()
+                return None
+            entry['last_used'] = time.time()
+            self._write_index()
+
+            # Copy the files under a new base name in the work directory
+            extension = os.path.splitext(entry['main_file'])[1]
+            handle, file_name = tempfile.mkstemp(
+                extension, 'clip_', temp_dir())
+            os.close(handle)
+            os.remove(file_name)
+            base = os.path.splitext(file_name)[0]
+            main_base = os.path.splitext(entry['main_file'])[0]
+            for cached_file in cached_files:
+                suffix = os.path.basename(cached_file)[len(main_base):]
+                shutil.copyfile(cached_file, base + suffix)
+
+        LOGGER.debug('Clip of %s read from the cache' % layer.source())
+        base_name = '%s clipped' % layer.name()
+        if layer.type() == QgsMapLayer.VectorLayer:
+            return QgsVectorLayer(file_name, base_name, 'ogr')
+        return QgsRasterLayer(file_name, base_name)
+
+    def put(self, key, layer, clipped_layer):
+        """Store a clipped layer in the cache.
+
+        Clipped rasters are stored as GeoTIFF, see store_dataset.
+
+        :param key: The key of the clip from ClipCache.key.
+        :type key: str
+
+        :param layer: The layer which was clipped.
+        :type layer: QgsMapLayer
+
+        :param clipped_layer: The clipped layer.
+        :type clipped_layer: QgsMapLayer
+        """
+        # Copy the files before taking the lock, then move them in place
+        directory = tempfile.mkdtemp('', 'new_', self.path)
+        try:
+            main_file = store_dataset(clipped_layer.source(), directory)
+        except (IOError, OSError):
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        files = sorted(os.listdir(directory))
+        size = sum(
+            os.path.getsize(os.path.join(directory, item)) for item in files)
+        if main_file is None or size > self.max_size:
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+
+        with self._locked_index():
+            self._remove_entries([key])
+            os.rename(directory, os.path.join(self.path, key))
+            self._index['entries'][key] = {
+                'source': os.path.abspath(layer.source()),
+                'main_file': main_file,
+                'files': files,
+                'size': size,
+                'last_used': time.time()}
+            self._evict()
+            self._write_index()
+
+    def invalidate(self, path=None):
+        """Remove the cached clips of a source or all of them.
+
+        :param path: Path to the source data set. If None the whole cache
+            is cleared.
+        :type path: str
+        """
+        with self._locked_index():
+            if path is None:
+                keys = list(self._index['entries'].keys())
+                self._index['sources'] = {}
+            else:
+                path = os.path.abspath(path)
+                keys = [
+                    key for key, entry in self._index['entries'].items()
+                    if entry['source'] == path]
+                self._index['sources'].pop(path, None)
+            self._remove_entries(keys)
+            self._write_index()
+
+    def size(self):
+        """Get the total size of the cached files.
+
+        :returns: The size in bytes.
+        :rtype: int
+        """
+        with self._locked_index():
+            return sum(
+                entry['size'] for entry in self._index['entries'].values())
+
+    def _evict(self):
+        """Remove the least recently used entries above the maximum size."""
+        entries = sorted(
+            self._index['entries'].items(),
+            key=lambda item: item[1]['last_used'])
+        size = sum(entry['size'] for _, entry in entries)
+        keys = []
+        for key, entry in entries:
+            if size <= self.max_size:
+                break
+            keys.append(key)
+            size -= entry['size']
+        self._remove_entries(keys)
+
+    def _remove_entries(self, keys):
+        """Remove entries and their files from the cache.
+
+        :param keys: Keys of the entries to remove.
+        :type keys: list
+        """
+        for key in keys:
+            self._index['entries'].pop(key, None)
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+
+
+_CLIP_CACHE = None
+_CLIP_CACHE_LOCK = threading.Lock()
+
+
+def get_clip_cache():
+    """Get the clip cache configured in the settings.
+
+    The size of the cache in megabytes is read from inasafe/clip_cache_size
+    and its directory from inasafe/clip_cache_path. The cache is disabled
+    unless a size is set, since it keeps up to that many megabytes of
+    clipped layers on disk.
+
+    :returns: The clip cache or None if it is disabled.
+    :rtype: ClipCache, None
+    """
+    global _CLIP_CACHE
+    settings = QSettings()
+    max_size = settings.value('inasafe/clip_cache_size', 0, type=int)
+    path = settings.value(
+        'inasafe/clip_cache_path', default_clip_cache_path(), type=str)
+    if max_size <= 0:
+        return None
+    max_size *= 1024 * 1024
+    with _CLIP_CACHE_LOCK:
+        if (_CLIP_CACHE is None or _CLIP_CACHE.path != path or
+                _CLIP_CACHE.max_size != max_size):
+            _CLIP_CACHE = ClipCache(path, max_size)
+        return _CLIP_CACHE
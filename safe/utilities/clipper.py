@@ -19,6 +19,9 @@ __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
 import os
+import sys
+import time
+import threading
 import tempfile
 import logging
 
@@ -33,9 +36,12 @@ from qgis.core import (
     QgsGeometry,
     QgsVectorLayer,
     QgsRasterLayer)
-from PyQt4.QtCore import QProcess
+from PyQt4.QtCore import QProcess, QPyNullVariant, QVariant
+from osgeo import ogr
 
 from safe.common.utilities import temp_dir, which, verify
+from safe.gis.gdal_ogr_tools import warp_raster
+from safe.utilities.clip_cache import get_clip_cache
 from safe.utilities.keyword_io import KeywordIO
 from safe.common.exceptions import (
     InvalidParameterError,
@@ -47,6 +53,8 @@ from safe.common.exceptions import (
     NoKeywordsFoundError
 )
 from safe.storage.utilities import read_keywords
+from safe.storage.projection import DEFAULT_PROJECTION
+from safe.storage.vector import vector_from_wkb
 from safe.utilities.metadata import (
     read_iso19115_metadata,
     write_read_iso_19115_metadata
@@ -55,6 +63,12 @@ from safe.definitions import multipart_polygon_key
 
 LOGGER = logging.getLogger(name='InaSAFE')
 
+# OGR types of QGIS attribute fields kept by in memory clipping
+OGR_FIELD_TYPES = {
+    QVariant.Int: ogr.OFTInteger,
+    QVariant.LongLong: ogr.OFTInteger,
+    QVariant.Double: ogr.OFTReal}
+
 
 def clip_layer(
         layer,
@@ -63,7 +77,8 @@ def clip_layer(
         extra_keywords=None,
         explode_flag=True,
         hard_clip_flag=False,
-        explode_attribute=None):
+        explode_attribute=None,
+        in_memory=False):
     """Clip a Hazard or Exposure layer to the extents provided.
 
     .. note:: Will delegate to clipVectorLayer or clipRasterLayer as needed.
@@ -107,22 +122,49 @@ def clip_layer(
         **This parameter is ignored for raster layer clipping.**
     :type explode_attribute: str
 
+    :param in_memory: A bool specifying whether clipped vector features
+        should be returned as a safe Vector layer held in memory rather
+        than written to a shapefile.
+        **This parameter is ignored for raster layer clipping.**
+    :type in_memory: bool
+
     :returns: Clipped layer (placed in the system temp dir). The output layer
-        will be reprojected to EPSG:4326 if needed.
-    :rtype: QgsMapLayer
+        will be reprojected to EPSG:4326 if needed. Layers written to disk
+        are taken from the clip cache when the same clip was done before,
+        see get_clip_cache. Their keywords, including the ones added while
+        clipping, are cached with them.
+    :rtype: QgsMapLayer, Vector
     """
+    if extra_keywords is not None:
+        # Clipping adds keywords, leave the dictionary of the caller as is
+        extra_keywords = dict(extra_keywords)
+
+    clip_cache, key = _clip_cache_key(
+        layer,
+        extent,
+        cell_size=cell_size,
+        extra_keywords=extra_keywords,
+        explode_flag=explode_flag,
+        hard_clip_flag=hard_clip_flag,
+        explode_attribute=explode_attribute,
+        in_memory=in_memory)
+    if key is not None:
+        clipped_layer = clip_cache.get(key, layer)
+        if clipped_layer is not None:
+            return clipped_layer
 
     if layer.type() == QgsMapLayer.VectorLayer:
-        return _clip_vector_layer(
+        clipped_layer = _clip_vector_layer(
             layer,
             extent,
             extra_keywords=extra_keywords,
             explode_flag=explode_flag,
             hard_clip_flag=hard_clip_flag,
-            explode_attribute=explode_attribute)
+            explode_attribute=explode_attribute,
+            in_memory=in_memory)
     else:
         try:
-            return _clip_raster_layer(
+            clipped_layer = _clip_raster_layer(
                 layer,
                 extent,
                 cell_size,
@@ -132,6 +174,173 @@ def clip_layer(
         except IOError, e:
             raise e
 
+    if key is not None:
+        clip_cache.put(key, layer, clipped_layer)
+    return clipped_layer
+
+
+def _clip_cache_key(
+        layer,
+        extent,
+        cell_size=None,
+        extra_keywords=None,
+        explode_flag=True,
+        hard_clip_flag=False,
+        explode_attribute=None,
+        in_memory=False):
+    """Get the clip cache and the key of a clip in it.
+
+    The parameters are the ones of clip_layer.
+
+    :returns: The clip cache and the key of the clip, or (None, None) if the
+        clip is not cached: the cache is disabled or the clipped vector
+        layer is held in memory.
+    :rtype: (ClipCache, str)
+    """
+    clip_cache = None
+    key = None
+    if not (in_memory and layer.type() == QgsMapLayer.VectorLayer):
+        clip_cache = get_clip_cache()
+    if clip_cache is not None:
+        key = clip_cache.key(
+            layer,
+            extent,
+            cell_size=cell_size,
+            extra_keywords=extra_keywords,
+            explode_flag=explode_flag,
+            hard_clip_flag=hard_clip_flag,
+            explode_attribute=explode_attribute)
+    return clip_cache, key
+
+
+class _RasterClipThread(threading.Thread):
+    """Clip a raster layer while the calling thread clips other layers.
+
+    Only the GDAL warp of the raster file runs in the worker thread. It
+    needs no QGIS object, and the GDAL bindings release the GIL while
+    warping. The layer is checked, the clip cache is used and the clipped
+    QgsRasterLayer is created in the calling thread, since QGIS layers are
+    not thread safe and belong to the thread that creates them.
+
+    The keyword arguments are the ones of clip_layer. Call result once the
+    thread is started to get the clipped layer.
+    """
+
+    def __init__(
+            self, layer, extent, cell_size=None, extra_keywords=None,
+            **kwargs):
+        threading.Thread.__init__(self, name='Clip %s' % layer.name())
+        # Do not keep QGIS from closing if the caller stops waiting
+        self.daemon = True
+        if extra_keywords is not None:
+            # Clipping adds keywords, leave the dictionary of the caller
+            extra_keywords = dict(extra_keywords)
+        self.layer = layer
+        self.extent = extent
+        self.cell_size = cell_size
+        self.extra_keywords = extra_keywords
+        self.clip_cache, self.key = _clip_cache_key(
+            layer,
+            extent,
+            cell_size=cell_size,
+            extra_keywords=extra_keywords,
+            **kwargs)
+        self.clipped_layer = None
+        if self.key is not None:
+            self.clipped_layer = self.clip_cache.get(self.key, layer)
+        self.source = None
+        if self.clipped_layer is None:
+            self.source = _raster_clip_source(layer, extent)
+        self.filename = None
+        self.error = None
+
+    def run(self):
+        """Warp the raster file if it is not taken from the clip cache."""
+        if self.source is None:
+            return
+        try:
+            self.filename = _warp_raster_file(
+                self.source, self.extent, self.cell_size)
+        except Exception:  # pylint: disable=W0703
+            # Raised again in the calling thread by result
+            self.error = sys.exc_info()
+
+    def result(self):
+        """Wait for the warp and get the clipped layer.
+
+        :returns: The clipped layer, see clip_layer.
+        :rtype: QgsRasterLayer
+
+        :raises: Any exception raised while clipping the layer.
+        """
+        self.join()
+        if self.clipped_layer is not None:
+            return self.clipped_layer
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        if self.filename is None:
+            # The GDAL bindings can not warp, clip with gdalwarp instead
+            clipped_layer = _clip_raster_layer(
+                self.layer,
+                self.extent,
+                self.cell_size,
+                extra_keywords=self.extra_keywords)
+        else:
+            clipped_layer = _raster_clip_layer(
+                self.layer, self.filename, self.extra_keywords)
+        if self.key is not None:
+            self.clip_cache.put(self.key, self.layer, clipped_layer)
+        self.clipped_layer = clipped_layer
+        return clipped_layer
+
+
+def clip_layers(jobs):
+    """Clip several layers, yielding each one as soon as it is clipped.
+
+    The first raster layer is warped by GDAL in a worker thread while the
+    other layers are clipped one after the other in the calling thread.
+    It is given last, after the other layers. All the clipped layers are
+    created in the calling thread, since QGIS layers and
+    QgsVectorFileWriter are not thread safe and layers belong to the thread
+    that creates them.
+
+    :param jobs: Keyword arguments for clip_layer keyed by a name for the
+        job e.g. {'hazard': {'layer': hazard_layer, 'extent': extent}}.
+        Use an OrderedDict to choose the order of the clips.
+    :type jobs: dict
+
+    :returns: Generator of (name, clipped layer, seconds spent clipping) so
+        that the caller can report progress after each clip.
+    :rtype: generator
+
+    :raises: Any exception raised by clip_layer for one of the jobs.
+    """
+    raster_name = None
+    raster_thread = None
+    start = time.time()
+    for name, parameters in jobs.items():
+        if parameters['layer'].type() == QgsMapLayer.RasterLayer:
+            raster_name = name
+            raster_thread = _RasterClipThread(**parameters)
+            raster_thread.start()
+            break
+
+    try:
+        for name, parameters in jobs.items():
+            if name == raster_name:
+                continue
+            vector_start = time.time()
+            clipped_layer = clip_layer(**parameters)
+            yield name, clipped_layer, time.time() - vector_start
+
+        if raster_thread is not None:
+            clipped_layer = raster_thread.result()
+            yield raster_name, clipped_layer, time.time() - start
+    finally:
+        # Do not leave the warp running if a clip failed
+        if raster_thread is not None:
+            raster_thread.join()
+
 
 # noinspection PyArgumentList
 def _clip_vector_layer(
@@ -140,7 +349,8 @@ def _clip_vector_layer(
         extra_keywords=None,
         explode_flag=True,
         hard_clip_flag=False,
-        explode_attribute=None):
+        explode_attribute=None,
+        in_memory=False):
     """Clip a Hazard or Exposure layer to the extents provided.
 
     The layer must be a vector layer or an exception will be thrown.
@@ -180,9 +390,16 @@ def _clip_vector_layer(
         attribute is modified only if there are at least 2 parts.
     :type explode_attribute: str
 
-    :returns: Clipped layer (placed in the system temp dir). The output layer
-        will be reprojected to EPSG:4326 if needed.
-    :rtype: QgsVectorLayer
+    :param in_memory: A bool specifying whether the clipped features
+        should be returned as a safe Vector layer held in memory. This
+        avoids writing and reading a shapefile and keeps attribute names
+        longer than 10 characters.
+    :type in_memory: bool
+
+    :returns: Clipped layer (placed in the system temp dir unless in_memory
+        is True). The output layer will be reprojected to EPSG:4326 if
+        needed.
+    :rtype: QgsVectorLayer, Vector
 
     """
     if not layer or not extent:
@@ -195,19 +412,6 @@ def _clip_vector_layer(
             str(layer.type()))
         raise InvalidParameterError(message)
 
-    # handle, file_name = tempfile.mkstemp('.sqlite', 'clip_',
-    #    temp_dir())
-    handle, file_name = tempfile.mkstemp(
-        '.shp', 'clip_', temp_dir())
-
-    # Ensure the file is deleted before we try to write to it
-    # fixes windows specific issue where you get a message like this
-    # ERROR 1: c:\temp\inasafe\clip_jpxjnt.shp is not a directory.
-    # This is because mkstemp creates the file handle and leaves
-    # the file open.
-    os.close(handle)
-    os.remove(file_name)
-
     # Get the clip extents in the layer's native CRS
     geo_crs = QgsCoordinateReferenceSystem()
     geo_crs.createFromSrid(4326)
@@ -251,20 +455,39 @@ def _clip_vector_layer(
 
     field_list = provider.fields()
 
-    writer = QgsVectorFileWriter(
-        file_name,
-        None,
-        field_list,
-        layer.wkbType(),
-        geo_crs,
-        # 'SQLite')  # FIXME (Ole): This works but is far too slow
-        'ESRI Shapefile')
-    if writer.hasError() != QgsVectorFileWriter.NoError:
-        message = tr(
-            'Error when creating shapefile: <br>Filename:'
-            '%s<br>Error: %s' %
-            (file_name, writer.hasError()))
-        raise Exception(message)
+    if in_memory:
+        # Keep geometries as WKB and attributes by field for the Vector
+        writer = None
+        wkb_geometries = []
+        field_values = [[] for _ in range(field_list.count())]
+    else:
+        # handle, file_name = tempfile.mkstemp('.sqlite', 'clip_',
+        #    temp_dir())
+        handle, file_name = tempfile.mkstemp(
+            '.shp', 'clip_', temp_dir())
+
+        # Ensure the file is deleted before we try to write to it
+        # fixes windows specific issue where you get a message like this
+        # ERROR 1: c:\temp\inasafe\clip_jpxjnt.shp is not a directory.
+        # This is because mkstemp creates the file handle and leaves
+        # the file open.
+        os.close(handle)
+        os.remove(file_name)
+
+        writer = QgsVectorFileWriter(
+            file_name,
+            None,
+            field_list,
+            layer.wkbType(),
+            geo_crs,
+            # 'SQLite')  # FIXME (Ole): This works but is far too slow
+            'ESRI Shapefile')
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            message = tr(
+                'Error when creating shapefile: <br>Filename:'
+                '%s<br>Error: %s' %
+                (file_name, writer.hasError()))
+            raise Exception(message)
 
     # Reverse the coordinate xform now so that we can convert
     # geometries from layer crs to geocrs.
@@ -298,7 +521,14 @@ def _clip_vector_layer(
             if part_index > 0 and explode_attribute is not None:
                 has_multipart = True
 
-            writer.addFeature(feature)
+            if writer is None:
+                wkb_geometries.append(part.asWkb())
+                for j, value in enumerate(feature.attributes()):
+                    if isinstance(value, QPyNullVariant):
+                        value = None
+                    field_values[j].append(value)
+            else:
+                writer.addFeature(feature)
         count += 1
     del writer  # Flush to disk
 
@@ -317,9 +547,27 @@ def _clip_vector_layer(
     if extra_keywords is None:
         extra_keywords = {}
     extra_keywords[multipart_polygon_key] = has_multipart
+    base_name = '%s clipped' % layer.name()
+    if in_memory:
+        keywords = dict(keyword_io.read_keywords(layer))
+        keywords.update(extra_keywords)
+        field_names = []
+        field_types = []
+        for j in range(field_list.count()):
+            field = field_list[j]
+            field_names.append(field.name())
+            field_types.append(OGR_FIELD_TYPES.get(field.type()))
+        return vector_from_wkb(
+            wkb_geometries,
+            field_names,
+            field_values,
+            field_types=field_types,
+            projection=DEFAULT_PROJECTION,
+            name=base_name,
+            keywords=keywords)
+
     keyword_io.copy_keywords(
         layer, file_name, extra_keywords=extra_keywords)
-    base_name = '%s clipped' % layer.name()
     layer = QgsVectorLayer(file_name, base_name, 'ogr')
 
     return layer
@@ -431,58 +679,24 @@ def _clip_raster_layer(
             theCellSize=None), the native raster cell size will be used.
     :type cell_size: float
 
-    :returns: Output clipped layer (placed in the system temp dir).
+    :returns: Output clipped layer (placed in the system temp dir). If the
+        GDAL bindings provide gdal.Warp, this is a virtual raster (VRT)
+        written to the temp dir, which refers to the source layer and is
+        warped from it each time it is read. The extent is applied as
+        output bounds rather than as a cutline, see warp_raster.
+        Otherwise it is a GeoTIFF written by the gdalwarp program.
     :rtype: QgsRasterLayer
 
     :raises: InvalidProjectionError - if input layer is a density
         layer in projected coordinates. See issue #123.
 
     """
-    if not layer or not extent:
-        message = tr('Layer or Extent passed to clip is None.')
-        raise InvalidParameterError(message)
+    working_layer = _raster_clip_source(layer, extent)
 
-    if layer.type() != QgsMapLayer.RasterLayer:
-        message = tr(
-            'Expected a raster layer but received a %s.' %
-            str(layer.type()))
-        raise InvalidParameterError(message)
-
-    working_layer = layer.source()
-
-    # Check for existence of keywords file
-    base, _ = os.path.splitext(working_layer)
-    keywords_path = base + '.xml'
-    message = tr(
-        'Input file to be clipped "%s" does not have the '
-        'expected keywords file %s' % (
-            working_layer,
-            keywords_path
-        ))
-    verify(os.path.isfile(keywords_path), message)
-
-    # Raise exception if layer is projected and refers to density (issue #123)
-    # FIXME (Ole): Need to deal with it - e.g. by automatically reprojecting
-    # the layer at this point and setting the native resolution accordingly
-    # in its keywords.
-    try:
-        keywords = read_iso19115_metadata(working_layer)
-    except (MetadataReadError, NoKeywordsFoundError):
-        keywords = read_keywords(base + '.keywords')
-        keywords = write_read_iso_19115_metadata(working_layer, keywords)
-    if 'datatype' in keywords and keywords['datatype'] == 'count':
-        if str(layer.crs().authid()) != 'EPSG:4326':
-
-            # This layer is not WGS84 geographic
-            message = (
-                'Layer %s represents count but has spatial reference "%s". '
-                'Count layers must be given in WGS84 geographic coordinates, '
-                'so please reproject and try again. For more information, see '
-                'issue https://github.com/AIFDR/inasafe/issues/123' % (
-                    working_layer,
-                    layer.crs().toProj4()
-                ))
-            raise InvalidProjectionError(message)
+    # Clip in process if the GDAL bindings can
+    filename = _warp_raster_file(working_layer, extent, cell_size)
+    if filename is not None:
+        return _raster_clip_layer(layer, filename, extra_keywords)
 
     # We need to provide gdalwarp with a dataset for the clip
     # because unlike gdal_translate, it does not take projwin.
@@ -550,6 +764,128 @@ def _clip_raster_layer(
     return layer
 
 
+def _raster_clip_source(layer, extent):
+    """Check that a raster layer can be clipped and get its file.
+
+    :param layer: A valid QGIS raster layer.
+    :type layer: QgsRasterLayer
+
+    :param extent: The extent to clip to, see _clip_raster_layer.
+    :type extent: list(float)
+
+    :returns: The file of the layer.
+    :rtype: str
+
+    :raises: InvalidParameterError - if the layer or extent is missing or
+        the layer is not a raster. InvalidProjectionError - if the layer
+        is a density layer in projected coordinates. See issue #123.
+    """
+    if not layer or not extent:
+        message = tr('Layer or Extent passed to clip is None.')
+        raise InvalidParameterError(message)
+
+    if layer.type() != QgsMapLayer.RasterLayer:
+        message = tr(
+            'Expected a raster layer but received a %s.' %
+            str(layer.type()))
+        raise InvalidParameterError(message)
+
+    working_layer = layer.source()
+
+    # Check for existence of keywords file
+    base, _ = os.path.splitext(working_layer)
+    keywords_path = base + '.xml'
+    message = tr(
+        'Input file to be clipped "%s" does not have the '
+        'expected keywords file %s' % (
+            working_layer,
+            keywords_path
+        ))
+    verify(os.path.isfile(keywords_path), message)
+
+    # Raise exception if layer is projected and refers to density (issue #123)
+    # FIXME (Ole): Need to deal with it - e.g. by automatically reprojecting
+    # the layer at this point and setting the native resolution accordingly
+    # in its keywords.
+    try:
+        keywords = read_iso19115_metadata(working_layer)
+    except (MetadataReadError, NoKeywordsFoundError):
+        keywords = read_keywords(base + '.keywords')
+        keywords = write_read_iso_19115_metadata(working_layer, keywords)
+    if 'datatype' in keywords and keywords['datatype'] == 'count':
+        if str(layer.crs().authid()) != 'EPSG:4326':
+
+            # This layer is not WGS84 geographic
+            message = (
+                'Layer %s represents count but has spatial reference "%s". '
+                'Count layers must be given in WGS84 geographic coordinates, '
+                'so please reproject and try again. For more information, see '
+                'issue https://github.com/AIFDR/inasafe/issues/123' % (
+                    working_layer,
+                    layer.crs().toProj4()
+                ))
+            raise InvalidProjectionError(message)
+
+    return working_layer
+
+
+def _warp_raster_file(raster_file_name, extent, cell_size=None):
+    """Clip a raster file in process to a virtual raster in the temp dir.
+
+    Only GDAL is used, so this can run in a worker thread.
+
+    :param raster_file_name: The raster file to clip.
+    :type raster_file_name: str
+
+    :param extent: The extent to clip to, see _clip_raster_layer.
+    :type extent: list(float)
+
+    :param cell_size: Cell size which the raster should be resampled to.
+    :type cell_size: float
+
+    :returns: The file name of the virtual raster or None if the GDAL
+        bindings can not warp, see warp_raster.
+    :rtype: str
+    """
+    # The output is a virtual raster file in the temp dir, so pixels keep
+    # their data type and are warped on reading.
+    handle, filename = tempfile.mkstemp('.vrt', 'clip_', temp_dir())
+    os.close(handle)
+    os.remove(filename)
+    dataset = warp_raster(
+        raster_file_name, extent, cell_size, filename, output_format='VRT')
+    if dataset is None:
+        return None
+    # Closing the dataset writes the virtual raster
+    dataset = None
+    return filename
+
+
+def _raster_clip_layer(layer, filename, extra_keywords=None):
+    """Create the clipped layer of a raster clipped by _warp_raster_file.
+
+    :param layer: The layer which was clipped.
+    :type layer: QgsRasterLayer
+
+    :param filename: The clipped raster file.
+    :type filename: str
+
+    :param extra_keywords: Optional keywords dictionary to be added to
+        the clipped layer.
+    :type extra_keywords: dict
+
+    :returns: The clipped layer.
+    :rtype: QgsRasterLayer
+    """
+    if not os.path.isfile(filename):
+        raise CallGDALError(
+            tr('Could not clip %s with GDAL.') % layer.source())
+    keyword_io = KeywordIO()
+    keyword_io.copy_keywords(layer, filename, extra_keywords=extra_keywords)
+    base_name = '%s clipped' % layer.name()
+    return QgsRasterLayer(filename, base_name)
+
+
 def extent_to_kml(extent):
     """A helper to get a little kml doc for an extent.
 
@@ -2,6 +2,8 @@
 """Helpers for GIS related functionality."""
 import uuid
 
+import numpy
+
 from qgis.core import (
     QgsMapLayer,
     QgsField,
@@ -21,6 +23,7 @@ from safe.common.exceptions import \
 from safe.storage.core import read_layer as safe_read_layer
 from safe.storage.layer import Layer
 from safe.storage.utilities import bbox_intersection
+from safe.gis.polygon import clip_lines_by_grid
 from safe.utilities.i18n import tr
 from safe.utilities.utilities import LOGGER
 
@@ -441,19 +444,25 @@ def read_impact_layer(impact_layer):
         raise Exception(message)
 
 
-def convert_to_safe_layer(layer):
+def convert_to_safe_layer(layer, dtype=numpy.float64, memmap=False):
     """Thin wrapper around the safe read_layer function.
 
     :param layer: QgsMapLayer or Safe layer.
     :type layer: QgsMapLayer, read_layer
 
+    :param dtype: Floating point type of raster data, see class Raster.
+    :type dtype: type
+
+    :param memmap: Store raster data in temporary files instead of memory.
+    :type memmap: bool
+
     :returns: A safe read_safe_layer object is returned.
     :rtype: read_layer
     """
     if isinstance(layer, Layer):
         return layer
     try:
-        return safe_read_layer(layer.source())
+        return safe_read_layer(layer.source(), dtype=dtype, memmap=memmap)
     except:
         raise
 
@@ -615,3 +624,95 @@ def union_geometries(geometries):
         for g in geometries[1:]:
             result_geometry = result_geometry.combine(g)
         return result_geometry
+
+
+def intersect_lines_with_grid(
+        line_layer,
+        request,
+        labels,
+        geotransform,
+        grid_crs,
+        output_layer,
+        target_field,
+        split_cells=False):
+    """Split lines by the cells of a classified raster grid.
+
+    Lines are walked through the grid cells they cross with
+    :func:`safe.gis.polygon.clip_lines_by_grid`, so no polygon needs to be
+    created for the raster cells.
+
+    :param line_layer: Vector layer with containing linear features
+        such as roads.
+    :type line_layer: QgsVectorLayer
+
+    :param request: Request for fetching features from lines layer.
+    :type request: QgsFeatureRequest
+
+    :param labels: Class of each raster cell. Negative values mark cells
+        that are not classified.
+    :type labels: numpy.ndarray
+
+    :param geotransform: GDAL geotransform of the raster grid.
+    :type geotransform: tuple
+
+    :param grid_crs: The CRS of the raster grid.
+    :type grid_crs: QgsCoordinateReferenceSystem
+
+    :param output_layer: Layer to which features will be written.
+    :type output_layer: QgsVectorLayer
+
+    :param target_field: Name of the field in output_layer which will receive
+        the class of each part of the lines. Parts in cells that are not
+        classified or outside the grid get class 0.
+    :type target_field: basestring
+
+    :param split_cells: If True, lines are split at the boundary of every
+        classified cell, otherwise only where the class changes.
+    :type split_cells: bool
+
+    :return: None
+    """
+
+    fields = output_layer.dataProvider().fields()
+    to_grid = QgsCoordinateTransform(line_layer.crs(), grid_crs)
+    from_grid = QgsCoordinateTransform(grid_crs, line_layer.crs())
+
+    # Collect the parts of all lines in the CRS of the grid
+    lines = []
+    parents = []
+    line_attributes = []
+    for f in line_layer.getFeatures(request):
+        geometry = QgsGeometry(f.geometry())
+        geometry.transform(to_grid)
+        if geometry.isMultipart():
+            parts = geometry.asMultiPolyline()
+        else:
+            parts = [geometry.asPolyline()]
+        for part in parts:
+            lines.append([[point.x(), point.y()] for point in part])
+            parents.append(len(line_attributes))
+        line_attributes.append(f.attributes())
+
+    lines_covered = clip_lines_by_grid(
+        lines, labels, geotransform, split_cells=split_cells)
+
+    features = []
+    for label in lines_covered:
+        affected_class = max(label, 0)
+        for k in lines_covered[label]:
+            for line in lines_covered[label][k]:
+                # noinspection PyCallByClass
+                geometry = QgsGeometry.fromPolyline(
+                    [QgsPoint(x, y) for x, y in line])
+                geometry.transform(from_grid)
+                add_output_feature(
+                    features, geometry, affected_class,
+                    fields, line_attributes[parents[k]], target_field)
+
+            # every once in a while commit the created features to the
+            # output layer
+            if len(features) >= 1000:
+                output_layer.dataProvider().addFeatures(features)
+                features = []
+
+    output_layer.dataProvider().addFeatures(features)
@@ -57,6 +57,9 @@ from safe.utilities.metadata import (
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Size of the blocks read when hashing the content of files
+HASH_BLOCK_SIZE = 2 ** 20
+
 
 def definition(keyword):
     """Given a keyword, try to get a definition dict for it.
@@ -502,18 +505,29 @@ class KeywordIO(QObject):
             file_based_keywords = provider_dict[provider_type]
         return file_based_keywords
 
-    def hash_for_datasource(self, data_source):
+    def hash_for_datasource(self, data_source, files=None):
         """Given a data_source, return its hash.
 
         :param data_source: The data_source name from a layer.
         :type data_source: str
 
-        :returns: An md5 hash for the data source name.
+        :param files: Optional paths of files whose names and content are
+            hashed too, e.g. the files making up a shapefile.
+        :type files: list
+
+        :returns: An md5 hash for the data source name and the files.
         :rtype: str
         """
         import hashlib
         hash_value = hashlib.md5()
         hash_value.update(data_source)
+        for file_name in files or []:
+            hash_value.update(os.path.basename(file_name))
+            with open(file_name, 'rb') as data_file:
+                block = data_file.read(HASH_BLOCK_SIZE)
+                while block:
+                    hash_value.update(block)
+                    block = data_file.read(HASH_BLOCK_SIZE)
         hash_value = hash_value.hexdigest()
         return hash_value
 
@@ -0,0 +1,128 @@
+# coding=utf-8
+"""Unit tests for the clip cache module."""
+
+import os
+import shutil
+import unittest
+
+from qgis.core import QgsVectorLayer, QgsRasterLayer
+
+from safe.common.utilities import temp_dir, unique_filename
+from safe.utilities.clip_cache import ClipCache, dataset_files
+from safe.utilities.clipper import clip_layer
+from safe.test.utilities import test_data_path, get_qgis_app
+
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+
+class TestClipCache(unittest.TestCase):
+    """Tests for the clip cache."""
+
+    def setUp(self):
+        """Copy a layer so that it can be modified."""
+        source = test_data_path('exposure', 'buildings_osm_4326.shp')
+        self.directory = unique_filename(dir=temp_dir('test'))
+        os.makedirs(self.directory)
+        for file_name in dataset_files(source):
+            shutil.copy(file_name, self.directory)
+        self.source = os.path.join(
+            self.directory, os.path.basename(source))
+        self.layer = QgsVectorLayer(self.source, 'buildings', 'ogr')
+        extent = self.layer.extent()
+        self.extent = [
+            extent.xMinimum(), extent.yMinimum(),
+            extent.center().x(), extent.center().y()]
+        self.cache = ClipCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        """Remove the copied layer and the cache."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_get_and_put(self):
+        """Clipped layers can be stored in and read from the cache."""
+        key = self.cache.key(self.layer, self.extent)
+        self.assertIsNone(self.cache.get(key, self.layer))
+        clipped_layer = clip_layer(self.layer, self.extent)
+        self.cache.put(key, self.layer, clipped_layer)
+
+        # A copy of the cached layer is returned
+        cached_layer = self.cache.get(key, self.layer)
+        self.assertNotEqual(cached_layer.source(), clipped_layer.source())
+        self.assertEqual(
+            cached_layer.featureCount(), clipped_layer.featureCount())
+        self.assertEqual(cached_layer.name(), 'buildings clipped')
+
+        # The cache is kept on disk
+        cache = ClipCache(self.cache.path)
+        self.assertEqual(cache.key(self.layer, self.extent), key)
+        self.assertIsNotNone(cache.get(key, self.layer))
+
+        # Other clip parameters have other keys
+        self.assertNotEqual(
+            self.cache.key(self.layer, self.extent, hard_clip_flag=True),
+            key)
+
+    def test_raster(self):
+        """Clipped rasters are stored as GeoTIFF rather than as VRT."""
+        layer = QgsRasterLayer(
+            test_data_path('hazard', 'jakarta_flood_design.tif'), 'flood')
+        extent = layer.extent()
+        extent = [
+            extent.xMinimum(), extent.yMinimum(),
+            extent.center().x(), extent.center().y()]
+        key = self.cache.key(layer, extent)
+        clipped_layer = clip_layer(layer, extent)
+        self.cache.put(key, layer, clipped_layer)
+
+        files = os.listdir(os.path.join(self.cache.path, key))
+        self.assertFalse([item for item in files if item.endswith('.vrt')])
+        cached_layer = self.cache.get(key, layer)
+        self.assertTrue(cached_layer.isValid())
+        self.assertTrue(cached_layer.source().endswith('.tif'))
+        self.assertEqual(cached_layer.width(), clipped_layer.width())
+        self.assertEqual(cached_layer.height(), clipped_layer.height())
+
+    def test_extra_keywords(self):
+        """The keywords of the caller are not modified by clipping."""
+        extra_keywords = {'title': 'buildings'}
+        clip_layer(self.layer, self.extent, extra_keywords=extra_keywords)
+        self.assertEqual(extra_keywords, {'title': 'buildings'})
+
+    def test_invalidate(self):
+        """Cached clips are removed when their source changes."""
+        key = self.cache.key(self.layer, self.extent)
+        self.cache.put(key, self.layer, clip_layer(self.layer, self.extent))
+        self.assertGreater(self.cache.size(), 0)
+
+        with open(self.source, 'ab') as shapefile:
+            shapefile.write('\0')
+        self.assertNotEqual(self.cache.key(self.layer, self.extent), key)
+        self.assertIsNone(self.cache.get(key, self.layer))
+        self.assertEqual(self.cache.size(), 0)
+
+        key = self.cache.key(self.layer, self.extent)
+        self.cache.put(key, self.layer, clip_layer(self.layer, self.extent))
+        self.cache.invalidate(self.source)
+        self.assertIsNone(self.cache.get(key, self.layer))
+
+    def test_least_recently_used(self):
+        """The least recently used clips are removed from a full cache."""
+        clipped_layer = clip_layer(self.layer, self.extent)
+        size = sum(
+            os.path.getsize(item)
+            for item in dataset_files(clipped_layer.source()))
+        cache = ClipCache(
+            os.path.join(self.directory, 'small_cache'), max_size=2 * size)
+        for key in ('first', 'second'):
+            cache.put(key, self.layer, clipped_layer)
+        cache.get('first', self.layer)
+        cache.put('third', self.layer, clipped_layer)
+
+        self.assertIsNotNone(cache.get('first', self.layer))
+        self.assertIsNone(cache.get('second', self.layer))
+        self.assertIsNotNone(cache.get('third', self.layer))
+        self.assertEqual(cache.size(), 2 * size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,8 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 import unittest
 import os
 import shutil
+import threading
+from collections import OrderedDict
 from unittest import expectedFailure
 import numpy
 
@@ -30,6 +32,7 @@ from qgis.core import (
     QgsRasterLayer,
     QgsGeometry,
     QgsPoint)
+from PyQt4.QtCore import QThread
 
 from safe.gis.numerics import nan_allclose
 from safe.common.utilities import unique_filename
@@ -37,10 +40,12 @@ from safe.storage.core import read_layer as read_safe_layer
 from safe.common.exceptions import (
     InvalidProjectionError,
     CallGDALError,
-    GetDataError)
+    GetDataError,
+    NoFeaturesInExtentError)
 from safe.utilities.gis import get_optimal_extent
 from safe.utilities.clipper import (
     clip_layer,
+    clip_layers,
     extent_to_kml,
     explode_multipart_geometry,
     clip_geometry,
@@ -102,6 +107,36 @@ class ClipperTest(unittest.TestCase):
         # Check the output is valid
         assert(os.path.exists(result.source()))
 
+    def test_clip_vector_in_memory(self):
+        """Vector layers can be clipped to a layer in memory."""
+        vector_layer = QgsVectorLayer(VECTOR_PATH3, 'buildings', 'ogr')
+        assert vector_layer.isValid()
+        # Clip to the middle of the layer extent
+        extent = vector_layer.extent()
+        dx = extent.width() / 4
+        dy = extent.height() / 4
+        bounding_box = [
+            extent.xMinimum() + dx, extent.yMinimum() + dy,
+            extent.xMaximum() - dx, extent.yMaximum() - dy]
+
+        result = clip_layer(
+            vector_layer, bounding_box, extra_keywords={'title': 'piggy'},
+            in_memory=True)
+        expected = read_safe_layer(clip_layer(
+            vector_layer, bounding_box).source())
+
+        # Same features as the clipped layer written to file
+        self.assertTrue(result.is_polygon_data)
+        self.assertEqual(len(result), len(expected))
+        self.assertEqual(result.get_keywords('title'), 'piggy')
+        self.assertIsNone(result.filename)
+        for name in expected.get_attribute_names():
+            self.assertEqual(
+                list(result.get_data(name)), list(expected.get_data(name)))
+        for polygon, expected_polygon in zip(
+                result.get_geometry(), expected.get_geometry()):
+            numpy.testing.assert_allclose(polygon, expected_polygon)
+
     def test_clip_raster(self):
         """Raster layers can be clipped."""
 
@@ -133,6 +168,61 @@ class ClipperTest(unittest.TestCase):
             'Actual: %5f' % (size, new_raster_layer.rasterUnitsPerPixelX()))
         assert new_raster_layer.rasterUnitsPerPixelX() == size, message
 
+    def test_clip_layers(self):
+        """Several layers can be clipped in one call."""
+        raster_layer = QgsRasterLayer(RASTERPATH, 'shake')
+        vector_layer = QgsVectorLayer(VECTOR_PATH, 'padang', 'ogr')
+        assert raster_layer.isValid()
+        assert vector_layer.isValid()
+        bounding_box = [100.03, -1.14, 100.81, -0.73]
+        small_box = [100.3, -1.0, 100.5, -0.8]
+
+        # Two clips of the same vector layer and one of a raster layer
+        jobs = OrderedDict([
+            ('hazard', {'layer': raster_layer, 'extent': bounding_box}),
+            ('exposure', {'layer': vector_layer, 'extent': bounding_box}),
+            ('small', {'layer': vector_layer, 'extent': small_box})])
+        results = list(clip_layers(jobs))
+
+        # The raster is clipped in a worker thread and given last, the
+        # other layers are given in the order of the jobs
+        self.assertEqual(
+            [name for name, _, _ in results], ['exposure', 'small', 'hazard'])
+        for name, layer, seconds in results:
+            self.assertTrue(os.path.exists(layer.source()))
+            self.assertGreaterEqual(seconds, 0)
+            # Layers belong to the calling thread
+            self.assertEqual(layer.thread(), QThread.currentThread())
+
+        # Each clip gives the same result as clipping on its own
+        results = dict((name, layer) for name, layer, _ in results)
+        for name, extent in [
+                ('exposure', bounding_box), ('small', small_box)]:
+            expected = clip_layer(vector_layer, extent)
+            self.assertEqual(
+                results[name].featureCount(), expected.featureCount())
+        expected = clip_layer(raster_layer, bounding_box)
+        self.assertEqual(results['hazard'].width(), expected.width())
+        self.assertEqual(results['hazard'].height(), expected.height())
+        self.assertEqual(
+            results['hazard'].extent().toString(),
+            expected.extent().toString())
+
+        # Errors raised by a clip are raised again to the caller
+        jobs = {'exposure': {'layer': vector_layer, 'extent': [0, 0, 1, 1]}}
+        with self.assertRaises(NoFeaturesInExtentError):
+            list(clip_layers(jobs))
+
+        # Also while the raster is clipped in a worker thread
+        jobs = OrderedDict([
+            ('hazard', {'layer': raster_layer, 'extent': bounding_box}),
+            ('exposure', {'layer': vector_layer, 'extent': [0, 0, 1, 1]})])
+        with self.assertRaises(NoFeaturesInExtentError):
+            list(clip_layers(jobs))
+        # The worker thread is not left running
+        self.assertNotIn(
+            'Clip shake', [thread.name for thread in threading.enumerate()])
+
     def test_clip_raster_with_no_extension(self):
         """Test we can clip a raster with no extension - see #659."""
         # Create a raster layer
@@ -91,6 +91,25 @@ class KeywordIOTest(unittest.TestCase):
         message = "Got: %s\nExpected: %s" % (hash_value, expected_hash)
         self.assertEqual(hash_value, expected_hash, message)
 
+    def test_get_hash_for_datasource_files(self):
+        """Test that the hash for a data source follows its content."""
+        file_name = unique_filename(suffix='.csv', dir=temp_dir('test'))
+        with open(file_name, 'w') as data_file:
+            data_file.write('depth\n1.0\n')
+        hash_value = self.keyword_io.hash_for_datasource(
+            file_name, files=[file_name])
+        self.assertNotEqual(
+            hash_value, self.keyword_io.hash_for_datasource(file_name))
+        self.assertEqual(
+            hash_value,
+            self.keyword_io.hash_for_datasource(file_name, files=[file_name]))
+
+        with open(file_name, 'a') as data_file:
+            data_file.write('2.0\n')
+        self.assertNotEqual(
+            hash_value,
+            self.keyword_io.hash_for_datasource(file_name, files=[file_name]))
+
     def test_are_keywords_file_based(self):
         """Can we correctly determine if keywords should be written to file or
         to database?"""